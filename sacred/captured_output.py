@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import collections
+import tempfile
+import threading
+
+__all__ = ("CapturedOutput",)
+
+
+class CapturedOutput:
+    """Chunked store for the captured output of a run.
+
+    New output is appended in chunks instead of concatenating one ever growing
+    string. If a captured_out_filter is given, it is only applied to the new
+    output together with the last, unfinished line (everything after the
+    last linefeed), which is the only part a filter like
+    :py:func:`sacred.utils.apply_backspaces_and_linefeeds` may still change.
+    A filter can also provide a ``create_stream()`` function that returns an
+    object with a ``feed(text)`` method, which takes only the new output and
+    returns a tuple of the finished text and the current unfinished line
+    (see :py:class:`sacred.utils.BackspaceLinefeedStream`). Then the
+    unfinished line is not passed to the filter again.
+
+    If max_size is set, at most that many characters are kept in memory:
+    the first half of them from the start of the output and the rest from
+    its end. Everything in between is moved to a temporary file, from where
+    :py:meth:`read` loads it when the complete output is needed.
+    """
+
+    OMISSION_MARKER = "\n[... {} characters omitted ...]\n"
+
+    def __init__(self, max_size=None, output_filter=None):
+        if max_size is not None and max_size < 2:
+            raise ValueError("max_size must be at least 2, but was {}".format(max_size))
+        self.max_size = max_size
+        self.output_filter = output_filter
+        create_stream = getattr(output_filter, "create_stream", None)
+        self._stream = create_stream() if create_stream is not None else None
+        self._lock = threading.RLock()
+        self._head = []
+        self._head_size = 0
+        self._tail = collections.deque()
+        self._tail_size = 0
+        self._spill_file = None
+        self._spilled = 0
+        self._pending = ""
+        self._value = ""
+
+    def write(self, text):
+        """Append new output, applying the output_filter if there is one."""
+        if not text:
+            return
+        with self._lock:
+            if self._stream is not None:
+                text, self._pending = self._stream.feed(text)
+            elif self.output_filter is not None:
+                text = self.output_filter(self._pending + text)
+                end = text.rfind("\n") + 1
+                self._pending = text[end:]
+                text = text[:end]
+                if self.max_size is not None and len(self._pending) > self.max_size:
+                    # a huge line without a linefeed; stop waiting for its end
+                    text += self._pending
+                    self._pending = ""
+            if text:
+                self._commit(text)
+            self._value = None
+
+    def _commit(self, text):
+        if self.max_size is None:
+            self._tail.append(text)
+            self._tail_size += len(text)
+            return
+        head_room = self.max_size // 2 - self._head_size
+        if head_room > 0:
+            self._head.append(text[:head_room])
+            self._head_size += len(self._head[-1])
+            text = text[head_room:]
+        if not text:
+            return
+        self._tail.append(text)
+        self._tail_size += len(text)
+        excess = self._tail_size - (self.max_size - self.max_size // 2)
+        while excess > 0:
+            chunk = self._tail.popleft()
+            if len(chunk) > excess:
+                self._tail.appendleft(chunk[excess:])
+                chunk = chunk[:excess]
+            self._spill(chunk)
+            self._tail_size -= len(chunk)
+            excess -= len(chunk)
+
+    def _spill(self, text):
+        if self._spill_file is None:
+            self._spill_file = tempfile.TemporaryFile(
+                mode="w+", encoding="utf-8", newline="", prefix="sacred_cout_"
+            )
+        self._spill_file.seek(0, 2)
+        self._spill_file.write(text)
+        self._spilled += len(text)
+
+    @property
+    def truncated(self):
+        """Whether parts of the output were moved out of memory."""
+        return self._spilled > 0
+
+    def __len__(self):
+        with self._lock:
+            return (
+                self._head_size + self._spilled + self._tail_size + len(self._pending)
+            )
+
+    def getvalue(self):
+        """Return the output that is kept in memory.
+
+        This is the complete output, unless it was truncated. Then the omitted
+        middle part is replaced by a short note.
+        """
+        with self._lock:
+            if self._value is None:
+                tail = "".join(self._tail)
+                self._tail.clear()
+                if tail:
+                    self._tail.append(tail)
+                parts = self._head[:]
+                if self._spilled:
+                    parts.append(self.OMISSION_MARKER.format(self._spilled))
+                parts += [tail, self._pending]
+                self._value = "".join(parts)
+            return self._value
+
+    def read(self, start=0):
+        """Return the complete output from the given position on.
+
+        Reads the parts that were moved to the temporary file if needed.
+        """
+        with self._lock:
+            tail_start = self._head_size + self._spilled
+            tail = "".join(self._tail) + self._pending
+            if start >= tail_start:
+                return tail[start - tail_start :]
+            spilled = ""
+            if self._spill_file is not None:
+                self._spill_file.flush()
+                self._spill_file.seek(0)
+                spilled = self._spill_file.read()
+            return ("".join(self._head) + spilled + tail)[start:]
+
+    def changes_since(self, mark):
+        """Determine how the value of :py:meth:`getvalue` changed since mark.
+
+        ``mark`` is ``(0, "")`` for the very beginning, or a value returned
+        earlier by this method. Returns a tuple ``(offset, text, new_mark)``:
+        the output up to ``offset`` is unchanged and ``text`` replaces all
+        after it. Only the new part of the output is read.
+
+        Once the output is truncated, everything after the kept start changes
+        with new output (the omission marker and the kept end), so ``text``
+        is that part, which is at most about max_size characters long. The
+        temporary file is never read.
+        """
+        with self._lock:
+            stable, pending = mark
+            if not self._spilled:
+                new = self.read(stable)
+                offset = stable + common_prefix_length(pending, new)
+                committed = len(self) - len(self._pending)
+                return offset, new[offset - stable :], (committed, self._pending)
+            value = self.getvalue()
+            if stable > self._head_size:
+                # the text after the kept start moved since the mark
+                stable, pending = self._head_size, ""
+            new = value[stable:]
+            offset = stable + common_prefix_length(pending, new)
+            return (
+                offset,
+                new[offset - stable :],
+                (self._head_size, value[self._head_size :]),
+            )
+
+    def close(self):
+        """Delete the temporary file. The truncated output is lost."""
+        with self._lock:
+            if self._spill_file is not None:
+                self._spill_file.close()
+                self._spill_file = None
+
+    def __str__(self):
+        return self.getvalue()
+
+
+def common_prefix_length(old, new):
+    """Return the length of the longest common prefix of two strings."""
+    if new.startswith(old):
+        return len(old)
+    # binary search on slices keeps the comparisons in C
+    low, high = 0, min(len(old), len(new))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if old[:middle] == new[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
@@ -239,6 +239,25 @@ def queue_option(args, run):
     run.queue_only = True
 
 
+@cli_option("-Q", "--queued", is_flag=True)
+def queued_option(args, run):
+    """Process the events of all observers in the background.
+
+    Only the started event is passed on synchronously, all other events are
+    processed by a background thread and retried if they fail.
+    """
+    run.queue_observers = True
+
+
+@cli_option("-O", "--observer_process", is_flag=True)
+def observer_process_option(args, run):
+    """Run all observers in a helper process.
+
+    Keeps their serialization and I/O out of the experiment process.
+    """
+    run.observer_process = True
+
+
 @cli_option("-f", "--force", is_flag=True)
 def force_option(args, run):
     """Disable warnings about suspicious changes for this run."""
@@ -300,6 +319,6 @@ def capture_option(args, run):
     """
     Control the way stdout and stderr are captured.
 
-    The argument value must be one of [no, sys, fd]
+    The argument value must be one of [no, sys, fd, pipe]
     """
     run.capture_mode = args
@@ -2,6 +2,8 @@
 # coding=utf-8
 import copy
 
+import wrapt
+
 import sacred.optional as opt
 from sacred.utils import join_paths, SacredError
 
@@ -234,7 +236,8 @@ def make_read_only(o):
         return o
 
 
-if opt.has_yaml:
+@wrapt.when_imported("yaml")
+def _register_yaml_representers(yaml):
     # Register read-only containers for yaml
     def read_only_dict_representer(dumper, data):
         """Saves `ReadOnlyDict` as `dict`."""
@@ -244,10 +247,10 @@ if opt.has_yaml:
         """Saves `ReadOnlyList` as `list`."""
         return dumper.represent_list(data)
 
-    opt.yaml.add_representer(ReadOnlyDict, read_only_dict_representer)
-    opt.yaml.add_representer(ReadOnlyList, read_only_list_representer)
-    opt.yaml.SafeDumper.add_representer(ReadOnlyDict, read_only_dict_representer)
-    opt.yaml.SafeDumper.add_representer(ReadOnlyList, read_only_list_representer)
+    yaml.add_representer(ReadOnlyDict, read_only_dict_representer)
+    yaml.add_representer(ReadOnlyList, read_only_list_representer)
+    yaml.SafeDumper.add_representer(ReadOnlyDict, read_only_dict_representer)
+    yaml.SafeDumper.add_representer(ReadOnlyList, read_only_list_representer)
 
 
 SIMPLIFY_TYPE = {
@@ -263,11 +266,11 @@ SIMPLIFY_TYPE = {
     DogmaticList: list,
 }
 
+
 # if numpy is available we also want to ignore typechanges from numpy
 # datatypes to the corresponding python datatype
-if opt.has_numpy:
-    from sacred.optional import np
-
+@wrapt.when_imported("numpy")
+def _add_numpy_types(np):
     NP_FLOATS = ["float", "float16", "float32", "float64", "float128"]
     for npf in NP_FLOATS:
         if hasattr(np, npf):
@@ -1,10 +1,11 @@
 #!/usr/bin/env python
 # coding=utf-8
 
+import sys
+
 import jsonpickle.tags
 
 from sacred import SETTINGS
-import sacred.optional as opt
 from sacred.config.custom_containers import DogmaticDict, DogmaticList
 from sacred.utils import PYTHON_IDENTIFIER
 
@@ -73,7 +74,9 @@ def assert_is_valid_key(key):
 
 
 def normalize_numpy(obj):
-    if opt.has_numpy and isinstance(obj, opt.np.generic):
+    # without an imported numpy there are no numpy values to normalize
+    numpy = sys.modules.get("numpy")
+    if numpy is not None and isinstance(obj, numpy.generic):
         try:
             return obj.item()
         except ValueError:
@@ -1,19 +1,27 @@
 #!/usr/bin/env python
 # coding=utf-8
 
+import atexit
+import contextlib
 import functools
 import hashlib
+import json
+import logging
 import os.path
 import re
 import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-import pkg_resources
-
 import sacred.optional as opt
 from sacred import SETTINGS
 from sacred.utils import iter_prefixes
 
+logger = logging.getLogger(__name__)
+
 MB = 1048576
 MODULE_BLACKLIST = set(sys.builtin_module_names)
 # sadly many builtins are missing from the above, so we list them manually:
@@ -397,6 +405,152 @@ def get_digest(filename):
         return h.hexdigest()
 
 
+class DigestCache:
+    """On-disk cache for the MD5 digests of source files.
+
+    Entries are keyed by the absolute path and validated with the size,
+    modification time (in ns) and inode of the file, so a changed file is
+    always hashed again. Files that were modified within the last
+    RACY_SECONDS are not cached, because a second modification within the
+    resolution of the file system clock would go unnoticed.
+
+    New entries are written back by :py:meth:`save`, which merges them with
+    the entries other processes might have written in the meantime and
+    drops the entries of files that were deleted or changed since. The file
+    is only written if there are new entries.
+    """
+
+    RACY_SECONDS = 2
+    VERSION = 1
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._entries = None
+        self._new_entries = {}
+        atexit.register(self.save)
+
+    def _load(self):
+        try:
+            with open(self.filename) as f:
+                content = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(content, dict) or content.get("version") != self.VERSION:
+            return {}
+        return content.get("entries", {})
+
+    def get_digest(self, filename):
+        """Return the MD5 digest of filename, computing it only if needed."""
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+        key = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._load()
+            entry = self._entries.get(path)
+        if entry is not None and entry[:3] == key:
+            return entry[3]
+        digest = get_digest(path)
+        if time.time() - stat.st_mtime > self.RACY_SECONDS:
+            with self._lock:
+                self._entries[path] = self._new_entries[path] = key + [digest]
+        return digest
+
+    def save(self):
+        """Write new entries to disk. Failures are ignored."""
+        with self._lock:
+            if not self._new_entries:
+                return
+            entries = self._load()
+            entries.update(self._new_entries)
+            entries = {
+                path: entry
+                for path, entry in entries.items()
+                if self._is_current(path, entry)
+            }
+            tmp_filename = "{}.{}.tmp".format(self.filename, os.getpid())
+            try:
+                os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+                with open(tmp_filename, "w") as f:
+                    json.dump({"version": self.VERSION, "entries": entries}, f)
+                os.replace(tmp_filename, self.filename)
+            except OSError:
+                with contextlib.suppress(OSError):
+                    os.remove(tmp_filename)
+                return
+            self._entries = entries
+            self._new_entries = {}
+
+    @staticmethod
+    def _is_current(path, entry):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return entry[:3] == [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+
+_digest_caches = {}
+_digest_caches_lock = threading.Lock()
+
+
+def get_digest_cache():
+    """Return the DigestCache configured in SETTINGS.DIGEST_CACHE, or None."""
+    filename = SETTINGS.DIGEST_CACHE
+    if not filename:
+        return None
+    filename = os.path.abspath(os.path.expanduser(filename))
+    with _digest_caches_lock:
+        if filename not in _digest_caches:
+            _digest_caches[filename] = DigestCache(filename)
+        return _digest_caches[filename]
+
+
+def get_cached_digest(filename):
+    """Like get_digest, but uses the on-disk digest cache if it is enabled."""
+    cache = get_digest_cache()
+    if cache is None:
+        return get_digest(filename)
+    return cache.get_digest(filename)
+
+
+_git_info_by_root = None
+_git_info_lock = threading.RLock()
+
+
+@contextlib.contextmanager
+def git_info_cache():
+    """Compute the git information only once per repository within this context.
+
+    Without it, :py:func:`get_commit_if_possible` opens the repository and
+    checks whether it is dirty for every single file.
+    """
+    global _git_info_by_root
+    with _git_info_lock:
+        outermost = _git_info_by_root is None
+        if outermost:
+            _git_info_by_root = {}
+    try:
+        yield
+    finally:
+        if outermost:
+            with _git_info_lock:
+                _git_info_by_root = None
+
+
+@functools.lru_cache(maxsize=1024)
+def _find_git_root(directory):
+    """Return the closest directory containing .git, or None."""
+    while True:
+        if os.path.exists(os.path.join(directory, ".git")):
+            return directory
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+
 def get_commit_if_possible(filename, save_git_info):
     """Try to retrieve VCS information for a given file.
 
@@ -429,17 +583,30 @@ def get_commit_if_possible(filename, save_git_info):
         ) from e
 
     directory = os.path.dirname(filename)
-    try:
-        repo = Repo(directory, search_parent_directories=True)
-    except InvalidGitRepositoryError:
+    root = _find_git_root(directory)
+    if root is None and "GIT_DIR" not in os.environ:
         return None, None, None
-    try:
-        path = repo.remote().url
-    except ValueError:
-        path = "git:/" + repo.working_dir
-    is_dirty = repo.is_dirty()
-    commit = repo.head.commit.hexsha
-    return path, commit, is_dirty
+
+    with _git_info_lock:
+        cache = _git_info_by_root
+        key = root or directory
+        if cache is not None and key in cache:
+            return cache[key]
+        try:
+            repo = Repo(key, search_parent_directories=True)
+        except InvalidGitRepositoryError:
+            git_info = None, None, None
+        else:
+            try:
+                path = repo.remote().url
+            except ValueError:
+                path = "git:/" + repo.working_dir
+            is_dirty = repo.is_dirty()
+            commit = repo.head.commit.hexsha
+            git_info = path, commit, is_dirty
+        if cache is not None:
+            cache[key] = git_info
+        return git_info
 
 
 @functools.total_ordering
@@ -458,7 +625,7 @@ class Source:
 
         main_file = get_py_file_if_possible(os.path.abspath(filename))
         repo, commit, is_dirty = get_commit_if_possible(main_file, save_git_info)
-        return Source(main_file, get_digest(main_file), repo, commit, is_dirty)
+        return Source(main_file, get_cached_digest(main_file), repo, commit, is_dirty)
 
     def to_json(self, base_dir=None):
         if base_dir:
@@ -484,10 +651,109 @@ class Source:
         return "<Source: {}>".format(self.filename)
 
 
+def canonicalize_name(name):
+    """Normalize a distribution name as described in PEP 503."""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+class DistributionIndex:
+    """Lookup tables for the installed distributions.
+
+    Maps top-level module names and (canonicalized) distribution names to
+    the ``(name, version)`` of the distribution that provides them, so
+    versions can be determined without searching the environment again.
+    If a name is provided several times, the first distribution wins, just
+    like for imports.
+    """
+
+    def __init__(self, distributions):
+        self.by_name = {}
+        self.by_module = {}
+        for name, version, modules in distributions:
+            key = canonicalize_name(name)
+            if key in self.by_name:
+                continue
+            self.by_name[key] = name, version
+            for modname in modules:
+                self.by_module.setdefault(modname, (name, version))
+
+    def lookup_name(self, name):
+        """Return (name, version) of the distribution with the given name."""
+        return self.by_name.get(canonicalize_name(name))
+
+    def lookup_module(self, modname):
+        """Return (name, version) of the distribution providing a module."""
+        return self.by_module.get(modname)
+
+
+def _get_top_level_names(dist):
+    """Return the names of the top-level modules of an importlib distribution."""
+    top_level = dist.read_text("top_level.txt")
+    if top_level is not None:
+        return top_level.split()
+    # some packagenames don't match the module names (e.g. PyYAML) so this
+    # guesses them from the installed files, like packages_distributions()
+    return {
+        f.parts[0] if len(f.parts) > 1 else f.stem
+        for f in dist.files or ()
+        if f.suffix == ".py" and f.parts[0] != ".."
+    }
+
+
+def iterate_distributions():
+    """Yield (name, version, top-level module names) of all distributions."""
+    if opt.has_importlib_metadata:
+        for dist in opt.importlib_metadata.distributions():
+            try:
+                name = dist.metadata["Name"]
+                if name:
+                    yield name, dist.version, _get_top_level_names(dist)
+            except Exception:
+                pass
+    else:
+        import pkg_resources
+
+        for dist in pkg_resources.working_set:
+            try:
+                top_level = list(dist._get_metadata("top_level.txt"))
+            except Exception:
+                top_level = []
+            yield dist.project_name, dist.version, top_level
+
+
+_distribution_index = None, None
+_distribution_index_lock = threading.Lock()
+
+
+def _get_search_path_state():
+    state = []
+    for path in sys.path:
+        try:
+            state.append((path, os.stat(path or ".").st_mtime_ns))
+        except OSError:
+            state.append((path, None))
+    return tuple(state)
+
+
+def get_distribution_index():
+    """Return the DistributionIndex of the current environment.
+
+    It is built only once per process, unless sys.path changed or a
+    package was installed or removed meanwhile, which is detected from the
+    modification times of the directories on sys.path.
+    """
+    global _distribution_index
+    state = _get_search_path_state()
+    with _distribution_index_lock:
+        cached_state, index = _distribution_index
+        if index is None or cached_state != state:
+            index = DistributionIndex(iterate_distributions())
+            _distribution_index = state, index
+        return index
+
+
 @functools.total_ordering
 class PackageDependency:
-    modname_to_dist = {}
-
     def __init__(self, name, version):
         self.name = name
         self.version = version
@@ -495,8 +761,8 @@ class PackageDependency:
     def fill_missing_version(self):
         if self.version is not None:
             return
-        dist = pkg_resources.working_set.by_key.get(self.name)
-        self.version = dist.version if dist else None
+        dist = get_distribution_index().lookup_name(self.name)
+        self.version = dist[1] if dist else None
 
     def to_json(self):
         return "{}=={}".format(self.name, self.version or "<unknown>")
@@ -518,19 +784,13 @@ class PackageDependency:
 
     @classmethod
     def create(cls, mod):
-        if not cls.modname_to_dist:
-            # some packagenames don't match the module names (e.g. PyYAML)
-            # so we set up a dict to map from module name to package name
-            for dist in pkg_resources.working_set:
-                try:
-                    toplevel_names = dist._get_metadata("top_level.txt")
-                    for tln in toplevel_names:
-                        cls.modname_to_dist[tln] = dist.project_name, dist.version
-                except Exception:
-                    pass
-
-        name, version = cls.modname_to_dist.get(mod.__name__, (mod.__name__, None))
+        return cls.from_module_name(mod.__name__)
 
+    @classmethod
+    def from_module_name(cls, modname):
+        """Create the dependency for a module without having to import it."""
+        dist = get_distribution_index().lookup_module(modname)
+        name, version = dist or (modname, None)
         return PackageDependency(name, version)
 
 
@@ -620,14 +880,164 @@ def iterate_imported_modules(globs):
                 yield modname, mod
 
 
-def iterate_all_python_files(base_path):
-    # TODO support ignored directories/files
-    for dirname, subdirlist, filelist in os.walk(base_path):
-        if "__pycache__" in dirname:
+IgnoreRule = namedtuple("IgnoreRule", "base_dir regex negated dir_only")
+
+
+def parse_ignore_patterns(patterns, base_dir):
+    """Convert gitignore-style patterns to a list of IgnoreRules.
+
+    Supports the syntax of .gitignore files: comments starting with ``#``,
+    ``!`` to include a path again, a trailing ``/`` to only match
+    directories, a ``/`` at the start or in the middle to anchor the pattern
+    at base_dir, and the wildcards ``*``, ``?``, ``[...]`` and ``**``.
+    """
+    rules = []
+    for pattern in patterns:
+        pattern = pattern.rstrip("\n\r")
+        while pattern.endswith(" ") and not pattern.endswith("\\ "):
+            pattern = pattern[:-1]
+        if not pattern or pattern.startswith("#"):
+            continue
+        negated = pattern.startswith("!")
+        if negated:
+            pattern = pattern[1:]
+        dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        if not pattern:
+            continue
+        # without a slash the pattern matches at any depth
+        regex = "" if "/" in pattern else "(?:.*/)?"
+        parts = pattern.lstrip("/").split("/")
+        for i, part in enumerate(parts):
+            is_last = i == len(parts) - 1
+            if part == "**":
+                regex += ".*" if is_last else "(?:.*/)?"
+            else:
+                regex += _translate_glob(part) + ("" if is_last else "/")
+        rules.append(
+            IgnoreRule(
+                base_dir, re.compile(regex + r"\Z", re.DOTALL), negated, dir_only
+            )
+        )
+    return rules
+
+
+def _translate_glob(pattern):
+    """Translate a glob pattern for a single path component to a regex."""
+    i, n = 0, len(pattern)
+    result = []
+    while i < n:
+        c = pattern[i]
+        i += 1
+        if c == "*":
+            result.append("[^/]*")
+        elif c == "?":
+            result.append("[^/]")
+        elif c == "\\" and i < n:
+            result.append(re.escape(pattern[i]))
+            i += 1
+        elif c == "[":
+            j = i
+            if j < n and pattern[j] in "!^":
+                j += 1
+            if j < n and pattern[j] == "]":
+                j += 1
+            j = pattern.find("]", j)
+            if j == -1:
+                result.append("\\[")
+                continue
+            chars = pattern[i:j].replace("\\", "\\\\")
+            if chars[0] in "!^":
+                chars = "^" + chars[1:]
+            result.append("[{}]".format(chars))
+            i = j + 1
+        else:
+            result.append(re.escape(c))
+    return "".join(result)
+
+
+def is_ignored(path, is_dir, rules):
+    """Whether the last of the rules that matches the absolute path ignores it."""
+    ignored = False
+    for rule in rules:
+        if rule.negated != ignored or (rule.dir_only and not is_dir):
+            continue  # this rule could not change the outcome
+        prefix = rule.base_dir.rstrip(os.sep) + os.sep
+        if not path.startswith(prefix):
             continue
+        relative_path = path[len(prefix) :]
+        if os.sep != "/":
+            relative_path = relative_path.replace(os.sep, "/")
+        if rule.regex.match(relative_path):
+            ignored = not rule.negated
+    return ignored
+
+
+def _read_ignore_file(filename, base_dir):
+    try:
+        with open(filename, encoding="utf-8", errors="replace") as f:
+            return parse_ignore_patterns(f.readlines(), base_dir)
+    except OSError:
+        return []
+
+
+def _get_outer_gitignore_rules(base_path):
+    """Return the rules of the repository that apply to base_path.
+
+    These are .git/info/exclude and the .gitignore files in the directories
+    between the root of the repository and base_path (exclusive).
+    """
+    root = _find_git_root(base_path)
+    if root is None:
+        return []
+    rules = _read_ignore_file(os.path.join(root, ".git", "info", "exclude"), root)
+    directories = []
+    directory = base_path
+    while directory != root:
+        directory = os.path.dirname(directory)
+        directories.append(directory)
+    for directory in reversed(directories):
+        rules += _read_ignore_file(os.path.join(directory, ".gitignore"), directory)
+    return rules
+
+
+def iterate_all_python_files(base_path, exclude=None, use_gitignore=None):
+    """Yield all python files in base_path that are not excluded.
+
+    exclude is a list of gitignore-style patterns relative to base_path and
+    defaults to ``SETTINGS.DIR_SOURCES.EXCLUDE``. If use_gitignore is true
+    (default: ``SETTINGS.DIR_SOURCES.USE_GITIGNORE``), the patterns in
+    .gitignore files apply as well. The patterns in exclude take
+    precedence. Excluded directories are not entered at all.
+    """
+    if exclude is None:
+        exclude = SETTINGS.DIR_SOURCES.EXCLUDE
+    if use_gitignore is None:
+        use_gitignore = SETTINGS.DIR_SOURCES.USE_GITIGNORE
+    base_path = os.path.abspath(base_path)
+    exclude_rules = parse_ignore_patterns(exclude, base_path)
+    gitignore_rules = {}
+    if use_gitignore:
+        gitignore_rules[base_path] = _get_outer_gitignore_rules(base_path)
+    for dirname, subdirlist, filelist in os.walk(base_path):
+        rules = gitignore_rules.pop(dirname, [])
+        if use_gitignore:
+            rules = rules + _read_ignore_file(
+                os.path.join(dirname, ".gitignore"), dirname
+            )
+        all_rules = rules + exclude_rules
+        subdirlist[:] = [
+            d
+            for d in subdirlist
+            if not is_ignored(os.path.join(dirname, d), True, all_rules)
+        ]
+        if use_gitignore:
+            for d in subdirlist:
+                gitignore_rules[os.path.join(dirname, d)] = rules
         for filename in filelist:
-            if filename.endswith(".py"):
-                yield os.path.join(base_path, dirname, filename)
+            path = os.path.join(dirname, filename)
+            if filename.endswith(".py") and not is_ignored(path, False, all_rules):
+                yield path
 
 
 def iterate_sys_modules():
@@ -682,10 +1092,22 @@ def get_sources_from_imported_modules(globs, base_path, save_git_info):
 
 
 def get_sources_from_local_dir(globs, base_path, save_git_info):
-    return {
-        Source.create(filename, save_git_info)
-        for filename in iterate_all_python_files(base_path)
-    }
+    start_time = time.perf_counter()
+    filenames = list(iterate_all_python_files(base_path))
+    scan_time = time.perf_counter()
+    create_source = functools.partial(Source.create, save_git_info=save_git_info)
+    with git_info_cache(), ThreadPoolExecutor(
+        max_workers=SETTINGS.DIR_SOURCES.WORKERS
+    ) as executor:
+        sources = set(executor.map(create_source, filenames))
+    logger.debug(
+        "Found %d source files in %s in %.3fs, computing digests took %.3fs",
+        len(filenames),
+        base_path,
+        scan_time - start_time,
+        time.perf_counter() - scan_time,
+    )
+    return sources
 
 
 def get_dependencies_from_sys_modules(globs, base_path):
@@ -698,10 +1120,10 @@ def get_dependencies_from_imported_modules(globs, base_path):
 
 def get_dependencies_from_pkg(globs, base_path):
     dependencies = set()
-    for dist in pkg_resources.working_set:
-        if dist.version == "0.0.0":
+    for name, version in get_distribution_index().by_name.values():
+        if version == "0.0.0":
             continue  # ugly hack to deal with pkg-resource version bug
-        dependencies.add(PackageDependency(dist.project_name, dist.version))
+        dependencies.add(PackageDependency(name, version))
     return dependencies
 
 
@@ -722,14 +1144,18 @@ dependency_discovery_strategies = {
 
 def gather_sources_and_dependencies(globs, save_git_info, base_dir=None):
     """Scan the given globals for modules and return them as dependencies."""
-    experiment_path, main = get_main_file(globs, save_git_info)
+    with git_info_cache():
+        experiment_path, main = get_main_file(globs, save_git_info)
 
-    base_dir = base_dir or experiment_path
+        base_dir = base_dir or experiment_path
 
-    gather_sources = source_discovery_strategies[SETTINGS["DISCOVER_SOURCES"]]
-    sources = gather_sources(globs, base_dir, save_git_info)
-    if main is not None:
-        sources.add(main)
+        gather_sources = source_discovery_strategies[SETTINGS["DISCOVER_SOURCES"]]
+        sources = gather_sources(globs, base_dir, save_git_info)
+        if main is not None:
+            sources.add(main)
+    digest_cache = get_digest_cache()
+    if digest_cache is not None:
+        digest_cache.save()
 
     gather_dependencies = dependency_discovery_strategies[
         SETTINGS["DISCOVER_DEPENDENCIES"]
@@ -738,6 +1164,6 @@ def gather_sources_and_dependencies(globs, save_git_info, base_dir=None):
 
     if opt.has_numpy:
         # Add numpy as a dependency because it might be used for randomness
-        dependencies.add(PackageDependency.create(opt.np))
+        dependencies.add(PackageDependency.from_module_name("numpy"))
 
     return main, sources, dependencies
@@ -468,6 +468,43 @@ class Experiment(Ingredient):
         # The same as Run.log_scalar
         self.current_run.log_scalar(name, value, step)
 
+    def log_scalars(self, values: dict, step: Optional[int] = None) -> None:
+        """
+        Add one new measurement for each of several metrics at once.
+
+        Parameters
+        ----------
+        values
+            A dictionary mapping metric names (e.g. training.loss)
+            to the measured values
+        step
+            The step number (integer) shared by all measurements.
+            If not specified, the internal counter of each metric
+            is incremented by one.
+        """
+        # The same as Run.log_scalars
+        self.current_run.log_scalars(values, step)
+
+    def log_array(
+        self, name: str, values: Sequence[float], steps: Optional[Sequence[int]] = None
+    ) -> None:
+        """
+        Add a whole series of measurements of one metric at once.
+
+        Parameters
+        ----------
+        name
+            The name of the metric, e.g. training.loss
+        values
+            A sequence or one-dimensional numpy array of measured values
+        steps
+            A sequence or numpy array of step numbers with the same length
+            as values. If not specified, the internal counter of the metric
+            is continued.
+        """
+        # The same as Run.log_array
+        self.current_run.log_array(name, values, steps)
+
     def post_process_name(self, name, ingredient):
         if ingredient == self:
             # Removes the experiment's path (prefix) from the names
@@ -619,6 +656,8 @@ DEFAULT_COMMAND_LINE_OPTIONS = [
     commandline_options.unobserved_option,
     commandline_options.beat_interval_option,
     commandline_options.queue_option,
+    commandline_options.queued_option,
+    commandline_options.observer_process_option,
     commandline_options.force_option,
     commandline_options.comment_option,
     commandline_options.enforce_clean_option,
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Change tracking for heartbeat events.
+
+Observers that set ``delta_heartbeats = True`` do not receive the full
+``info``, ``captured_out`` and ``result`` with every heartbeat, but only a
+:class:`HeartbeatDelta` describing what changed since the previous beat.
+"""
+
+import copy
+import hashlib
+import pickle
+
+from sacred.captured_output import common_prefix_length
+
+__all__ = ("HeartbeatDelta", "HeartbeatTracker", "wants_delta_heartbeats")
+
+
+class HeartbeatDelta:
+    """The changes of a run between two heartbeats.
+
+    Attributes
+    ----------
+    info_updates : dict
+        Top-level ``info`` entries that were added or changed.
+    info_removed : list
+        Top-level ``info`` keys that were removed.
+    captured_out_offset : int or None
+        Number of characters of the previously sent captured output that are
+        still valid, or None if the captured output did not change.
+    captured_out_tail : str
+        Text that replaces everything after ``captured_out_offset``.
+        Usually the offset is the previous length and this is just the new
+        output, but a captured_out_filter may rewrite earlier text.
+    result_changed : bool
+        Whether the result changed.
+    result
+        The current result of the run.
+    """
+
+    def __init__(
+        self,
+        info_updates=None,
+        info_removed=(),
+        captured_out_offset=None,
+        captured_out_tail="",
+        result_changed=False,
+        result=None,
+    ):
+        self.info_updates = info_updates or {}
+        self.info_removed = list(info_removed)
+        self.captured_out_offset = captured_out_offset
+        self.captured_out_tail = captured_out_tail
+        self.result_changed = result_changed
+        self.result = result
+
+    @property
+    def info_changed(self):
+        return bool(self.info_updates or self.info_removed)
+
+    @property
+    def captured_out_changed(self):
+        return self.captured_out_offset is not None
+
+    @property
+    def is_empty(self):
+        return not (
+            self.info_changed or self.captured_out_changed or self.result_changed
+        )
+
+    def apply_info(self, info):
+        """Update the given info dict in place and return it."""
+        for key in self.info_removed:
+            info.pop(key, None)
+        info.update(self.info_updates)
+        return info
+
+    def apply_captured_out(self, captured_out):
+        """Return the captured output after applying this delta."""
+        if self.captured_out_offset is None:
+            return captured_out
+        return captured_out[: self.captured_out_offset] + self.captured_out_tail
+
+    def __repr__(self):
+        return (
+            "HeartbeatDelta(info_updates={!r}, info_removed={!r}, "
+            "captured_out_offset={!r}, captured_out_tail={!r}, "
+            "result_changed={!r}, result={!r})".format(
+                self.info_updates,
+                self.info_removed,
+                self.captured_out_offset,
+                self.captured_out_tail,
+                self.result_changed,
+                self.result,
+            )
+        )
+
+
+class HeartbeatTracker:
+    """Remembers the state sent with the last heartbeat and computes deltas.
+
+    The tracked state starts out the same way the observers see a run after
+    the started_event: an empty info dict, no captured output and no result.
+    """
+
+    def __init__(self):
+        self._info = {}
+        self._captured_out = ""
+        self._captured_out_mark = (0, "")
+        self._result = _digest(None)
+
+    def diff(self, info, captured_out, result):
+        """Compute the changes since the last call and remember the new state.
+
+        captured_out is either a string or a
+        :class:`sacred.captured_output.CapturedOutput`.
+
+        Info entries are compared one top-level key at a time by a digest of
+        their pickled form, which also works for (containers of) numpy
+        arrays. Values that cannot be pickled always count as changed. Only
+        the changed values are copied into the returned delta, so later
+        modifications of the run's info do not affect a delta that is still
+        being processed.
+        """
+        info_updates = {}
+        for key, value in list(info.items()):
+            digest = _digest(value)
+            if digest is None or self._info.get(key) != digest:
+                self._info[key] = digest
+                info_updates[key] = _snapshot(value)
+        info_removed = [key for key in self._info if key not in info]
+        for key in info_removed:
+            del self._info[key]
+
+        offset = None
+        tail = ""
+        if not isinstance(captured_out, str):
+            # a CapturedOutput, which can tell what changed on its own
+            stable, pending = self._captured_out_mark
+            offset, tail, self._captured_out_mark = captured_out.changes_since(
+                self._captured_out_mark
+            )
+            if offset == stable + len(pending) and not tail:
+                offset = None
+        elif captured_out != self._captured_out:
+            offset = common_prefix_length(self._captured_out, captured_out)
+            tail = captured_out[offset:]
+            self._captured_out = captured_out
+
+        digest = _digest(result)
+        result_changed = digest is None or digest != self._result
+        self._result = digest
+
+        return HeartbeatDelta(
+            info_updates=info_updates,
+            info_removed=info_removed,
+            captured_out_offset=offset,
+            captured_out_tail=tail,
+            result_changed=result_changed,
+            result=result,
+        )
+
+
+def wants_delta_heartbeats(observer):
+    """Whether the observer opted into receiving heartbeat_delta_event."""
+    return getattr(observer, "delta_heartbeats", False) is True
+
+
+def _digest(value):
+    try:
+        return hashlib.md5(pickle.dumps(value, protocol=4)).digest()
+    except Exception:
+        return None
+
+
+def _snapshot(value):
+    try:
+        return copy.deepcopy(value)
+    except Exception:
+        return value
@@ -1,19 +1,30 @@
 """Helps to collect information about the host of an experiment."""
 
+import copy
+import json
+import logging
 import os
 import platform
 import re
 import subprocess
+import sys
+import threading
+import time
 from xml.etree import ElementTree
 import warnings
 from typing import List
 
-import cpuinfo
-
 from sacred.utils import optional_kwargs_decorator
 from sacred.settings import SETTINGS
 
-__all__ = ("host_info_gatherers", "get_host_info", "host_info_getter")
+__all__ = (
+    "host_info_gatherers",
+    "get_host_info",
+    "host_info_getter",
+    "clear_host_info_cache",
+)
+
+logger = logging.getLogger(__name__)
 
 # Legacy global dict of functions that are used
 # to collect the host information.
@@ -25,9 +36,14 @@ class IgnoreHostInfo(Exception):
 
 
 class HostInfoGetter:
-    def __init__(self, getter_function, name):
+    def __init__(
+        self, getter_function, name, cacheable=False, timeout=None, enabled=None
+    ):
         self.getter_function = getter_function
         self.name = name
+        self.cacheable = cacheable
+        self.timeout = timeout
+        self.enabled = enabled
 
     def __call__(self):
         return self.getter_function()
@@ -36,9 +52,30 @@ class HostInfoGetter:
         return self.getter_function()
 
 
-def host_info_gatherer(name):
+def host_info_gatherer(name, cacheable=False, timeout=None, enabled=None):
+    """Turn the decorated function into a HostInfoGetter.
+
+    Parameters
+    ----------
+    name : str
+        The name of the corresponding entry in host_info.
+    cacheable : bool
+        If true, the result is static and is kept (by name) in the host info
+        cache for ``SETTINGS.HOST_INFO.CACHE_TTL`` seconds. Results of None
+        are never cached.
+    timeout : float, optional
+        Seconds to wait for the function before leaving out its entry.
+        Defaults to ``SETTINGS.HOST_INFO.TIMEOUT``.
+    enabled : callable, optional
+        Function that tells whether the entry is currently enabled, e.g. by
+        a setting. The cache is only used while it returns True, otherwise
+        the getter itself is called.
+    """
+
     def wrapper(f):
-        return HostInfoGetter(f, name)
+        return HostInfoGetter(
+            f, name, cacheable=cacheable, timeout=timeout, enabled=enabled
+        )
 
     return wrapper
 
@@ -58,6 +95,10 @@ def check_additional_host_info(additional_host_info: List[HostInfoGetter]):
 def get_host_info(additional_host_info: List[HostInfoGetter] = None):
     """Collect some information about the machine this experiment runs on.
 
+    All getters run concurrently, each in its own thread. Getters that do
+    not finish within their timeout are left out. The results of cacheable
+    getters are reused from the host info cache if they are recent enough.
+
     Returns
     -------
     dict
@@ -71,13 +112,188 @@ def get_host_info(additional_host_info: List[HostInfoGetter] = None):
     all_host_info_gatherers = host_info_gatherers.copy()
     for getter in additional_host_info:
         all_host_info_gatherers[getter.name] = getter
-    host_info = {}
+
+    cached = _get_cached_host_info()
+    results = {}
+    to_gather = {}
     for k, v in all_host_info_gatherers.items():
+        if getattr(v, "cacheable", False) and k in cached and _is_enabled(v):
+            results[k] = cached[k]
+        else:
+            to_gather[k] = v
+    gathered = _gather_concurrently(to_gather)
+    _update_host_info_cache(
+        {
+            k: result
+            for k, result in gathered.items()
+            if getattr(to_gather[k], "cacheable", False)
+            and result is not None
+            and result is not _TIMED_OUT
+        }
+    )
+    results.update(gathered)
+
+    host_info = {}
+    for k in all_host_info_gatherers:
+        if results[k] is not _IGNORED and results[k] is not _TIMED_OUT:
+            host_info[k] = copy.deepcopy(results[k])
+    return host_info
+
+
+def _is_enabled(getter):
+    enabled = getattr(getter, "enabled", None)
+    return enabled is None or enabled()
+
+
+def clear_host_info_cache():
+    """Forget the cached host info of this process (but not the cache file)."""
+    with _cache_lock:
+        _cache.clear()
+
+
+# markers for the results of getters that raised IgnoreHostInfo or timed out
+_IGNORED = object()
+_TIMED_OUT = object()
+
+# name -> (time, result) of cacheable getters
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _gather_concurrently(getters):
+    results = {}
+    threads = {}
+
+    def run_getter(name, getter):
         try:
-            host_info[k] = v()
+            results[name] = getter()
         except IgnoreHostInfo:
+            results[name] = _IGNORED
+        except Exception as e:
+            results[name] = e
+
+    start_time = time.monotonic()
+    for name, getter in getters.items():
+        # daemon threads, so a hanging getter cannot block the exit
+        thread = threading.Thread(
+            target=run_getter,
+            args=(name, getter),
+            name="host_info_{}".format(name),
+            daemon=True,
+        )
+        thread.start()
+        threads[name] = thread
+
+    gathered = {}
+    for name, thread in threads.items():
+        timeout = getattr(getters[name], "timeout", None)
+        if timeout is None:
+            timeout = SETTINGS.HOST_INFO.TIMEOUT
+        if timeout is None:
+            thread.join()
+        else:
+            thread.join(max(0.0, start_time + timeout - time.monotonic()))
+        if thread.is_alive():
+            logger.warning(
+                'Gathering the host info "%s" took longer than %ss, skipping it',
+                name,
+                timeout,
+            )
+            gathered[name] = _TIMED_OUT
+        elif isinstance(results[name], Exception):
+            raise results[name]
+        else:
+            gathered[name] = results[name]
+    return gathered
+
+
+def _get_cached_host_info():
+    """Return the cached results that are younger than the TTL."""
+    ttl = SETTINGS.HOST_INFO.CACHE_TTL
+    if not ttl:
+        return {}
+    now = time.time()
+    with _cache_lock:
+        if SETTINGS.HOST_INFO.CACHE_FILE:
+            for name, entry in _load_cache_file().items():
+                if name not in _cache or _cache[name][0] < entry[0]:
+                    _cache[name] = entry
+        return {
+            name: result
+            for name, (timestamp, result) in _cache.items()
+            if now - timestamp < ttl
+        }
+
+
+def _update_host_info_cache(results):
+    if not results or not SETTINGS.HOST_INFO.CACHE_TTL:
+        return
+    now = time.time()
+    with _cache_lock:
+        for name, result in results.items():
+            _cache[name] = now, result
+        if SETTINGS.HOST_INFO.CACHE_FILE:
+            _save_cache_file({name: _cache[name] for name in results})
+
+
+def _cache_file_key():
+    """Key of the entries of this process in the cache file.
+
+    Entries such as the python version differ between the interpreters
+    (e.g. virtual environments) of one host, so both are part of the key.
+    """
+    return "{} {}".format(platform.node(), sys.executable)
+
+
+def _load_cache_file():
+    """Read the entries for this host and interpreter from the cache file."""
+    try:
+        with open(os.path.expanduser(SETTINGS.HOST_INFO.CACHE_FILE)) as f:
+            content = json.load(f)
+        entries = content["hosts"][_cache_file_key()]
+        return {
+            name: (e["time"], _IGNORED if e.get("ignored") else e["value"])
+            for name, e in entries.items()
+        }
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}
+
+
+def _save_cache_file(new_entries):
+    """Merge new entries into the cache file. Failures are ignored.
+
+    The file holds the entries of several hosts and interpreters, because
+    the home directory might be shared between the machines of a cluster.
+    """
+    filename = os.path.expanduser(SETTINGS.HOST_INFO.CACHE_FILE)
+    try:
+        with open(filename) as f:
+            content = json.load(f)
+        if not isinstance(content.get("hosts"), dict):
+            raise ValueError
+    except (OSError, ValueError, AttributeError):
+        content = {"hosts": {}}
+    key = _cache_file_key()
+    entries = content["hosts"].get(key)
+    if not isinstance(entries, dict):
+        entries = content["hosts"][key] = {}
+    for name, (timestamp, result) in new_entries.items():
+        if result is _IGNORED:
+            entries[name] = {"time": timestamp, "ignored": True}
+        else:
+            entries[name] = {"time": timestamp, "value": result}
+    tmp_filename = "{}.{}.tmp".format(filename, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        with open(tmp_filename, "w") as f:
+            json.dump(content, f)
+        os.replace(tmp_filename, filename)
+    except (OSError, TypeError, ValueError):
+        # TypeError and ValueError: result of a custom getter is not json
+        try:
+            os.remove(tmp_filename)
+        except OSError:
             pass
-    return host_info
 
 
 @optional_kwargs_decorator
@@ -123,17 +339,17 @@ def _hostname():
     return platform.node()
 
 
-@host_info_gatherer(name="os")
+@host_info_gatherer(name="os", cacheable=True)
 def _os():
     return [platform.system(), platform.platform()]
 
 
-@host_info_gatherer(name="python_version")
+@host_info_gatherer(name="python_version", cacheable=True)
 def _python_version():
     return platform.python_version()
 
 
-@host_info_gatherer(name="cpu")
+@host_info_gatherer(name="cpu", cacheable=True)
 def _cpu():
     if platform.system() == "Windows":
         return _get_cpu_by_pycpuinfo()
@@ -147,7 +363,11 @@ def _cpu():
         return _get_cpu_by_pycpuinfo()
 
 
-@host_info_gatherer(name="gpus")
+@host_info_gatherer(
+    name="gpus",
+    cacheable=True,
+    enabled=lambda: SETTINGS.HOST_INFO.INCLUDE_GPU_INFO,
+)
 def _gpus():
     if not SETTINGS.HOST_INFO.INCLUDE_GPU_INFO:
         return
@@ -204,4 +424,6 @@ def _get_cpu_by_proc_cpuinfo():
 
 
 def _get_cpu_by_pycpuinfo():
+    import cpuinfo
+
     return cpuinfo.get_cpu_info().get("brand", "Unknown")
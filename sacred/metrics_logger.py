@@ -1,9 +1,9 @@
 #!/usr/bin/env python
 # coding=utf-8
 import datetime
-import sacred.optional as opt
+import threading
 
-from queue import Queue, Empty
+import sacred.optional as opt
 
 
 class MetricsLogger:
@@ -13,12 +13,16 @@ class MetricsLogger:
     An instance of the class should be created for the Run class, such that the
     log_scalar_metric method is accessible from running experiments using
     _run.metrics.log_scalar_metric.
+
+    Measurements are kept in a columnar buffer: one set of steps, values and
+    timestamps lists per metric. At heartbeat time the whole buffer is swapped
+    out at once, so it can be handed to the observers without regrouping.
     """
 
     def __init__(self):
-        # Create a message queue that remembers
-        # calls of the log_scalar_metric
-        self._logged_metrics = Queue()
+        self._lock = threading.Lock()
+        self._buffer = {}
+        """Columns of the measurements since the last read, by metric name."""
         self._metric_step_counter = {}
         """Remembers the last number of each metric."""
 
@@ -42,26 +46,116 @@ class MetricsLogger:
                 value = value.item()
             if isinstance(step, np.generic):
                 step = step.item()
-        if step is None:
-            step = self._metric_step_counter.get(metric_name, -1) + 1
-        self._logged_metrics.put(
-            ScalarMetricLogEntry(metric_name, step, datetime.datetime.utcnow(), value)
-        )
-        self._metric_step_counter[metric_name] = step
+        timestamp = datetime.datetime.utcnow()
+        with self._lock:
+            if step is None:
+                step = self._metric_step_counter.get(metric_name, -1) + 1
+            columns = self._buffer.get(metric_name)
+            if columns is None:
+                columns = self._buffer[metric_name] = _new_columns(metric_name)
+            columns["steps"].append(step)
+            columns["values"].append(value)
+            columns["timestamps"].append(timestamp)
+            self._metric_step_counter[metric_name] = step
+
+    def log_scalar_metrics(self, values_by_name, step=None):
+        """
+        Add one new measurement for each of several metrics.
+
+        All measurements share a single timestamp and are added to the
+        buffer at once.
+
+        :param values_by_name: A dict mapping metric names to measured values.
+        :param step: The step number (integer) shared by all measurements.
+                    If not specified, the internal counter of each metric
+                    is incremented by one.
+        """
+        if opt.has_numpy:
+            np = opt.np
+            values_by_name = {
+                name: value.item() if isinstance(value, np.generic) else value
+                for name, value in values_by_name.items()
+            }
+            if isinstance(step, np.generic):
+                step = step.item()
+        timestamp = datetime.datetime.utcnow()
+        with self._lock:
+            for metric_name, value in values_by_name.items():
+                if step is None:
+                    metric_step = self._metric_step_counter.get(metric_name, -1) + 1
+                else:
+                    metric_step = step
+                columns = self._buffer.get(metric_name)
+                if columns is None:
+                    columns = self._buffer[metric_name] = _new_columns(metric_name)
+                columns["steps"].append(metric_step)
+                columns["values"].append(value)
+                columns["timestamps"].append(timestamp)
+                self._metric_step_counter[metric_name] = metric_step
+
+    def log_array_metric(self, metric_name, values, steps=None):
+        """
+        Add a whole series of new measurements for one metric.
+
+        All measurements share a single timestamp and are added to the
+        buffer at once.
+
+        :param metric_name: The name of the metric, e.g. training.loss.
+        :param values: A sequence or (one-dimensional) numpy array
+                       of measured values.
+        :param steps: A sequence or numpy array of step numbers with the same
+                      length as values. If not specified, the internal counter
+                      of the metric is continued.
+        """
+        values = _to_list(values)
+        if steps is not None:
+            steps = _to_list(steps)
+            if len(steps) != len(values):
+                raise ValueError(
+                    "Got {} values but {} steps for metric '{}'.".format(
+                        len(values), len(steps), metric_name
+                    )
+                )
+        if not values:
+            return
+        timestamp = datetime.datetime.utcnow()
+        with self._lock:
+            if steps is None:
+                first = self._metric_step_counter.get(metric_name, -1) + 1
+                steps = list(range(first, first + len(values)))
+            columns = self._buffer.get(metric_name)
+            if columns is None:
+                columns = self._buffer[metric_name] = _new_columns(metric_name)
+            columns["steps"].extend(steps)
+            columns["values"].extend(values)
+            columns["timestamps"].extend([timestamp] * len(values))
+            self._metric_step_counter[metric_name] = steps[-1]
+
+    def get_last_metrics_by_name(self):
+        """Read all measurements since last read, grouped by metric name.
+
+        The buffer is swapped out atomically, so measurements logged
+        concurrently end up in the next read.
+
+        :return: Measured values grouped by the metric name, in the format
+                 returned by :py:func:`linearize_metrics`.
+        """
+        with self._lock:
+            metrics_by_name, self._buffer = self._buffer, {}
+        return metrics_by_name
 
     def get_last_metrics(self):
         """Read all measurement events since last call of the method.
 
         :return List[ScalarMetricLogEntry]
         """
-        read_up_to = self._logged_metrics.qsize()
-        messages = []
-        for i in range(read_up_to):
-            try:
-                messages.append(self._logged_metrics.get_nowait())
-            except Empty:
-                pass
-        return messages
+        return [
+            ScalarMetricLogEntry(name, step, timestamp, value)
+            for name, columns in self.get_last_metrics_by_name().items()
+            for step, timestamp, value in zip(
+                columns["steps"], columns["timestamps"], columns["values"]
+            )
+        ]
 
 
 class ScalarMetricLogEntry:
@@ -77,12 +171,34 @@ class ScalarMetricLogEntry:
         self.value = value
 
 
+def _new_columns(name):
+    return {"steps": [], "values": [], "timestamps": [], "name": name}
+
+
+def _to_list(values):
+    if opt.has_numpy and isinstance(values, opt.np.ndarray):
+        if values.ndim != 1:
+            raise ValueError(
+                "Expected a one-dimensional array, but got shape {}.".format(
+                    values.shape
+                )
+            )
+        # tolist() converts all entries to python scalars in one go
+        return values.tolist()
+    if opt.has_numpy:
+        np = opt.np
+        return [v.item() if isinstance(v, np.generic) else v for v in values]
+    return list(values)
+
+
 def linearize_metrics(logged_metrics):
     """
     Group metrics by name.
 
     Takes a list of individual measurements, possibly belonging
     to different metrics and groups them by name.
+    Metrics that are already grouped by name (as returned by
+    :py:meth:`MetricsLogger.get_last_metrics_by_name`) are returned as is.
 
     :param logged_metrics: A list of ScalarMetricLogEntries
     :return: Measured values grouped by the metric name:
@@ -90,15 +206,12 @@ def linearize_metrics(logged_metrics):
     "timestamps": [datetime, datetime, datetime]},
     "metric_name2": {...}}
     """
+    if isinstance(logged_metrics, dict):
+        return logged_metrics
     metrics_by_name = {}
     for metric_entry in logged_metrics:
         if metric_entry.name not in metrics_by_name:
-            metrics_by_name[metric_entry.name] = {
-                "steps": [],
-                "values": [],
-                "timestamps": [],
-                "name": metric_entry.name,
-            }
+            metrics_by_name[metric_entry.name] = _new_columns(metric_entry.name)
         metrics_by_name[metric_entry.name]["steps"].append(metric_entry.step)
         metrics_by_name[metric_entry.name]["values"].append(metric_entry.value)
         metrics_by_name[metric_entry.name]["timestamps"].append(metric_entry.timestamp)
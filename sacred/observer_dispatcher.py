@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import atexit
+import logging
+import queue
+import threading
+from concurrent.futures import Future, wait
+
+logger = logging.getLogger(__name__)
+
+
+class _ObserverWorker(threading.Thread):
+    """Daemon thread that executes the calls to a single observer in order.
+
+    Unlike the workers of a ThreadPoolExecutor, it is not joined before the
+    atexit handlers run, so :py:meth:`ObserverDispatcher.join` decides how
+    long the interpreter waits for it.
+    """
+
+    def __init__(self):
+        super().__init__(name="sacred-observer", daemon=True)
+        self._calls = queue.Queue()
+
+    def submit(self, func, *args, **kwargs):
+        future = Future()
+        self._calls.put((future, func, args, kwargs))
+        return future
+
+    def shutdown(self):
+        """Stop the thread once all submitted calls are done."""
+        self._calls.put(None)
+
+    def run(self):
+        while True:
+            call = self._calls.get()
+            if call is None:
+                return
+            future, func, args, kwargs = call
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+
+class ObserverDispatcher:
+    """Calls the observers of a run concurrently.
+
+    Every observer gets its own worker thread. Calls to a single observer are
+    executed one after another in the order they were submitted, while a slow
+    observer does not delay the others.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._workers = {}
+        self._pending = {}
+
+    def _get_worker(self, observer):
+        with self._lock:
+            worker = self._workers.get(id(observer))
+            if worker is None:
+                worker = _ObserverWorker()
+                worker.start()
+                self._workers[id(observer)] = worker
+            return worker
+
+    def submit(self, observer, func, *args, **kwargs):
+        """Schedule func(*args, **kwargs) on the worker thread of observer."""
+        future = self._get_worker(observer).submit(func, *args, **kwargs)
+        with self._lock:
+            self._pending[future] = observer
+        future.add_done_callback(self._discard)
+        return future
+
+    def _discard(self, future):
+        with self._lock:
+            self._pending.pop(future, None)
+
+    def dispatch(self, observers, func, *args, **kwargs):
+        """Schedule func(observer, *args, **kwargs) for every observer.
+
+        Returns the list of futures in the order of the observers.
+        """
+        return [
+            self.submit(observer, func, observer, *args, **kwargs)
+            for observer in observers
+        ]
+
+    def join(self, timeout=None):
+        """Wait until all scheduled calls are done and stop the workers.
+
+        Returns the list of observers that did not finish within timeout.
+        Their workers keep running in the background, and the interpreter
+        waits for their remaining calls (e.g. the final event of the run)
+        before it exits, so they are not cut off in the middle of a write.
+        """
+        with self._lock:
+            pending = dict(self._pending)
+        _, not_done = wait(pending, timeout=timeout)
+        with self._lock:
+            workers, self._workers = self._workers, {}
+        for worker in workers.values():
+            worker.shutdown()
+        stalled = []
+        for future in not_done:
+            if pending[future] not in stalled:
+                stalled.append(pending[future])
+        if not_done:
+            atexit.register(_wait_at_exit, not_done, stalled)
+        return stalled
+
+
+def _wait_at_exit(futures, observers):
+    if not all(future.done() for future in futures):
+        logger.warning(
+            "Waiting for the observers %s to finish before exiting.",
+            ", ".join(str(observer) for observer in observers),
+        )
+        wait(futures)
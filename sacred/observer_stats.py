@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import threading
+
+__all__ = ("ObserverStats",)
+
+
+# upper bounds of the latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.001, 0.01, 0.1, 1.0, 10.0, 60.0)
+
+
+class ObserverStats:
+    """Collects how long each observer takes to process each kind of event.
+
+    For every observer and event it keeps the number of calls, the total and
+    maximum time and a histogram of the latencies. Observers are identified
+    by their class name, with a suffix if there are several of the same class.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._names = {}
+        self._stats = {}
+
+    def observer_name(self, observer):
+        with self._lock:
+            name = self._names.get(id(observer))
+            if name is None:
+                name = base = type(observer).__name__
+                taken = set(self._names.values())
+                i = 2
+                while name in taken:
+                    name = "{}#{}".format(base, i)
+                    i += 1
+                self._names[id(observer)] = name
+            return name
+
+    def record(self, observer, event, duration):
+        """Add the duration (in seconds) of one call of event on observer."""
+        name = self.observer_name(observer)
+        with self._lock:
+            stats = self._stats.setdefault(name, {}).get(event)
+            if stats is None:
+                stats = self._stats[name][event] = {
+                    "count": 0,
+                    "total": 0.0,
+                    "max": 0.0,
+                    "histogram": [0] * (len(LATENCY_BUCKETS) + 1),
+                }
+            stats["count"] += 1
+            stats["total"] += duration
+            stats["max"] = max(stats["max"], duration)
+            stats["histogram"][_bucket_index(duration)] += 1
+
+    def summary(self):
+        """Return the statistics as a JSON serializable dict.
+
+        The format is ``{observer: {event: stats}}``, where stats contains
+        ``count``, ``total``, ``mean`` and ``max`` (in seconds),
+        ``calls_per_busy_second`` and ``histogram``, which maps the upper
+        bound of each latency bucket (e.g. ``"<=0.01"``) to the number of
+        calls. ``calls_per_busy_second`` is count / total, i.e. how many
+        calls the observer could process per second, not how often the
+        event occurred.
+        """
+        labels = ["<={:g}".format(b) for b in LATENCY_BUCKETS]
+        labels.append(">{:g}".format(LATENCY_BUCKETS[-1]))
+        with self._lock:
+            return {
+                name: {
+                    event: {
+                        "count": s["count"],
+                        "total": s["total"],
+                        "mean": s["total"] / s["count"],
+                        "max": s["max"],
+                        "calls_per_busy_second": (
+                            s["count"] / s["total"] if s["total"] > 0 else None
+                        ),
+                        "histogram": dict(zip(labels, s["histogram"])),
+                    }
+                    for event, s in events.items()
+                }
+                for name, events in self._stats.items()
+            }
+
+
+def _bucket_index(duration):
+    for i, bound in enumerate(LATENCY_BUCKETS):
+        if duration <= bound:
+            return i
+    return len(LATENCY_BUCKETS)
@@ -1,14 +1,24 @@
-from sacred.observers.base import RunObserver
-from sacred.observers.file_storage import FileStorageObserver
-from sacred.observers.json import JSONObserver
-from sacred.observers.mongo import MongoObserver, QueuedMongoObserver
-from sacred.observers.sql import SqlObserver
-from sacred.observers.tinydb_hashfs import TinyDbObserver, TinyDbReader
-from sacred.observers.slack import SlackObserver
-from sacred.observers.telegram_obs import TelegramObserver
-from sacred.observers.s3_observer import S3Observer
-from sacred.observers.queue import QueueObserver
-from sacred.observers.gcs_observer import GoogleCloudStorageObserver
+import importlib
+import sys
+
+# The observers are only imported when they are first accessed, because
+# importing their backends (pymongo, sqlalchemy, boto3, ...) takes time.
+_OBSERVER_MODULES = {
+    "RunObserver": "sacred.observers.base",
+    "FileStorageObserver": "sacred.observers.file_storage",
+    "JSONObserver": "sacred.observers.json",
+    "MongoObserver": "sacred.observers.mongo",
+    "QueuedMongoObserver": "sacred.observers.mongo",
+    "SqlObserver": "sacred.observers.sql",
+    "TinyDbObserver": "sacred.observers.tinydb_hashfs",
+    "TinyDbReader": "sacred.observers.tinydb_hashfs",
+    "SlackObserver": "sacred.observers.slack",
+    "TelegramObserver": "sacred.observers.telegram_obs",
+    "S3Observer": "sacred.observers.s3_observer",
+    "QueueObserver": "sacred.observers.queue",
+    "ProcessObserver": "sacred.observers.process",
+    "GoogleCloudStorageObserver": "sacred.observers.gcs_observer",
+}
 
 
 __all__ = (
@@ -24,5 +34,23 @@ __all__ = (
     "TelegramObserver",
     "S3Observer",
     "QueueObserver",
+    "ProcessObserver",
     "GoogleCloudStorageObserver",
 )
+
+
+def __getattr__(name):
+    if name not in _OBSERVER_MODULES:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module(_OBSERVER_MODULES[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+
+if sys.version_info < (3, 7):  # no module level __getattr__ (PEP 562)
+    for _name in __all__:
+        __getattr__(_name)
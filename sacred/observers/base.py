@@ -9,6 +9,9 @@ class RunObserver:
 
     priority = 0
 
+    delta_heartbeats = False
+    """If True, heartbeat_delta_event is called instead of heartbeat_event."""
+
     def queued_event(
         self, ex_info, command, host_info, queue_time, config, meta_info, _id
     ):
@@ -22,6 +25,14 @@ class RunObserver:
     def heartbeat_event(self, info, captured_out, beat_time, result):
         pass
 
+    def heartbeat_delta_event(self, delta, beat_time):
+        """Receive only the changes since the previous heartbeat.
+
+        Only called for observers with ``delta_heartbeats = True``.
+        ``delta`` is a :class:`sacred.heartbeat.HeartbeatDelta`.
+        """
+        pass
+
     def completed_event(self, stop_time, result):
         pass
 
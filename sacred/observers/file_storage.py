@@ -2,6 +2,7 @@
 # coding=utf-8
 
 import json
+import logging
 import os
 import os.path
 from pathlib import Path
@@ -19,10 +20,14 @@ from sacred.utils import PathType
 
 
 DEFAULT_FILE_STORAGE_PRIORITY = 20
+METRICS_LOG = "metrics.jsonl"
+
+logger = logging.getLogger(__name__)
 
 
 class FileStorageObserver(RunObserver):
     VERSION = "FileStorageObserver-0.7.0"
+    delta_heartbeats = True
 
     @classmethod
     def create(cls, *args, **kwargs):
@@ -196,7 +201,7 @@ class FileStorageObserver(RunObserver):
 
     def save_file(self, filename, target_name=None):
         target_name = target_name or os.path.basename(filename)
-        blacklist = ["run.json", "config.json", "cout.txt", "metrics.json"]
+        blacklist = ["run.json", "config.json", "cout.txt", "metrics.json", METRICS_LOG]
         blacklist = [os.path.join(self.dir, x) for x in blacklist]
         dest_file = os.path.join(self.dir, target_name)
         if dest_file in blacklist:
@@ -238,18 +243,36 @@ class FileStorageObserver(RunObserver):
         if self.info:
             self.save_json(self.info, "info.json")
 
+    def heartbeat_delta_event(self, delta, beat_time):
+        self.run_entry["heartbeat"] = beat_time.isoformat()
+        if delta.result_changed:
+            self.run_entry["result"] = delta.result
+        if delta.captured_out_changed:
+            if delta.captured_out_offset < self.cout_write_cursor:
+                # the captured_out_filter changed text that was already written
+                open(os.path.join(self.dir, "cout.txt"), "wb").close()
+                self.cout_write_cursor = 0
+            self.cout = delta.apply_captured_out(self.cout)
+            self.save_cout()
+        self.save_json(self.run_entry, "run.json")
+        if delta.info_changed:
+            self.info = delta.apply_info(dict(self.info))
+            self.save_json(self.info, "info.json")
+
     def completed_event(self, stop_time, result):
         self.run_entry["stop_time"] = stop_time.isoformat()
         self.run_entry["result"] = result
         self.run_entry["status"] = "COMPLETED"
 
         self.save_json(self.run_entry, "run.json")
+        self.compact_metrics()
         self.render_template()
 
     def interrupted_event(self, interrupt_time, status):
         self.run_entry["stop_time"] = interrupt_time.isoformat()
         self.run_entry["status"] = status
         self.save_json(self.run_entry, "run.json")
+        self.compact_metrics()
         self.render_template()
 
     def failed_event(self, fail_time, fail_trace):
@@ -257,6 +280,7 @@ class FileStorageObserver(RunObserver):
         self.run_entry["status"] = "FAILED"
         self.run_entry["fail_trace"] = fail_trace
         self.save_json(self.run_entry, "run.json")
+        self.compact_metrics()
         self.render_template()
 
     def resource_event(self, filename):
@@ -266,37 +290,48 @@ class FileStorageObserver(RunObserver):
 
     def artifact_event(self, name, filename, metadata=None, content_type=None):
         self.save_file(filename, name)
-        self.run_entry["artifacts"].append(name)
+        if name not in self.run_entry["artifacts"]:
+            self.run_entry["artifacts"].append(name)
         self.save_json(self.run_entry, "run.json")
 
     def log_metrics(self, metrics_by_name, info):
-        """Store new measurements into metrics.json."""
-        try:
-            metrics_path = os.path.join(self.dir, "metrics.json")
-            with open(metrics_path, "r") as f:
-                saved_metrics = json.load(f)
-        except IOError:
-            # We haven't recorded anything yet. Start Collecting.
-            saved_metrics = {}
-
+        """Append new measurements to metrics.jsonl.
+
+        Each heartbeat only appends one line per metric with the new
+        measurements, so the cost does not grow with the length of the run.
+        Use :py:func:`load_metrics` to read the metrics of a running run.
+        The log is compacted into metrics.json at the end of the run.
+        """
+        lines = []
         for metric_name, metric_ptr in metrics_by_name.items():
-
-            if metric_name not in saved_metrics:
-                saved_metrics[metric_name] = {
-                    "values": [],
-                    "steps": [],
-                    "timestamps": [],
-                }
-
-            saved_metrics[metric_name]["values"] += metric_ptr["values"]
-            saved_metrics[metric_name]["steps"] += metric_ptr["steps"]
-
             # Manually convert them to avoid passing a datetime dtype handler
             # when we're trying to convert into json.
             timestamps_norm = [ts.isoformat() for ts in metric_ptr["timestamps"]]
-            saved_metrics[metric_name]["timestamps"] += timestamps_norm
+            record = {
+                "name": metric_name,
+                "steps": metric_ptr["steps"],
+                "values": metric_ptr["values"],
+                "timestamps": timestamps_norm,
+            }
+            lines.append(json.dumps(flatten(record), sort_keys=True) + "\n")
+        if not lines:
+            return
+        with open(os.path.join(self.dir, METRICS_LOG), "a") as f:
+            f.write("".join(lines))
+            f.flush()
 
-        self.save_json(saved_metrics, "metrics.json")
+    def compact_metrics(self):
+        """Materialize metrics.json from the metrics log and remove the log."""
+        log_path = os.path.join(self.dir, METRICS_LOG)
+        if not os.path.exists(log_path):
+            return
+        metrics_path = os.path.join(self.dir, "metrics.json")
+        tmp_path = metrics_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(load_metrics(self.dir), f, sort_keys=True, indent=2)
+            f.flush()
+        os.replace(tmp_path, metrics_path)
+        os.remove(log_path)
 
     def __eq__(self, other):
         if isinstance(other, FileStorageObserver):
@@ -304,6 +339,61 @@ class FileStorageObserver(RunObserver):
         return False
 
 
+def load_metrics(run_dir: PathType) -> dict:
+    """Read the metrics stored by a FileStorageObserver for a single run.
+
+    Combines the compacted metrics.json (if it exists) with the append-only
+    metrics log of a run that is still going on (or crashed before
+    compaction). Damaged lines of the log (e.g. from a crash in the middle
+    of a write) are skipped with a warning.
+
+    Parameters
+    ----------
+    run_dir
+        The directory of the run.
+
+    Returns
+    -------
+    The metrics in the layout of metrics.json, i.e. a dict that maps each
+    metric name to a dict of steps, values and timestamps lists.
+    """
+    run_dir = str(run_dir)
+    try:
+        with open(os.path.join(run_dir, "metrics.json"), "r") as f:
+            metrics = json.load(f)
+    except IOError:
+        metrics = {}
+
+    try:
+        with open(os.path.join(run_dir, METRICS_LOG), "r") as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.endswith("\n"):
+                    # incomplete last line of an interrupted write
+                    break
+                try:
+                    record = json.loads(line)
+                    name = record["name"]
+                    values = list(record["values"])
+                    steps = list(record["steps"])
+                    timestamps = list(record["timestamps"])
+                except (ValueError, TypeError, KeyError):
+                    logger.warning(
+                        "Skipping damaged line %d of %s",
+                        line_number,
+                        os.path.join(run_dir, METRICS_LOG),
+                    )
+                    continue
+                saved = metrics.setdefault(
+                    name, {"values": [], "steps": [], "timestamps": []}
+                )
+                saved["values"] += values
+                saved["steps"] += steps
+                saved["timestamps"] += timestamps
+    except IOError:
+        pass
+    return metrics
+
+
 @cli_option("-F", "--file_storage")
 def file_storage_option(args, run):
     """Add a file-storage observer to the experiment.
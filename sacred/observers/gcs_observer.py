@@ -300,7 +300,8 @@ class GoogleCloudStorageObserver(RunObserver):
 
     def artifact_event(self, name, filename, metadata=None, content_type=None):
         self.save_file(filename, name)
-        self.run_entry["artifacts"].append(name)
+        if name not in self.run_entry["artifacts"]:
+            self.run_entry["artifacts"].append(name)
         self.save_json(self.run_entry, "run.json")
 
     def log_metrics(self, metrics_by_name, info):
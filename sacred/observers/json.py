@@ -106,7 +106,8 @@ class JSONObserver(RunObserver):
         self.save()
 
     def artifact_event(self, name, filename, metadata=None, content_type=None):
-        self.run_entry['artifacts'].append(name)
+        if name not in self.run_entry['artifacts']:
+            self.run_entry['artifacts'].append(name)
         self.save()
 
     def log_metrics(self, metrics_by_name, info):
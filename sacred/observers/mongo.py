@@ -1,4 +1,5 @@
 from typing import Optional, Union
+import functools
 import mimetypes
 import os.path
 import pickle
@@ -15,14 +16,22 @@ from sacred.observers.base import RunObserver
 from sacred.observers.queue import QueueObserver
 from sacred.serializer import flatten
 from sacred.utils import ObserverError, PathType
-import pkg_resources
 
 DEFAULT_MONGO_PRIORITY = 30
 
-# This ensures consistent mimetype detection across platforms.
-mimetype_detector = mimetypes.MimeTypes(
-    filenames=[pkg_resources.resource_filename("sacred", "data/mime.types")]
-)
+
+@functools.lru_cache(maxsize=None)
+def get_mimetype_detector():
+    """Return a MimeTypes instance that uses the mime.types file of sacred.
+
+    This ensures consistent mimetype detection across platforms. It is
+    created on first use, because parsing the file takes a while.
+    """
+    import pkg_resources
+
+    return mimetypes.MimeTypes(
+        filenames=[pkg_resources.resource_filename("sacred", "data/mime.types")]
+    )
 
 
 def force_valid_bson_key(key):
@@ -56,7 +65,13 @@ def force_bson_encodeable(obj):
             return str(obj)
 
 
+def _is_field_name(key):
+    """Whether key can be used as part of a dotted update path."""
+    return isinstance(key, str) and not key.startswith("$") and "." not in key
+
+
 class MongoObserver(RunObserver):
+    delta_heartbeats = True
     COLLECTION_NAME_BLACKLIST = {
         "fs.files",
         "fs.chunks",
@@ -86,6 +101,7 @@ class MongoObserver(RunObserver):
         priority: int = DEFAULT_MONGO_PRIORITY,
         client: Optional["pymongo.MongoClient"] = None,
         failure_dir: Optional[PathType] = None,
+        metrics_bucket_size: Optional[int] = None,
         **kwargs
     ):
         """Initializer for MongoObserver.
@@ -111,6 +127,10 @@ class MongoObserver(RunObserver):
             Client to connect to. Do not use client and URL together.
         failure_dir
             Directory to save the run of a failed observer to.
+        metrics_bucket_size
+            If set, split each metric into documents of at most this many
+            measurements, instead of a single document per metric that grows
+            with every heartbeat. Use :py:func:`load_metric` to read them.
         """
         import pymongo
         import gridfs
@@ -169,6 +189,7 @@ class MongoObserver(RunObserver):
             metrics_collection=metrics_collection,
             failure_dir=failure_dir,
             priority=priority,
+            metrics_bucket_size=metrics_bucket_size,
         )
 
     def initialize(
@@ -179,10 +200,25 @@ class MongoObserver(RunObserver):
         metrics_collection=None,
         failure_dir=None,
         priority=DEFAULT_MONGO_PRIORITY,
+        metrics_bucket_size=None,
     ):
         self.runs = runs_collection
         self.metrics = metrics_collection
         self.fs = fs
+        if metrics_bucket_size is not None:
+            if metrics_bucket_size < 1:
+                raise ValueError(
+                    "metrics_bucket_size must be positive, "
+                    "but was {}".format(metrics_bucket_size)
+                )
+            if self.metrics is not None:
+                self.metrics.create_index(
+                    [("run_id", 1), ("name", 1), ("bucket", 1)], unique=True
+                )
+        self.metrics_bucket_size = metrics_bucket_size
+        self.metric_counts = {}
+        self._full_save_pending = False
+        self._captured_out_append = True
         if overwrite is not None:
             overwrite = int(overwrite)
             run = self.runs.find_one({"_id": overwrite})
@@ -235,6 +271,7 @@ class MongoObserver(RunObserver):
             # TODO sanity checks
             self.run_entry = self.overwrite
 
+        self.metric_counts = {}
         self.run_entry.update(
             {
                 "experiment": dict(ex_info),
@@ -265,6 +302,39 @@ class MongoObserver(RunObserver):
         self.run_entry["result"] = flatten(result)
         self.save()
 
+    def heartbeat_delta_event(self, delta, beat_time):
+        self.run_entry["heartbeat"] = beat_time
+        fields = {"heartbeat": beat_time}
+        if delta.info_changed:
+            info = self.run_entry["info"]
+            for key in delta.info_removed:
+                info.pop(key, None)
+            updates = flatten(delta.info_updates)
+            info.update(updates)
+            if delta.info_removed or not all(map(_is_field_name, updates)):
+                fields["info"] = info
+            else:
+                for key, value in updates.items():
+                    fields["info." + key] = value
+        captured_out_tail = None
+        if delta.captured_out_changed:
+            captured_out = self.run_entry["captured_out"]
+            self.run_entry["captured_out"] = delta.apply_captured_out(captured_out)
+            if self._captured_out_append and delta.captured_out_offset == len(
+                captured_out
+            ):
+                captured_out_tail = delta.captured_out_tail
+            else:
+                fields["captured_out"] = self.run_entry["captured_out"]
+        if delta.result_changed:
+            self.run_entry["result"] = fields["result"] = flatten(delta.result)
+
+        if self._full_save_pending:
+            # an earlier update got lost, so resend everything
+            self.save()
+        else:
+            self.save_fields(fields, captured_out_tail)
+
     def completed_event(self, stop_time, result):
         self.run_entry["stop_time"] = stop_time
         self.run_entry["result"] = flatten(result)
@@ -308,12 +378,20 @@ class MongoObserver(RunObserver):
                 f, filename=db_filename, metadata=metadata, content_type=content_type
             )
 
-        self.run_entry["artifacts"].append({"name": name, "file_id": file_id})
+        # an artifact that is added again under the same name replaces the old one
+        artifacts = []
+        for artifact in self.run_entry["artifacts"]:
+            if artifact["name"] == name:
+                self.fs.delete(artifact["file_id"])
+            else:
+                artifacts.append(artifact)
+        artifacts.append({"name": name, "file_id": file_id})
+        self.run_entry["artifacts"] = artifacts
         self.save()
 
     @staticmethod
     def _try_to_detect_content_type(filename):
-        mime_type, _ = mimetype_detector.guess_type(filename)
+        mime_type, _ = get_mimetype_detector().guess_type(filename)
         if mime_type is not None:
             print(
                 "Added {} as content-type of artifact {}.".format(mime_type, filename)
@@ -332,25 +410,100 @@ class MongoObserver(RunObserver):
         the metrics collection in the database.
         Additionally, reference the metrics
         in the info["metrics"] dictionary.
+
+        The updates of all metrics are sent to the database
+        as a single ordered bulk write.
         """
+        import pymongo
+
         if self.metrics is None:
             # If, for whatever reason, the metrics collection has not been set
             # do not try to save anything there.
             return
-        for key in metrics_by_name:
-            query = {"run_id": self.run_entry["_id"], "name": key}
-            push = {
-                "steps": {"$each": metrics_by_name[key]["steps"]},
-                "values": {"$each": metrics_by_name[key]["values"]},
-                "timestamps": {"$each": metrics_by_name[key]["timestamps"]},
+        requests = []
+        first_requests = {}
+        metric_counts = {}
+        for key, metric in metrics_by_name.items():
+            if self.metrics_bucket_size is None:
+                updates = [(None, self._metric_push(metric))]
+            else:
+                updates, metric_counts[key] = self._bucketed_metric_updates(key, metric)
+            for bucket, update in updates:
+                query = {"run_id": self.run_entry["_id"], "name": key}
+                if bucket is not None:
+                    query["bucket"] = bucket
+                if bucket in (None, 0):
+                    first_requests[len(requests)] = key
+                requests.append(pymongo.UpdateOne(query, update, upsert=True))
+        if not requests:
+            return
+        result = self.metrics.bulk_write(requests, ordered=True)
+        self.metric_counts.update(metric_counts)
+        for index, upserted_id in sorted(result.upserted_ids.items()):
+            if index in first_requests:
+                # This is the first time we are storing this metric, unless
+                # the run is continued and it is already referenced (e.g. as
+                # a single document from before bucketing was enabled)
+                references = info.setdefault("metrics", [])
+                name = first_requests[index]
+                if all(m.get("name") != name for m in references):
+                    references.append({"name": name, "id": str(upserted_id)})
+
+    @staticmethod
+    def _metric_push(metric):
+        return {
+            "$push": {
+                "steps": {"$each": metric["steps"]},
+                "values": {"$each": metric["values"]},
+                "timestamps": {"$each": metric["timestamps"]},
             }
-            update = {"$push": push}
-            result = self.metrics.update_one(query, update, upsert=True)
-            if result.upserted_id is not None:
-                # This is the first time we are storing this metric
-                info.setdefault("metrics", []).append(
-                    {"name": key, "id": str(result.upserted_id)}
-                )
+        }
+
+    def _bucketed_metric_updates(self, key, metric):
+        """Split new measurements of a metric into updates of fixed-size buckets.
+
+        Returns a list of (bucket, update) pairs and the new number of
+        measurements of that metric in buckets. If the run is continued and
+        the metric was stored as a single document before bucketing was
+        enabled, that document is kept as it is and the buckets hold the
+        measurements that follow it.
+        """
+        if key not in self.metric_counts and self.overwrite is not None:
+            self.metric_counts[key] = self._count_stored_measurements(key)
+        count = self.metric_counts.get(key, 0)
+        length = len(metric["steps"])
+        updates = []
+        start = 0
+        while start < length:
+            bucket, offset = divmod(count, self.metrics_bucket_size)
+            end = min(length, start + self.metrics_bucket_size - offset)
+            chunk = {k: metric[k][start:end] for k in ["steps", "values", "timestamps"]}
+            update = self._metric_push(chunk)
+            update["$inc"] = {"count": end - start}
+            update["$min"] = {"min_step": min(chunk["steps"])}
+            update["$max"] = {"max_step": max(chunk["steps"])}
+            values = chunk["values"]
+            if all(
+                isinstance(v, (int, float)) and not isinstance(v, bool) for v in values
+            ):
+                update["$inc"]["sum"] = sum(values)
+                update["$min"]["min_value"] = min(values)
+                update["$max"]["max_value"] = max(values)
+            updates.append((bucket, update))
+            count += end - start
+            start = end
+        return updates, count
+
+    def _count_stored_measurements(self, key):
+        import pymongo
+
+        last_bucket = self.metrics.find_one(
+            {"run_id": self.run_entry["_id"], "name": key, "bucket": {"$exists": True}},
+            sort=[("bucket", pymongo.DESCENDING)],
+        )
+        if last_bucket is None:
+            return 0
+        return last_bucket["bucket"] * self.metrics_bucket_size + last_bucket["count"]
 
     def insert(self):
         import pymongo.errors
@@ -385,13 +538,45 @@ class MongoObserver(RunObserver):
             self.runs.update_one(
                 {"_id": self.run_entry["_id"]}, {"$set": self.run_entry}
             )
+            self._full_save_pending = False
         except pymongo.errors.AutoReconnect:
-            pass  # just wait for the next save
+            self._full_save_pending = True  # just wait for the next save
         except pymongo.errors.InvalidDocument:
             raise ObserverError(
                 "Run contained an unserializable entry." "(most likely in the info)"
             )
 
+    def save_fields(self, fields, captured_out_tail=None):
+        """Update only the given (possibly dotted) fields of the run entry.
+
+        If captured_out_tail is given, it is appended to the stored
+        captured_out on the server, using an update pipeline.
+        """
+        import pymongo.errors
+
+        if captured_out_tail is None:
+            update = {"$set": fields}
+        else:
+            stage = {key: {"$literal": value} for key, value in fields.items()}
+            stage["captured_out"] = {
+                "$concat": ["$captured_out", {"$literal": captured_out_tail}]
+            }
+            update = [{"$set": stage}]
+        try:
+            self.runs.update_one({"_id": self.run_entry["_id"]}, update)
+        except pymongo.errors.AutoReconnect:
+            self._full_save_pending = True  # just wait for the next save
+        except pymongo.errors.InvalidDocument:
+            raise ObserverError(
+                "Run contained an unserializable entry." "(most likely in the info)"
+            )
+        except pymongo.errors.OperationFailure:
+            if captured_out_tail is None:
+                raise
+            # update pipelines need MongoDB 4.2, so fall back to plain updates
+            self._captured_out_append = False
+            self.save()
+
     def final_save(self, attempts):
         import pymongo.errors
 
@@ -452,6 +637,53 @@ class MongoObserver(RunObserver):
         return False
 
 
+def load_metric(metrics_collection, run_id, name):
+    """Read the full series of a metric from the metrics collection.
+
+    Works for metrics that are stored as a single document as well as for
+    metrics that are split into buckets (see the ``metrics_bucket_size``
+    argument of :py:class:`MongoObserver`), and for a run that was continued
+    with buckets after storing the metric as a single document. The
+    measurements of that single document come first.
+
+    Parameters
+    ----------
+    metrics_collection
+        The pymongo collection in which the metrics are stored.
+    run_id
+        The ``_id`` of the run the metric belongs to.
+    name
+        The name of the metric, e.g. training.loss
+
+    Returns
+    -------
+    A dict with the name, run_id and the concatenated steps, values and
+    timestamps of the metric, or None if no such metric exists.
+    """
+    import pymongo
+
+    documents = list(
+        metrics_collection.find(
+            {"run_id": run_id, "name": name}, sort=[("bucket", pymongo.ASCENDING)]
+        )
+    )
+    # the single document of the unbucketed layout precedes any buckets
+    documents.sort(key=lambda document: "bucket" in document)
+    metric = None
+    for document in documents:
+        if metric is None:
+            metric = {
+                "name": name,
+                "run_id": run_id,
+                "steps": [],
+                "values": [],
+                "timestamps": [],
+            }
+        for key in ["steps", "values", "timestamps"]:
+            metric[key] += document[key]
+    return metric
+
+
 @cli_option("-m", "--mongo_db")
 def mongo_db_option(args, run):
     """Add a MongoDB Observer to the experiment.
@@ -531,31 +763,8 @@ def parse_mongo_db_arg(mongo_db):
 
 
 class QueueCompatibleMongoObserver(MongoObserver):
-    def log_metrics(self, metric_name, metrics_values, info):
-        """Store new measurements to the database.
-
-        Take measurements and store them into
-        the metrics collection in the database.
-        Additionally, reference the metrics
-        in the info["metrics"] dictionary.
-        """
-        if self.metrics is None:
-            # If, for whatever reason, the metrics collection has not been set
-            # do not try to save anything there.
-            return
-        query = {"run_id": self.run_entry["_id"], "name": metric_name}
-        push = {
-            "steps": {"$each": metrics_values["steps"]},
-            "values": {"$each": metrics_values["values"]},
-            "timestamps": {"$each": metrics_values["timestamps"]},
-        }
-        update = {"$push": push}
-        result = self.metrics.update_one(query, update, upsert=True)
-        if result.upserted_id is not None:
-            # This is the first time we are storing this metric
-            info.setdefault("metrics", []).append(
-                {"name": metric_name, "id": str(result.upserted_id)}
-            )
+    # the queue retries failed events, which must not append output twice
+    delta_heartbeats = False
 
     def save(self):
         import pymongo
@@ -617,6 +826,7 @@ class QueuedMongoObserver(QueueObserver):
         self,
         interval: float = 20.0,
         retry_interval: float = 10.0,
+        max_retry_interval: Optional[float] = None,
         url: Optional[str] = None,
         db_name: str = "sacred",
         collection: str = "runs",
@@ -633,6 +843,9 @@ class QueuedMongoObserver(QueueObserver):
             The interval in seconds at which the background thread is woken up to process new events.
         retry_interval
             The interval in seconds to wait if an event failed to be processed.
+        max_retry_interval
+            Upper bound for the exponentially growing retry interval.
+            Defaults to 30 times the retry_interval.
         url
             Mongo URI to connect to.
         db_name
@@ -660,4 +873,5 @@ class QueuedMongoObserver(QueueObserver):
             ),
             interval=interval,
             retry_interval=retry_interval,
+            max_retry_interval=max_retry_interval,
         )
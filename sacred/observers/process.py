@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Run an observer in a separate helper process.
+
+The serialization and I/O of observers (``flatten``, JSON and BSON encoding,
+uploads, hashing) otherwise runs on threads of the experiment process and
+competes with it for the GIL.
+"""
+
+import copy
+import logging
+import multiprocessing
+import pickle
+import signal
+import threading
+
+from sacred.observers.base import RunObserver
+from sacred.utils import ObserverError
+
+__all__ = ("ProcessObserver",)
+
+logger = logging.getLogger(__name__)
+
+# Events the experiment waits for: the ID of the run, files that may be
+# deleted right after the call, changes of log_metrics to the info, and the
+# end of the run.
+SYNCHRONOUS_EVENTS = (
+    "queued_event",
+    "started_event",
+    "artifact_event",
+    "log_metrics",
+    "completed_event",
+    "interrupted_event",
+    "failed_event",
+    "join",
+)
+
+_STOP = "_stop"
+_UPDATE_META_INFO = "_update_meta_info"
+
+
+class ProcessObserver(RunObserver):
+    """Passes all events to an observer that runs in a helper process.
+
+    The events are sent over a pipe. The helper process calls the covered
+    observer, so all of its serialization and I/O happens there. Only the
+    events the run has to wait for (the queued, started, artifact and
+    terminal events, log_metrics and join) wait for the helper to confirm
+    them, and their exceptions are raised again in the experiment process.
+    Exceptions of the other events are logged by the helper process.
+
+    The helper process is started with the default start method of
+    :mod:`multiprocessing`. With ``fork`` (the default on Linux) it gets a
+    copy of the covered observer; with ``spawn`` the observer must be
+    picklable. The process is started by :meth:`start`, or by the first
+    event. Starting it before the run starts (as the ``--observer_process``
+    flag does) is best, because the process then does not inherit the
+    redirected stdout and stderr and no other threads are running.
+
+    Values that cannot be pickled are sent in their flattened form (see
+    :func:`sacred.serializer.flatten`).
+
+    Observers may change the arguments of their events, and the run relies
+    on some of these changes: the entries that ``log_metrics`` adds to the
+    info (e.g. the metric references of the MongoObserver) are sent back and
+    applied to the info of the run, and the meta_info of the started_event
+    is updated in the helper process before the final event, since the run
+    adds the observer stats to it.
+    """
+
+    def __init__(self, covered_observer: RunObserver):
+        self._covered_observer = covered_observer
+        self.priority = covered_observer.priority
+        self.delta_heartbeats = getattr(covered_observer, "delta_heartbeats", False)
+        self._process = None
+        self._connection = None
+        self._meta_info = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the helper process, unless it is running already."""
+        with self._lock:
+            if self._process is not None:
+                return
+            context = multiprocessing.get_context()
+            self._connection, child_connection = context.Pipe()
+            self._process = context.Process(
+                target=_host_observer,
+                args=(self._covered_observer, child_connection),
+                name="sacred-observer-host",
+                daemon=True,
+            )
+            self._process.start()
+            child_connection.close()
+
+    def _send(self, method, args, kwargs):
+        self.start()
+        with self._lock:
+            try:
+                try:
+                    self._connection.send((method, args, kwargs))
+                except _PICKLING_ERRORS:
+                    self._connection.send(
+                        (
+                            method,
+                            [_picklable(a) for a in args],
+                            {k: _picklable(v) for k, v in kwargs.items()},
+                        )
+                    )
+                if method not in SYNCHRONOUS_EVENTS:
+                    return None
+                while not self._connection.poll(1.0):
+                    if not self._process.is_alive():
+                        raise EOFError()
+                ok, result = self._connection.recv()
+            except (EOFError, OSError) as e:
+                raise ObserverError(
+                    "The observer process of {!r} died.".format(self._covered_observer)
+                ) from e
+        if not ok:
+            raise ObserverError(
+                "{} failed in the observer process:\n{}".format(method, result)
+            )
+        return result
+
+    def queued_event(self, *args, **kwargs):
+        return self._send("queued_event", args, kwargs)
+
+    def started_event(self, *args, **kwargs):
+        self._meta_info = kwargs.get("meta_info")
+        return self._send("started_event", args, kwargs)
+
+    def _send_final(self, method, args, kwargs):
+        if self._meta_info is not None:
+            self._send(_UPDATE_META_INFO, (self._meta_info,), {})
+        self._send(method, args, kwargs)
+
+    def heartbeat_event(self, *args, **kwargs):
+        self._send("heartbeat_event", args, kwargs)
+
+    def heartbeat_delta_event(self, *args, **kwargs):
+        self._send("heartbeat_delta_event", args, kwargs)
+
+    def completed_event(self, *args, **kwargs):
+        self._send_final("completed_event", args, kwargs)
+
+    def interrupted_event(self, *args, **kwargs):
+        self._send_final("interrupted_event", args, kwargs)
+
+    def failed_event(self, *args, **kwargs):
+        self._send_final("failed_event", args, kwargs)
+
+    def resource_event(self, *args, **kwargs):
+        self._send("resource_event", args, kwargs)
+
+    def artifact_event(self, *args, **kwargs):
+        self._send("artifact_event", args, kwargs)
+
+    def log_metrics(self, metrics_by_name, info):
+        changes = self._send("log_metrics", (metrics_by_name, info), {})
+        if changes:
+            info.update(changes)
+
+    def join(self):
+        """Wait until the helper processed everything, then stop it."""
+        if self._process is None:
+            return
+        try:
+            self._send("join", (), {})
+            with self._lock:
+                self._connection.send((_STOP, (), {}))
+        finally:
+            self._process.join()
+            self._connection.close()
+            with self._lock:
+                self._process = None
+
+    def __eq__(self, other):
+        return self._covered_observer == other
+
+    def __repr__(self):
+        return "ProcessObserver({!r})".format(self._covered_observer)
+
+
+_PICKLING_ERRORS = (pickle.PicklingError, TypeError, AttributeError)
+
+
+def _picklable(value):
+    """Return value, with the parts that cannot be pickled flattened.
+
+    Only the offending values are flattened, so e.g. the datetimes next to
+    an unpicklable entry of the info keep their type.
+    """
+    try:
+        pickle.dumps(value)
+        return value
+    except _PICKLING_ERRORS:
+        pass
+    if isinstance(value, dict):
+        return {k: _picklable(v) for k, v in value.items()}
+    if type(value) in (list, tuple):
+        return type(value)(_picklable(v) for v in value)
+    state = getattr(value, "__dict__", None)
+    if isinstance(state, dict):
+        # e.g. a HeartbeatDelta with an unpicklable info update
+        clone = copy.copy(value)
+        clone.__dict__ = {k: _picklable(v) for k, v in state.items()}
+        try:
+            pickle.dumps(clone)
+            return clone
+        except _PICKLING_ERRORS:
+            pass
+    from sacred.serializer import flatten
+
+    return flatten(value)
+
+
+def _pickled_values(info):
+    pickled = {}
+    for key, value in info.items():
+        try:
+            pickled[key] = pickle.dumps(value)
+        except _PICKLING_ERRORS:
+            pass
+    return pickled
+
+
+def _log_metrics(observer, metrics_by_name, info):
+    """Call log_metrics and return the entries it changed in info."""
+    before = _pickled_values(info)
+    observer.log_metrics(metrics_by_name, info)
+    after = _pickled_values(info)
+    return {key: info[key] for key, value in after.items() if before.get(key) != value}
+
+
+def _host_observer(observer, connection):
+    """Main function of the helper process."""
+    # Ctrl-C is meant for the experiment, which still sends the final events
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    meta_info = None
+    while True:
+        try:
+            method, args, kwargs = connection.recv()
+        except EOFError:  # the experiment process is gone
+            break
+        if method == _STOP:
+            break
+        try:
+            if method == _UPDATE_META_INFO:
+                # the observer may hold on to the dict of the started_event
+                meta_info.update(args[0])
+                continue
+            if method == "started_event":
+                meta_info = kwargs.get("meta_info")
+            if method == "log_metrics":
+                result = _log_metrics(observer, *args, **kwargs)
+            else:
+                result = getattr(observer, method)(*args, **kwargs)
+        except Exception as e:
+            logger.exception("Error in %s of %r", method, observer)
+            if method in SYNCHRONOUS_EVENTS:
+                connection.send((False, "{}: {}".format(type(e).__name__, e)))
+        else:
+            if method in SYNCHRONOUS_EVENTS:
+                try:
+                    connection.send((True, result))
+                except (pickle.PicklingError, TypeError, AttributeError):
+                    connection.send((True, None))
+    connection.close()
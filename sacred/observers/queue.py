@@ -1,7 +1,17 @@
-from collections import namedtuple
-from queue import Queue
+from collections import Counter, deque, namedtuple, OrderedDict
+from typing import Optional
 from sacred.observers.base import RunObserver
+from sacred.observers.write_ahead_log import WriteAheadLog
 from sacred.utils import IntervalTimer
+import inspect
+import itertools
+import threading
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
 import traceback
 import logging
 
@@ -9,21 +19,60 @@ logger = logging.getLogger(__name__)
 
 WrappedEvent = namedtuple("WrappedEvent", "name args kwargs")
 
+TERMINAL_EVENTS = ("completed_event", "interrupted_event", "failed_event")
+
+# The order in which events are dropped if the queue is full. The newest
+# heartbeat is only dropped as a last resort, since it holds the latest state.
+DROP_ORDER = (
+    "heartbeat_event",
+    "log_metrics",
+    "resource_event",
+    "artifact_event",
+    "newest_heartbeat_event",
+)
+
 
 class QueueObserver(RunObserver):
     """Wraps any observer and puts processing of events in the background.
 
+    Only the ``started_event`` (which determines the run ID) and the
+    ``queued_event`` are passed on synchronously. All other events are put
+    on a queue and processed by a background thread (write-behind), so
+    slow observers do not block the run or its heartbeats. The terminal
+    events (completed, interrupted and failed) wait until the queue has
+    been processed.
+
     If the covered observer fails to process an event, the queue observer
-    will retry until it works. This is useful for observers that rely on
-    external services like databases that might become temporarily
-    unavailable.
+    will retry until it works (or max_retries is reached, which does not
+    apply to terminal events), waiting exponentially longer between the
+    attempts. This is useful for
+    observers that rely on external services like databases that might
+    become temporarily unavailable.
+
+    The queue can be bounded by max_queue_size and max_queue_bytes. If it is
+    full, the oldest heartbeats are dropped first (the newest one contains
+    their information anyway), then the oldest metrics, resources and
+    artifacts, and finally the newest heartbeat. Terminal events are never
+    dropped. See :attr:`stats` for the
+    current state of the queue.
     """
 
+    # retrying a partially processed delta could apply it twice, so the
+    # covered observer always receives full heartbeats
+    delta_heartbeats = False
+
     def __init__(
         self,
         covered_observer: RunObserver,
         interval: float = 20.0,
         retry_interval: float = 10.0,
+        max_retry_interval: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        join_timeout: Optional[float] = None,
+        wal_dir: Optional[str] = None,
+        wal_sync_interval: float = 1.0,
+        max_queue_size: Optional[int] = None,
+        max_queue_bytes: Optional[int] = None,
     ):
         """Initialize QueueObserver.
 
@@ -35,102 +84,364 @@ class QueueObserver(RunObserver):
             The interval in seconds at which the background thread is woken up to process new events.
         retry_interval
             The interval in seconds to wait if an event failed to be processed.
+            It doubles with every further failure of the same event, with
+            random jitter of +-50% so that many runs do not retry in lockstep.
+        max_retry_interval
+            Upper bound in seconds for the interval between two retries.
+            Defaults to 30 times the retry_interval.
+        max_retries
+            How often a failed event is retried before it is dropped.
+            None retries until the observer is joined and join_timeout passed.
+            Terminal events are always retried until the join_timeout.
+        join_timeout
+            Seconds that join waits for the remaining events at the end of the
+            run. Events that are still not processed then are dropped (and
+            logged as errors if they are terminal events).
+            None (the default) waits until all events are processed.
+        wal_dir
+            Directory for a write-ahead log of the queued events, so they
+            survive a crash of the process. Use
+            :func:`~sacred.observers.write_ahead_log.replay_write_ahead_logs`
+            to process what is left over. None keeps the events only in memory.
+        wal_sync_interval
+            Seconds between two syncs of the write-ahead log to the disk.
+        max_queue_size
+            Maximum number of queued events. None means unbounded.
+        max_queue_bytes
+            Maximum (estimated) size of the queued events in bytes.
+            None means unbounded.
         """
         self._covered_observer = covered_observer
         self._retry_interval = retry_interval
+        self._max_retry_interval = (
+            30 * retry_interval if max_retry_interval is None else max_retry_interval
+        )
+        self._max_queue_size = max_queue_size
+        self._max_queue_bytes = max_queue_bytes
+        self._queue_bytes = 0
+        self.dropped_events = Counter()
+        """Number of events dropped, by event name"""
+        self.failed_attempts = 0
+        """Number of failed calls of the covered observer"""
         self._interval = interval
+        self._max_retries = max_retries
+        self._join_timeout = join_timeout
+        self._give_up_event = threading.Event()
         self._queue = None
         self._worker = None
         self._stop_worker_event = None
-        logger.debug("just testing")
+        self._artifact_dir = None
+        self._artifact_counter = itertools.count()
+        self._wal_dir = wal_dir
+        self._wal_sync_interval = wal_sync_interval
+        self._wal = None
+        self._lock = threading.Lock()
+
+    @property
+    def priority(self):
+        return self._covered_observer.priority
 
     def queued_event(self, *args, **kwargs):
-        self._queue.put(WrappedEvent("queued_event", args, kwargs))
+        # there is no run to process events in the background for
+        return self._covered_observer.queued_event(*args, **kwargs)
 
     def started_event(self, *args, **kwargs):
-        self._queue = Queue()
+        self._queue = deque()
+        self._queue_bytes = 0
         self._stop_worker_event, self._worker = IntervalTimer.create(
             self._run, interval=self._interval
         )
+        # a stuck covered observer must not keep the process alive
+        self._worker.daemon = True
         self._worker.start()
 
         # Putting the started event on the queue makes no sense
         # as it is required for initialization of the covered observer.
-        return self._covered_observer.started_event(*args, **kwargs)
+        _id = self._covered_observer.started_event(*args, **kwargs)
+        if self._wal_dir is not None:
+            started = inspect.signature(RunObserver.started_event).bind(
+                self, *args, **kwargs
+            )
+            started = dict(started.arguments, _id=_id)
+            del started["self"]
+            self._wal = WriteAheadLog.create(
+                self._wal_dir, started, self._wal_sync_interval
+            )
+            self._artifact_dir = self._wal.artifact_dir
+        return _id
+
+    def _put(self, name, args, kwargs):
+        event = WrappedEvent(name, args, kwargs)
+        with self._lock:
+            if self._wal is not None:
+                try:
+                    self._wal.append(*event)
+                except Exception as e:
+                    logger.warning(
+                        "Could not write %s to the write-ahead log: %s", name, e
+                    )
+            size = estimate_size(event) if self._max_queue_bytes is not None else 0
+            self._queue.append((event, size))
+            self._queue_bytes += size
+            self._enforce_bounds()
+
+    def _is_full(self):
+        return (
+            self._max_queue_size is not None and len(self._queue) > self._max_queue_size
+        ) or (
+            self._max_queue_bytes is not None
+            and self._queue_bytes > self._max_queue_bytes
+        )
+
+    def _enforce_bounds(self):
+        """Drop queued events until the queue fits its bounds again."""
+        for name in DROP_ORDER:
+            if not self._is_full():
+                return
+            newest_heartbeat = None
+            for event, _ in self._queue:
+                if event.name == "heartbeat_event":
+                    newest_heartbeat = event
+            kept = deque()
+            for event, size in self._queue:
+                if event.name == "heartbeat_event":
+                    droppable = (event is newest_heartbeat) == (
+                        name == "newest_heartbeat_event"
+                    )
+                else:
+                    droppable = event.name == name
+                if droppable and self._is_full():
+                    self._drop(event, size)
+                else:
+                    kept.append((event, size))
+            self._queue = kept
+
+    def _drop(self, event, size):
+        self._queue_bytes -= size
+        if not self.dropped_events:
+            logger.warning("The queue of %s is full. Dropping the oldest events.", self)
+        self.dropped_events[event.name] += 1
+        if event.name == "artifact_event":
+            shutil.rmtree(os.path.dirname(event.args[1]), ignore_errors=True)
+
+    def _discard(self, event, reason):
+        """Count and log an event that the covered observer never received."""
+        with self._lock:
+            self.dropped_events[event.name] += 1
+        # a lost terminal event leaves the run without its final status
+        log = logger.error if event.name in TERMINAL_EVENTS else logger.warning
+        log("%s dropped %s %s.", self, event.name, reason)
+
+    @property
+    def stats(self):
+        """Current queue depth and counters, e.g. for monitoring."""
+        with self._lock:
+            return {
+                "queue_depth": len(self._queue) if self._queue is not None else 0,
+                "queue_bytes": self._queue_bytes,
+                "dropped_events": dict(self.dropped_events),
+                "failed_attempts": self.failed_attempts,
+            }
 
     def heartbeat_event(self, *args, **kwargs):
-        self._queue.put(WrappedEvent("heartbeat_event", args, kwargs))
+        self._put("heartbeat_event", args, kwargs)
 
     def completed_event(self, *args, **kwargs):
-        self._queue.put(WrappedEvent("completed_event", args, kwargs))
+        self._put("completed_event", args, kwargs)
         self.join()
 
     def interrupted_event(self, *args, **kwargs):
-        self._queue.put(WrappedEvent("interrupted_event", args, kwargs))
+        self._put("interrupted_event", args, kwargs)
         self.join()
 
     def failed_event(self, *args, **kwargs):
-        self._queue.put(WrappedEvent("failed_event", args, kwargs))
+        self._put("failed_event", args, kwargs)
         self.join()
 
     def resource_event(self, *args, **kwargs):
-        self._queue.put(WrappedEvent("resource_event", args, kwargs))
+        self._put("resource_event", args, kwargs)
 
-    def artifact_event(self, *args, **kwargs):
-        self._queue.put(WrappedEvent("artifact_event", args, kwargs))
+    def artifact_event(self, name, filename, *args, **kwargs):
+        # The run may delete the file as soon as this returns,
+        # so the queue works on a copy of it.
+        filename = self._copy_artifact(filename)
+        self._put("artifact_event", (name, filename) + args, kwargs)
 
     def log_metrics(self, metrics_by_name, info):
-        for metric_name, metric_values in metrics_by_name.items():
-            self._queue.put(
-                WrappedEvent("log_metrics", [metric_name, metric_values, info], {})
-            )
+        self._put("log_metrics", [metrics_by_name, info], {})
 
-    def _run(self):
-        """Empty the queue every interval."""
-        while not self._queue.empty():
+    def _copy_artifact(self, filename):
+        if self._artifact_dir is None:
+            self._artifact_dir = tempfile.mkdtemp(prefix="sacred_queue_")
+        # keep the basename, since some observers use it
+        target_dir = os.path.join(self._artifact_dir, str(next(self._artifact_counter)))
+        os.mkdir(target_dir)
+        target = os.path.join(target_dir, os.path.basename(filename))
+        shutil.copyfile(filename, target)
+        return target
+
+    def _process(self, event):
+        try:
+            method = getattr(self._covered_observer, event.name)
+        except AttributeError:
+            # The covered observer does not implement an event handler
+            # for the event, so just discard the message.
+            return
+        failures = 0
+        while True:
             try:
-                event = self._queue.get()
-            except IndexError:
-                # Currently there is no event on the queue so
-                # just go back to sleep.
-                pass
+                method(*event.args, **event.kwargs)
+            except Exception:
+                failures += 1
+                self.failed_attempts += 1
+                if (
+                    self._max_retries is not None
+                    and failures > self._max_retries
+                    and event.name not in TERMINAL_EVENTS
+                ) or self._give_up_event.is_set():
+                    self._discard(
+                        event,
+                        "after {} failed attempts:\n{}".format(
+                            failures, traceback.format_exc()
+                        ),
+                    )
+                    return
+                # Something went wrong during the processing of
+                # the event so wait for some time and
+                # then try again.
+                logger.debug(
+                    "Error while processing event. Trying again.\n{}".format(
+                        traceback.format_exc()
+                    )
+                )
+                self._give_up_event.wait(self._get_retry_delay(failures))
             else:
+                return
+
+    def _get_retry_delay(self, failures):
+        delay = min(
+            self._retry_interval * 2 ** min(failures - 1, 32), self._max_retry_interval
+        )
+        return delay * random.uniform(0.5, 1.5)
+
+    def _run(self):
+        """Empty the queue every interval."""
+        while self._queue:
+            with self._lock:
+                backlog = [event for event, _ in self._queue]
+                self._queue = deque()
+                self._queue_bytes = 0
+                # the old segment contains exactly the events of the backlog
+                wal = self._wal
+                segment = wal.rotate() if wal is not None else None
+            for event in coalesce_events(backlog):
+                if self._give_up_event.is_set():
+                    self._discard(event, "after the join timeout")
+                    continue  # but keep it in the write-ahead log
                 try:
-                    method = getattr(self._covered_observer, event.name)
-                except NameError:
-                    # The covered observer does not implement an event handler
-                    # for the event, so just discard the message.
-                    self._queue.task_done()
-                else:
-                    while True:
-                        try:
-                            method(*event.args, **event.kwargs)
-                        except:
-                            # Something went wrong during the processing of
-                            # the event so wait for some time and
-                            # then try again.
-                            logger.debug(
-                                "Error while processing event. Trying again.\n{}".format(
-                                    traceback.format_exc()
-                                )
-                            )
-                            # logging.debug(f"""Error while processing event. Trying again.
-                            # {traceback.format_exc()}""")
-
-                            self._stop_worker_event.wait(self._retry_interval)
-                            continue
-                        else:
-                            self._queue.task_done()
-                            break
+                    self._process(event)
+                finally:
+                    if event.name == "artifact_event":
+                        shutil.rmtree(
+                            os.path.dirname(event.args[1]), ignore_errors=True
+                        )
+            if segment is not None and not self._give_up_event.is_set():
+                wal.acknowledge(segment)
 
     def join(self):
         if self._queue is not None:
-            self._queue.join()
+            # wakes the worker, which processes the remaining events and stops
             self._stop_worker_event.set()
-            self._worker.join(timeout=10)
+            self._worker.join(timeout=self._join_timeout)
+            if self._worker.is_alive():
+                logger.warning(
+                    "%s could not process its events within %s seconds. "
+                    "Dropping the remaining ones.",
+                    self,
+                    self._join_timeout,
+                )
+                self._give_up_event.set()
+            with self._lock:
+                wal, self._wal = self._wal, None
+            if self._give_up_event.is_set():
+                if wal is not None:
+                    wal.close()
+                    logger.warning(
+                        "The unprocessed events were kept in the write-ahead "
+                        "log %s.",
+                        wal.directory,
+                    )
+                    self._artifact_dir = None
+            elif wal is not None:
+                wal.remove()
+                self._artifact_dir = None
+            if self._artifact_dir is not None and not self._queue:
+                shutil.rmtree(self._artifact_dir, ignore_errors=True)
+                self._artifact_dir = None
 
     def __getattr__(self, item):
+        if item == "_covered_observer":  # not initialized (e.g. when copied)
+            raise AttributeError(item)
         return getattr(self._covered_observer, item)
 
     def __eq__(self, other):
         return self._covered_observer == other
+
+    def __repr__(self):
+        return "QueueObserver({!r})".format(self._covered_observer)
+
+
+def coalesce_events(events):
+    """Shrink a backlog of events without changing the final state.
+
+    Heartbeats carry the full state of the run, so every heartbeat that is
+    followed by a newer one is dropped. Adjacent log_metrics events (which
+    are adjacent once the heartbeats between them are gone) are merged into
+    one, with the measurements of each metric in their original order.
+    """
+    last_heartbeat = None
+    for i, event in enumerate(events):
+        if event.name == "heartbeat_event":
+            last_heartbeat = i
+    coalesced = []
+    for i, event in enumerate(events):
+        if event.name == "heartbeat_event" and i != last_heartbeat:
+            continue
+        if (
+            event.name == "log_metrics"
+            and coalesced
+            and coalesced[-1].name == "log_metrics"
+        ):
+            event = _merge_log_metrics(coalesced.pop(), event)
+        coalesced.append(event)
+    return coalesced
+
+
+def _merge_log_metrics(first, second):
+    merged = OrderedDict()
+    for metrics_by_name in (first.args[0], second.args[0]):
+        for name, metric in metrics_by_name.items():
+            if name not in merged:
+                merged[name] = {
+                    k: list(v) if isinstance(v, list) else v for k, v in metric.items()
+                }
+                continue
+            for key, values in metric.items():
+                if isinstance(values, list):
+                    merged[name].setdefault(key, []).extend(values)
+    # the newer info contains everything the older one does
+    return WrappedEvent("log_metrics", [merged, second.args[1]], {})
+
+
+def estimate_size(obj):
+    """Roughly estimate the memory used by obj and its contents in bytes."""
+    if isinstance(obj, (str, bytes)):
+        return len(obj)
+    if isinstance(obj, dict):
+        return sum(estimate_size(k) + estimate_size(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return sum(estimate_size(v) for v in obj)
+    nbytes = getattr(obj, "nbytes", None)  # numpy arrays
+    if isinstance(nbytes, int):
+        return nbytes
+    return sys.getsizeof(obj)
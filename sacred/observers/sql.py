@@ -136,6 +136,21 @@ class SqlObserver(RunObserver):
         self.run.artifacts.append(a)
         self.save()
 
+    def log_metrics(self, metrics_by_name, info):
+        """Store new measurements in the metric table.
+
+        All measurements of a heartbeat are written with a single bulk insert
+        instead of creating an ORM object per measurement.
+        """
+        from .sql_bases import Metric
+
+        rows = Metric.rows(self.run.run_id, metrics_by_name)
+        if not rows:
+            return
+        with self.lock:
+            self.session.execute(Metric.__table__.insert(), rows)
+            self.session.commit()
+
     def save(self):
         with self.lock:
             self.session.commit()
@@ -146,6 +161,30 @@ class SqlObserver(RunObserver):
         run = self.session.query(Run).filter_by(id=_id).first()
         return run.to_json()
 
+    def query_metrics(self, run_id):
+        """Read all metrics of a run in the format of the metrics logger.
+
+        Returns a dict that maps each metric name to a dict of steps,
+        values and timestamps lists, ordered by step.
+        """
+        from .sql_bases import Metric
+
+        metrics = {}
+        rows = (
+            self.session.query(Metric)
+            .filter_by(run_id=str(run_id))
+            .order_by(Metric.name, Metric.step, Metric.metric_id)
+        )
+        for row in rows:
+            measurement = row.to_json()
+            metric = metrics.setdefault(
+                measurement["name"], {"steps": [], "values": [], "timestamps": []}
+            )
+            metric["steps"].append(measurement["step"])
+            metric["values"].append(measurement["value"])
+            metric["timestamps"].append(measurement["timestamp"])
+        return metrics
+
     def __eq__(self, other):
         if isinstance(other, SqlObserver):
             # fixme: this will probably fail to detect two equivalent engines
@@ -317,3 +317,40 @@ class Run(Base):
             "captured_out": self.captured_out,
             "fail_trace": self.fail_trace,
         }
+
+
+class Metric(Base):
+    __tablename__ = "metric"
+    __table_args__ = (sa.Index("ix_metric_run_name_step", "run_id", "name", "step"),)
+
+    metric_id = sa.Column(sa.Integer, primary_key=True)
+    run_id = sa.Column(sa.String(24), sa.ForeignKey("run.run_id"))
+    name = sa.Column(sa.String(256))
+    step = sa.Column(sa.Integer)
+    value = sa.Column(sa.Float)
+    timestamp = sa.Column(sa.DateTime)
+
+    @classmethod
+    def rows(cls, run_id, metrics_by_name):
+        """Convert measurements to rows for a bulk insert into the table."""
+        return [
+            {
+                "run_id": run_id,
+                "name": name,
+                "step": step,
+                "value": value,
+                "timestamp": timestamp,
+            }
+            for name, metric in metrics_by_name.items()
+            for step, value, timestamp in zip(
+                metric["steps"], metric["values"], metric["timestamps"]
+            )
+        ]
+
+    def to_json(self):
+        return {
+            "name": self.name,
+            "step": self.step,
+            "value": self.value,
+            "timestamp": self.timestamp,
+        }
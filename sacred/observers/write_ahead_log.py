@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Durable on-disk log of the events of a :class:`~sacred.observers.QueueObserver`.
+
+Every run gets its own directory inside the WAL directory::
+
+    <wal_dir>/<hostname>-<pid>-<random>/
+        started.json        the started_event, including the run ID
+        owner.json          hostname and pid of the process that writes it
+        events-000001.jsonl queued events, one json document per line
+        artifacts/          copies of the artifacts that were queued
+        replayed.json       how many events a replay already sent
+
+Events are appended before they are queued and the segments are deleted as
+soon as the covered observer processed all events in them. Once the run
+ended and everything was processed, the whole directory is removed. What is
+left over after a crash can be sent to an observer with
+:func:`replay_write_ahead_logs` or from the command line::
+
+    python -m sacred.observers.write_ahead_log WAL_DIR -m MONGO_DB
+
+The command line only supports MongoDB, because the observer has to take
+over the run that the original observer started.
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import socket
+import sys
+import time
+import uuid
+
+from sacred.serializer import flatten, restore
+
+__all__ = ("WriteAheadLog", "replay_write_ahead_logs")
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_EVENTS = ("completed_event", "interrupted_event", "failed_event")
+
+
+class WriteAheadLog:
+    """Append-only log of the events of a single run.
+
+    Appended events are written and flushed right away, but only synced to
+    disk (``fsync``) every sync_interval seconds and for terminal events, so
+    a crash of the process loses nothing, while a power loss may lose the
+    events of the last sync_interval seconds.
+    """
+
+    def __init__(self, directory, sync_interval=1.0):
+        self.directory = directory
+        self.sync_interval = sync_interval
+        self.artifact_dir = os.path.join(directory, "artifacts")
+        self._segment_number = 0
+        self._segment = None
+        self._last_sync = time.monotonic()
+        self._open_segment()
+
+    @classmethod
+    def create(cls, wal_dir, started_event, sync_interval=1.0):
+        """Create the log of a new run, given the kwargs of its started_event."""
+        name = "{}-{}-{}".format(
+            socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8]
+        )
+        directory = os.path.join(wal_dir, name)
+        os.makedirs(os.path.join(directory, "artifacts"))
+        _write_json(
+            os.path.join(directory, "owner.json"),
+            {"hostname": socket.gethostname(), "pid": os.getpid()},
+        )
+        _write_json(os.path.join(directory, "started.json"), flatten(started_event))
+        return cls(directory, sync_interval)
+
+    def _open_segment(self):
+        self._segment_number += 1
+        filename = os.path.join(
+            self.directory, "events-{:06d}.jsonl".format(self._segment_number)
+        )
+        self._segment = open(filename, "a", encoding="utf-8")
+
+    def append(self, name, args, kwargs):
+        """Write an event to the current segment."""
+        if name == "artifact_event":
+            # store the path of the copy relative to the log directory
+            args = list(args)
+            args[1] = os.path.relpath(args[1], self.directory)
+        line = json.dumps(flatten({"name": name, "args": list(args), "kwargs": kwargs}))
+        self._segment.write(line + "\n")
+        self._segment.flush()
+        now = time.monotonic()
+        if name in TERMINAL_EVENTS or now - self._last_sync >= self.sync_interval:
+            os.fsync(self._segment.fileno())
+            self._last_sync = now
+
+    def rotate(self):
+        """Start a new segment and return the filename of the previous one.
+
+        The caller deletes it with :meth:`acknowledge` once all of its events
+        were processed.
+        """
+        segment = self._segment
+        segment.close()
+        self._open_segment()
+        return segment.name
+
+    def acknowledge(self, segment):
+        """Delete a segment whose events were all processed."""
+        try:
+            os.remove(segment)
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        """Close the log and keep its files for a replay."""
+        os.fsync(self._segment.fileno())
+        self._segment.close()
+
+    def remove(self):
+        """Close the log and delete it, since all its events were processed."""
+        self._segment.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _write_json(filename, obj):
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _read_json(filename, default):
+    try:
+        with open(filename, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def _is_owner_alive(directory):
+    """Whether the process that writes the log in directory might still run.
+
+    The processes of other hosts cannot be checked, so they count as alive.
+    """
+    owner = _read_json(os.path.join(directory, "owner.json"), None)
+    if not isinstance(owner, dict):
+        return False
+    if owner.get("hostname") != socket.gethostname():
+        return True
+    if owner["pid"] == os.getpid():
+        return False
+    try:
+        os.kill(owner["pid"], 0)
+    except ProcessLookupError:
+        return False
+    except OSError:  # e.g. no permission to signal it, so it exists
+        return True
+    return True
+
+
+def read_events(directory):
+    """Yield the logged events of a run directory as WrappedEvents."""
+    from sacred.observers.queue import WrappedEvent
+
+    segments = sorted(
+        f
+        for f in os.listdir(directory)
+        if f.startswith("events-") and f.endswith(".jsonl")
+    )
+    for segment in segments:
+        with open(os.path.join(directory, segment), encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = restore(json.loads(line))
+                except ValueError:
+                    # the last line may be incomplete if the process crashed
+                    logger.warning("Skipping a damaged event in %s", segment)
+                    continue
+                args = event["args"]
+                if event["name"] == "artifact_event":
+                    args[1] = os.path.join(directory, args[1])
+                yield WrappedEvent(event["name"], args, event["kwargs"])
+
+
+def replay_write_ahead_logs(
+    wal_dir, create_observer, include_active=False, force=False
+):
+    """Send the events left over in wal_dir to new observers.
+
+    Parameters
+    ----------
+    wal_dir
+        The ``wal_dir`` of the QueueObserver.
+    create_observer
+        Function that takes the ID of a run and returns the observer to send
+        its events to. The observer receives the original started_event
+        first, so it has to be able to take over the existing run (e.g. a
+        :class:`~sacred.observers.MongoObserver` with ``overwrite=_id``).
+    include_active
+        Also replay logs of processes on this host that are still running.
+    force
+        Also replay logs that were written on other hosts (e.g. if wal_dir
+        is on a shared file system). Whether their processes still run
+        cannot be checked, so only use it if they do not.
+
+    Returns
+    -------
+    list
+        The IDs of the replayed runs.
+
+    Notes
+    -----
+    The number of sent events is stored in the log after each event, so if a
+    replay fails, the next one only sends the started_event again and
+    continues after the last event that was sent.
+    """
+    from sacred.observers.queue import coalesce_events
+
+    replayed = []
+    if not os.path.isdir(wal_dir):
+        return replayed
+    for name in sorted(os.listdir(wal_dir)):
+        directory = os.path.join(wal_dir, name)
+        started_file = os.path.join(directory, "started.json")
+        if not os.path.isfile(started_file):
+            continue
+        owner = _read_json(os.path.join(directory, "owner.json"), {})
+        hostname = owner.get("hostname") if isinstance(owner, dict) else None
+        foreign = hostname not in (None, socket.gethostname())
+        if foreign and not force:
+            logger.info(
+                "Skipping %s, it was written on the host %s. Use force to "
+                "replay it anyway.",
+                directory,
+                hostname,
+            )
+            continue
+        if not (include_active or foreign) and _is_owner_alive(directory):
+            logger.info("Skipping %s, its process is still running.", directory)
+            continue
+        with open(started_file, encoding="utf-8") as f:
+            started = restore(json.load(f))
+        progress_file = os.path.join(directory, "replayed.json")
+        sent = _read_json(progress_file, {}).get("events", 0)
+        observer = create_observer(started["_id"])
+        observer.started_event(**started)
+        events = coalesce_events(list(read_events(directory)))
+        for i, event in enumerate(events[sent:], start=sent):
+            getattr(observer, event.name)(*event.args, **event.kwargs)
+            _write_json(progress_file, {"events": i + 1})
+        observer.join()
+        shutil.rmtree(directory)
+        replayed.append(started["_id"])
+        logger.info("Replayed the events of run %s", started["_id"])
+    return replayed
+
+
+def main(argv=None):
+    from sacred.observers.mongo import MongoObserver, parse_mongo_db_arg
+
+    parser = argparse.ArgumentParser(
+        prog="python -m sacred.observers.write_ahead_log",
+        description="Send the events of crashed runs that are left over in a "
+        "QueueObserver write-ahead log to MongoDB.",
+    )
+    parser.add_argument("wal_dir", help="the wal_dir of the QueueObserver")
+    parser.add_argument(
+        "-m",
+        "--mongo_db",
+        required=True,
+        help="the database specification, as for the --mongo_db option: "
+        "[host:port:]db_name[.collection]",
+    )
+    parser.add_argument(
+        "--include-active",
+        action="store_true",
+        help="also replay logs of processes that are still running",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="also replay logs that were written on other hosts, whose "
+        "processes cannot be checked",
+    )
+    args = parser.parse_args(argv)
+    kwargs = parse_mongo_db_arg(args.mongo_db)
+
+    class ResumingMongoObserver(MongoObserver):
+        """Takes over an existing run, keeping what was already saved."""
+
+        def started_event(self, *args, **kwargs):
+            saved = {
+                key: self.overwrite[key]
+                for key in (
+                    "info",
+                    "captured_out",
+                    "heartbeat",
+                    "resources",
+                    "artifacts",
+                )
+                if key in self.overwrite
+            }
+            _id = super().started_event(*args, **kwargs)
+            self.run_entry.update(saved)
+            self.save()
+            return _id
+
+    def create_observer(_id):
+        return ResumingMongoObserver(**dict(kwargs, overwrite=_id))
+
+    replayed = replay_write_ahead_logs(
+        args.wal_dir,
+        create_observer,
+        include_active=args.include_active,
+        force=args.force,
+    )
+    print("Replayed {} run(s).".format(len(replayed)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,8 @@
 # coding=utf-8
 
 import importlib
+import sys
+
 from sacred.utils import modules_exist
 from sacred.utils import get_package_version, parse_version
 
@@ -30,26 +32,53 @@ def get_tensorflow():
     return tf
 
 
-# Get libc in a cross-platform way and use it to also flush the c stdio buffers
-# credit to J.F. Sebastians SO answer from here:
-# http://stackoverflow.com/a/22434262/1388435
-try:
-    import ctypes
-    from ctypes.util import find_library
-except ImportError:
-    libc = None
-else:
+def _load_libc():
+    # Get libc in a cross-platform way and use it to also flush the c stdio
+    # buffers. credit to J.F. Sebastians SO answer from here:
+    # http://stackoverflow.com/a/22434262/1388435
+    try:
+        import ctypes
+        from ctypes.util import find_library
+    except ImportError:
+        return None
     try:
-        libc = ctypes.cdll.msvcrt  # Windows
+        return ctypes.cdll.msvcrt  # Windows
     except OSError:
-        libc = ctypes.cdll.LoadLibrary(find_library("c"))
+        return ctypes.cdll.LoadLibrary(find_library("c"))
 
 
-has_numpy, np = optional_import("numpy")
-has_yaml, yaml = optional_import("yaml")
-has_pandas, pandas = optional_import("pandas")
+# Optional modules that are only imported when they are first accessed as
+# attributes of this module, e.g. ``opt.np``. The corresponding ``has_*``
+# flags only check that the module is installed, without importing it.
+_LAZY_MODULES = {"np": "numpy", "yaml": "yaml", "pandas": "pandas"}
+
+has_numpy = modules_exist("numpy")
+has_yaml = modules_exist("yaml")
+has_pandas = modules_exist("pandas")
+has_importlib_metadata = modules_exist("importlib.metadata")
+_importlib_metadata_name = "importlib.metadata"
+if not has_importlib_metadata:  # Python < 3.8
+    has_importlib_metadata = modules_exist("importlib_metadata")
+    _importlib_metadata_name = "importlib_metadata"
+_LAZY_MODULES["importlib_metadata"] = _importlib_metadata_name
 
 has_sqlalchemy = modules_exist("sqlalchemy")
 has_mako = modules_exist("mako")
 has_tinydb = modules_exist("tinydb", "tinydb_serialization", "hashfs")
 has_tensorflow = modules_exist("tensorflow")
+
+
+def __getattr__(name):
+    if name in _LAZY_MODULES:
+        _, value = optional_import(_LAZY_MODULES[name])
+    elif name == "libc":
+        value = _load_libc()
+    else:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    globals()[name] = value
+    return value
+
+
+if sys.version_info < (3, 7):  # no module level __getattr__ (PEP 562)
+    for _name in list(_LAZY_MODULES) + ["libc"]:
+        __getattr__(_name)
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Storage of large numpy and pandas values as artifacts.
+
+Instead of inlining large arrays and DataFrames of the info or result into
+every heartbeat, they are written once as binary artifacts and replaced by
+an :class:`ArtifactReference`, which ``flatten`` stores as a small dict.
+``restore(flat, artifact_loader=...)`` loads the values again.
+"""
+
+import hashlib
+import os
+import re
+import sys
+import tempfile
+
+from sacred.utils import modules_exist
+
+__all__ = ("ArtifactReference", "OutOfBandStore", "resolve_artifact_references")
+
+
+class ArtifactReference:
+    """Placeholder for a value that was saved as the artifact ``name``.
+
+    Attributes
+    ----------
+    name : str
+        The name of the artifact.
+    format : str
+        ``"npy"`` (numpy), ``"parquet"`` or ``"pickle"`` (pandas).
+    type : str
+        The qualified name of the type of the original value.
+    shape : list
+        The shape of the original value.
+    dtype : str or None
+        The dtype of numpy arrays.
+    """
+
+    def __init__(self, name, format, type, shape, dtype=None):
+        self.name = name
+        self.format = format
+        self.type = type
+        self.shape = list(shape)
+        self.dtype = dtype
+
+    def load(self, artifact_loader):
+        """Load the value.
+
+        artifact_loader is either the directory that contains the artifacts
+        (e.g. the run directory of a FileStorageObserver) or a function that
+        takes the name of an artifact and returns its filename or a binary
+        file object.
+        """
+        if callable(artifact_loader):
+            source = artifact_loader(self.name)
+        else:
+            source = os.path.join(artifact_loader, self.name)
+        if self.format == "npy":
+            import numpy
+
+            return numpy.load(source, allow_pickle=False)
+        import pandas
+
+        if self.format == "parquet":
+            return pandas.read_parquet(source)
+        return pandas.read_pickle(source)
+
+    def __eq__(self, other):
+        return isinstance(other, ArtifactReference) and self.__dict__ == other.__dict__
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "<ArtifactReference: {} ({} {})>".format(
+            self.name, self.type, tuple(self.shape)
+        )
+
+
+def resolve_artifact_references(obj, artifact_loader):
+    """Replace all ArtifactReferences in obj by the values they refer to."""
+    if isinstance(obj, ArtifactReference):
+        return obj.load(artifact_loader)
+    if type(obj) is dict:
+        return {
+            k: resolve_artifact_references(v, artifact_loader) for k, v in obj.items()
+        }
+    if type(obj) is list:
+        return [resolve_artifact_references(v, artifact_loader) for v in obj]
+    if type(obj) is tuple:
+        return tuple(resolve_artifact_references(v, artifact_loader) for v in obj)
+    return obj
+
+
+class OutOfBandStore:
+    """Replaces large numpy and pandas values by ArtifactReferences.
+
+    Each value is saved through the given add_artifact function (e.g.
+    :py:meth:`sacred.run.Run.add_artifact`) as an artifact named after the
+    path of the value (like ``info.weights.npy``). A value is only saved
+    again if the digest of its content changed, and then overwrites the
+    previous artifact of the same path, so no stale copies accumulate.
+    """
+
+    def __init__(self, min_size, add_artifact):
+        self.min_size = min_size
+        self.add_artifact = add_artifact
+        self._saved = {}
+
+    def replace(self, obj, path):
+        """Return obj with all large values replaced by references.
+
+        Containers are only copied if something inside them was replaced.
+        """
+        numpy = sys.modules.get("numpy")
+        pandas = sys.modules.get("pandas")
+        if numpy is None and pandas is None:
+            return obj  # there cannot be any arrays or DataFrames
+        return self._replace(obj, path, numpy, pandas)
+
+    def _replace(self, obj, path, numpy, pandas):
+        if type(obj) is dict:
+            new = {
+                k: self._replace(v, "{}.{}".format(path, k), numpy, pandas)
+                for k, v in obj.items()
+            }
+            changed = any(new[k] is not v for k, v in obj.items())
+            return new if changed else obj
+        if type(obj) in (list, tuple):
+            new = [
+                self._replace(v, "{}.{}".format(path, i), numpy, pandas)
+                for i, v in enumerate(obj)
+            ]
+            if all(n is o for n, o in zip(new, obj)):
+                return obj
+            return new if type(obj) is list else tuple(new)
+        if numpy is not None and isinstance(obj, numpy.ndarray):
+            if obj.nbytes >= self.min_size and not obj.dtype.hasobject:
+                return self._save(obj, path, _numpy_digest(obj), "npy")
+        elif pandas is not None and isinstance(obj, (pandas.DataFrame, pandas.Series)):
+            if _pandas_size(obj) >= self.min_size:
+                digest = _pandas_digest(pandas, obj)
+                if digest is not None:
+                    return self._save(obj, path, digest, _pandas_format(obj))
+        return obj
+
+    def _save(self, value, path, digest, format):
+        saved = self._saved.get(path)
+        if saved is not None and saved[0] == digest:
+            return saved[1]
+        extension = {"npy": ".npy", "parquet": ".parquet", "pickle": ".pkl"}
+        name = _safe_name(path) + extension[format]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, name)
+            if format == "npy":
+                import numpy
+
+                numpy.save(filename, value, allow_pickle=False)
+            elif format == "parquet":
+                value.to_parquet(filename)
+            else:
+                value.to_pickle(filename)
+            self.add_artifact(
+                filename, name=name, content_type="application/octet-stream"
+            )
+        ref = ArtifactReference(
+            name,
+            format,
+            "{}.{}".format(type(value).__module__, type(value).__name__),
+            value.shape,
+            str(value.dtype) if format == "npy" else None,
+        )
+        self._saved[path] = digest, ref
+        return ref
+
+
+def _safe_name(path):
+    return re.sub(r"[^\w.\-]", "_", path)
+
+
+def _numpy_digest(array):
+    import numpy
+
+    h = hashlib.md5("{}{}".format(array.dtype.str, array.shape).encode())
+    h.update(numpy.ascontiguousarray(array).reshape(-1).view(numpy.uint8))
+    return h.hexdigest()
+
+
+def _pandas_size(obj):
+    size = obj.memory_usage(index=True, deep=False)
+    return int(size.sum()) if hasattr(size, "sum") else int(size)
+
+
+def _pandas_digest(pandas, obj):
+    try:
+        hashes = pandas.util.hash_pandas_object(obj, index=True).values
+    except TypeError:
+        return None  # e.g. unhashable values; keep the value inline
+    columns = getattr(obj, "columns", [getattr(obj, "name", None)])
+    h = hashlib.md5(repr((list(columns), str(obj.dtypes))).encode())
+    h.update(hashes.tobytes())
+    return h.hexdigest()
+
+
+def _pandas_format(obj):
+    if (
+        hasattr(obj, "columns")
+        and all(isinstance(c, str) for c in obj.columns)
+        and (modules_exist("pyarrow") or modules_exist("fastparquet"))
+    ):
+        return "parquet"
+    return "pickle"
@@ -2,13 +2,26 @@
 # coding=utf-8
 
 import datetime
+import json
 import os.path
 import sys
+import tempfile
+import threading
+import time
 import traceback as tb
+from concurrent.futures import wait
 
 from sacred import metrics_logger
+from sacred.captured_output import CapturedOutput
+from sacred.heartbeat import HeartbeatTracker, wants_delta_heartbeats
 from sacred.metrics_logger import linearize_metrics
+from sacred.observer_dispatcher import ObserverDispatcher
+from sacred.observer_stats import ObserverStats
+from sacred.observers.process import ProcessObserver
+from sacred.observers.queue import QueueObserver
+from sacred.out_of_band import OutOfBandStore
 from sacred.randomness import set_global_seed
+from sacred.settings import SETTINGS
 from sacred.utils import SacredInterrupt, join_paths, IntervalTimer
 from sacred.stdout_capturing import get_stdcapturer
 
@@ -34,8 +47,7 @@ class Run:
         self._id = None
         """The ID of this run as assigned by the first observer"""
 
-        self.captured_out = ""
-        """Captured stdout and stderr"""
+        self._captured_output = CapturedOutput()
 
         self.config = config
         """The final configuration used for this run"""
@@ -94,6 +106,30 @@ class Run:
         self.beat_interval = 10.0  # sec
         """The time between two heartbeat events measured in seconds"""
 
+        self.heartbeat_max_silence = SETTINGS.HEARTBEAT.MAX_SILENCE  # sec
+        """Longest time without a heartbeat event if nothing changed.
+
+        Heartbeats without changes to the info, captured output, result or
+        metrics are skipped until this much time passed since the last one.
+        Zero (the default) disables skipping."""
+
+        self.max_beat_interval = SETTINGS.HEARTBEAT.MAX_INTERVAL  # sec
+        """Upper bound for the heartbeat interval when observers are slow.
+
+        Zero (the default) keeps the interval fixed at beat_interval."""
+
+        self.observer_timeout = 60.0  # sec
+        """Maximum time to wait for the observers at the end of the run"""
+
+        self.observer_stats = ObserverStats()
+        """Timing statistics of the observer calls during this run"""
+
+        self.slow_observer_call = SETTINGS.OBSERVER_STATS.SLOW_CALL  # sec
+        """Observer calls that take longer than this are logged (debug level)"""
+
+        self.save_observer_stats = SETTINGS.OBSERVER_STATS.SAVE_ARTIFACT
+        """If true, the observer_stats are added as an artifact at the end"""
+
         self.unobserved = False
         """Indicates whether this run should be unobserved"""
 
@@ -103,9 +139,24 @@ class Run:
         self.queue_only = False
         """If true then this run will only fire the queued_event and quit"""
 
+        self.queue_observers = False
+        """If true then all observers process their events in the background
+        (see :py:class:`~sacred.observers.QueueObserver`)"""
+
+        self.observer_process = False
+        """If true then all observers run in a helper process
+        (see :py:class:`~sacred.observers.ProcessObserver`)"""
+
         self.captured_out_filter = captured_out_filter
         """Filter function to be applied to captured output"""
 
+        self.captured_out_max_size = SETTINGS.CAPTURED_OUT_MAX_SIZE
+        """Maximum number of characters of captured output kept in memory"""
+
+        self.out_of_band_min_size = SETTINGS.OUT_OF_BAND_MIN_SIZE  # bytes
+        """Size from which numpy/pandas values in info and result are saved
+        as artifacts and only referenced in the heartbeats (None disables)"""
+
         self.fail_trace = None
         """A stacktrace, in case the run failed"""
 
@@ -113,8 +164,15 @@ class Run:
         """Determines the way the stdout/stderr are captured"""
 
         self._heartbeat = None
+        self._heartbeat_lock = threading.Lock()
+        self._heartbeat_stopped = False
         self._failed_observers = []
         self._output_file = None
+        self._dispatcher = ObserverDispatcher()
+        self._heartbeat_tracker = HeartbeatTracker()
+        self._last_beat = None
+        self._effective_beat_interval = None
+        self._out_of_band = None
 
         self._metrics = metrics_logger.MetricsLogger()
 
@@ -216,6 +274,19 @@ class Run:
             self.observers = []
         else:
             self.observers = sorted(self.observers, key=lambda x: -x.priority)
+            if self.queue_observers:
+                self.observers = [
+                    obs if isinstance(obs, QueueObserver) else QueueObserver(obs)
+                    for obs in self.observers
+                ]
+            if self.observer_process:
+                self.observers = [
+                    obs if isinstance(obs, ProcessObserver) else ProcessObserver(obs)
+                    for obs in self.observers
+                ]
+                # before stdout is captured and other threads are started
+                for obs in self.observers:
+                    obs.start()
 
         self.warn_if_unobserved()
         set_global_seed(self.config["seed"])
@@ -225,6 +296,14 @@ class Run:
         else:
             capture_mode = self.capture_mode
         capture_mode, capture_stdout = get_stdcapturer(capture_mode)
+        self._captured_output = CapturedOutput(
+            max_size=self.captured_out_max_size,
+            output_filter=self.captured_out_filter,
+        )
+        if self.out_of_band_min_size is not None:
+            self._out_of_band = OutOfBandStore(
+                self.out_of_band_min_size, self.add_artifact
+            )
         self.run_logger.debug('Using capture mode "%s"', capture_mode)
 
         if self.queue_only:
@@ -260,21 +339,36 @@ class Run:
 
         return self.result
 
+    @property
+    def captured_out(self):
+        """Captured stdout and stderr.
+
+        If the output got longer than captured_out_max_size, the middle part
+        is left out. Use :py:meth:`read_captured_out` to get all of it.
+        """
+        return self._captured_output.getvalue()
+
+    @captured_out.setter
+    def captured_out(self, value):
+        self._captured_output = CapturedOutput(max_size=self.captured_out_max_size)
+        self._captured_output.write(value)
+
+    def read_captured_out(self):
+        """Return the complete captured output, even if it was truncated."""
+        return self._captured_output.read()
+
     def _get_captured_output(self):
         if self._output_file.closed:
             return
         text = self._output_file.get()
         if isinstance(text, bytes):
             text = text.decode("utf-8", "replace")
-        if self.captured_out:
-            text = self.captured_out + text
-        if self.captured_out_filter is not None:
-            text = self.captured_out_filter(text)
-        self.captured_out = text
+        self._captured_output.write(text)
 
     def _start_heartbeat(self):
         self.run_logger.debug("Starting Heartbeat")
         if self.beat_interval > 0:
+            self._effective_beat_interval = self.beat_interval
             self._stop_heartbeat_event, self._heartbeat = IntervalTimer.create(
                 self._emit_heartbeat, self.beat_interval
             )
@@ -285,7 +379,18 @@ class Run:
         # only stop if heartbeat was started
         if self._heartbeat is not None:
             self._stop_heartbeat_event.set()
-            self._heartbeat.join(timeout=2)
+            # the heartbeat thread sends a final heartbeat when it stops
+            self._heartbeat.join(timeout=self.observer_timeout)
+            if self._heartbeat.is_alive():
+                self.run_logger.warning(
+                    "A heartbeat did not finish within %s seconds.",
+                    self.observer_timeout,
+                )
+                with self._heartbeat_lock:
+                    # the stuck heartbeat must not send anything after the
+                    # final event of the run, but the final state is sent
+                    self._heartbeat_stopped = True
+                self._emit_heartbeat(final=True)
 
     def _emit_queued(self):
         self.status = "QUEUED"
@@ -296,7 +401,9 @@ class Run:
         )
         self.run_logger.info("Queuing-up command '%s'", command)
         for observer in self.observers:
-            _id = observer.queued_event(
+            _id = self._call_observer(
+                observer,
+                "queued_event",
                 ex_info=self.experiment_info,
                 command=command,
                 host_info=self.host_info,
@@ -323,7 +430,9 @@ class Run:
         )
         self.run_logger.info("Running command '%s'", command)
         for observer in self.observers:
-            _id = observer.started_event(
+            _id = self._call_observer(
+                observer,
+                "started_event",
                 ex_info=self.experiment_info,
                 command=command,
                 host_info=self.host_info,
@@ -341,24 +450,102 @@ class Run:
         else:
             self.run_logger.info('Started run with ID "{}"'.format(self._id))
 
-    def _emit_heartbeat(self):
+    def _emit_heartbeat(self, final=False):
         beat_time = datetime.datetime.utcnow()
         self._get_captured_output()
         # Read all measured metrics since last heartbeat
-        logged_metrics = self._metrics.get_last_metrics()
-        metrics_by_name = linearize_metrics(logged_metrics)
+        metrics_by_name = linearize_metrics(self._metrics.get_last_metrics_by_name())
+        full_observers = []
+        delta_observers = []
         for observer in self.observers:
-            self._safe_call(
-                observer, "log_metrics", metrics_by_name=metrics_by_name, info=self.info
+            if wants_delta_heartbeats(observer):
+                delta_observers.append(observer)
+            else:
+                full_observers.append(observer)
+        # only track the changes if some observer or the skipping of unchanged
+        # heartbeats needs them, because diffing the info is not free
+        track_changes = bool(delta_observers) or self.heartbeat_max_silence > 0
+        delta = None
+        if track_changes and not metrics_by_name:
+            info = self._externalize(self.info, "info")
+            result = self._externalize(self.result, "result")
+            delta = self._heartbeat_tracker.diff(info, self._captured_output, result)
+            if delta.is_empty and not self._is_silent_too_long():
+                return
+
+        start = time.monotonic()
+        self._last_beat = start
+        # All observers log their metrics before any of them stores the info,
+        # because log_metrics may add references to the metrics to the info.
+        futures = self._dispatch_heartbeat(
+            final,
+            self.observers,
+            "log_metrics",
+            metrics_by_name=metrics_by_name,
+            info=self.info,
+        )
+        self._wait_for_heartbeat(futures, final)
+        if delta is None:
+            info = self._externalize(self.info, "info")
+            result = self._externalize(self.result, "result")
+            if track_changes:
+                delta = self._heartbeat_tracker.diff(
+                    info, self._captured_output, result
+                )
+        futures = self._dispatch_heartbeat(
+            final,
+            full_observers,
+            "heartbeat_event",
+            info=info,
+            captured_out=self.captured_out,
+            beat_time=beat_time,
+            result=result,
+        )
+        futures += self._dispatch_heartbeat(
+            final,
+            delta_observers,
+            "heartbeat_delta_event",
+            delta=delta,
+            beat_time=beat_time,
+        )
+        self._wait_for_heartbeat(futures, final)
+        self._adapt_beat_interval(time.monotonic() - start)
+
+    def _dispatch_heartbeat(self, final, observers, method, **kwargs):
+        """Send a heartbeat event, unless the heartbeat was stopped."""
+        with self._heartbeat_lock:
+            if self._heartbeat_stopped and not final:
+                return []
+            return self._dispatcher.dispatch(
+                observers, self._safe_call, method, **kwargs
             )
-            self._safe_call(
-                observer,
-                "heartbeat_event",
-                info=self.info,
-                captured_out=self.captured_out,
-                beat_time=beat_time,
-                result=self.result,
+
+    def _wait_for_heartbeat(self, futures, final):
+        # the final heartbeat must not block the end of the run indefinitely
+        wait(futures, timeout=self.observer_timeout if final else None)
+
+    def _is_silent_too_long(self):
+        if self._last_beat is None or self.heartbeat_max_silence <= 0:
+            return True
+        return time.monotonic() - self._last_beat >= self.heartbeat_max_silence
+
+    def _adapt_beat_interval(self, elapsed):
+        """Back off if the observers need long for a heartbeat, else recover."""
+        if self._heartbeat is None or self.max_beat_interval <= 0:
+            return
+        interval = self._effective_beat_interval
+        if elapsed > interval / 2:
+            interval = max(min(2 * interval, self.max_beat_interval), interval)
+        elif elapsed < interval / 10:
+            interval = max(interval / 2, self.beat_interval)
+        if interval != self._effective_beat_interval:
+            self.run_logger.debug(
+                "Heartbeat took %.2f seconds, changing interval to %.1f seconds",
+                elapsed,
+                interval,
             )
+            self._effective_beat_interval = interval
+            self._heartbeat.interval = interval
 
     def _stop_time(self):
         self.stop_time = datetime.datetime.utcnow()
@@ -369,55 +556,69 @@ class Run:
 
     def _emit_completed(self, result):
         self.status = "COMPLETED"
-        for observer in self.observers:
-            self._final_call(
-                observer, "completed_event", stop_time=self.stop_time, result=result
-            )
+        self._save_full_captured_out()
+        self._save_observer_stats()
+        self._dispatcher.dispatch(
+            self.observers,
+            self._final_call,
+            "completed_event",
+            stop_time=self.stop_time,
+            result=self._externalize(result, "result"),
+        )
 
     def _emit_interrupted(self, status):
         self.status = status
         elapsed_time = self._stop_time()
         self.run_logger.warning("Aborted after %s!", elapsed_time)
-        for observer in self.observers:
-            self._final_call(
-                observer,
-                "interrupted_event",
-                interrupt_time=self.stop_time,
-                status=status,
-            )
+        self._save_full_captured_out()
+        self._save_observer_stats()
+        self._dispatcher.dispatch(
+            self.observers,
+            self._final_call,
+            "interrupted_event",
+            interrupt_time=self.stop_time,
+            status=status,
+        )
 
     def _emit_failed(self, exc_type, exc_value, trace):
         self.status = "FAILED"
         elapsed_time = self._stop_time()
         self.run_logger.error("Failed after %s!", elapsed_time)
         self.fail_trace = tb.format_exception(exc_type, exc_value, trace)
-        for observer in self.observers:
-            self._final_call(
-                observer,
-                "failed_event",
-                fail_time=self.stop_time,
-                fail_trace=self.fail_trace,
-            )
+        self._save_full_captured_out()
+        self._save_observer_stats()
+        self._dispatcher.dispatch(
+            self.observers,
+            self._final_call,
+            "failed_event",
+            fail_time=self.stop_time,
+            fail_trace=self.fail_trace,
+        )
 
     def _emit_resource_added(self, filename):
-        for observer in self.observers:
-            self._safe_call(observer, "resource_event", filename=filename)
+        self._emit_and_wait(self._safe_call, "resource_event", filename=filename)
 
     def _emit_artifact_added(self, name, filename, metadata, content_type):
-        for observer in self.observers:
-            self._safe_call(
-                observer,
-                "artifact_event",
-                name=name,
-                filename=filename,
-                metadata=metadata,
-                content_type=content_type,
-            )
+        # wait, because the file might be removed right after adding it
+        self._emit_and_wait(
+            self._safe_call,
+            "artifact_event",
+            name=name,
+            filename=filename,
+            metadata=metadata,
+            content_type=content_type,
+        )
+
+    def _emit_and_wait(self, call, method, **kwargs):
+        """Send an event to all observers concurrently and wait for all of them."""
+        futures = self._dispatcher.dispatch(self.observers, call, method, **kwargs)
+        for future in futures:
+            future.result()
 
     def _safe_call(self, obs, method, **kwargs):
         if obs not in self._failed_observers:
             try:
-                getattr(obs, method)(**kwargs)
+                self._call_observer(obs, method, **kwargs)
             except Exception as e:
                 self._failed_observers.append(obs)
                 self.run_logger.warning(
@@ -426,17 +627,84 @@ class Run:
 
     def _final_call(self, observer, method, **kwargs):
         try:
-            getattr(observer, method)(**kwargs)
+            self._call_observer(observer, method, **kwargs)
         except Exception:
             # Feels dirty to catch all exceptions, but it is just for
             # finishing up, so we don't want one observer to kill the
             # others
             self.run_logger.error(tb.format_exc())
 
+    def _call_observer(self, observer, method, **kwargs):
+        """Call an event method of an observer and record how long it took."""
+        start = time.perf_counter()
+        try:
+            return getattr(observer, method)(**kwargs)
+        finally:
+            duration = time.perf_counter() - start
+            self.observer_stats.record(observer, method, duration)
+            if (
+                self.slow_observer_call is not None
+                and duration > self.slow_observer_call
+            ):
+                self.run_logger.debug(
+                    "The '%s' observer took %.3f seconds for %s",
+                    self.observer_stats.observer_name(observer),
+                    duration,
+                    method,
+                )
+
+    def _externalize(self, value, path):
+        """Replace large numpy/pandas values by references to artifacts."""
+        if self._out_of_band is None or not self.observers:
+            return value
+        try:
+            return self._out_of_band.replace(value, path)
+        except Exception as e:
+            self.run_logger.warning(
+                "Could not save the large values of the %s as artifacts: %s", path, e
+            )
+            return value
+
+    def _save_full_captured_out(self):
+        if not self._captured_output.truncated or not self.observers:
+            return
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, "captured_out.txt")
+            with open(filename, "w", encoding="utf-8", newline="") as f:
+                f.write(self._captured_output.read())
+            self.add_artifact(filename, content_type="text/plain")
+
+    def _save_observer_stats(self):
+        if not self.observers:
+            return
+        # Updated in place before the final event, so observers that keep the
+        # meta_info of the started_event save the stats with the final event.
+        self.meta_info["observer_stats"] = self.observer_stats.summary()
+        if not self.save_observer_stats:
+            return
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, "observer_stats.json")
+            with open(filename, "w") as f:
+                json.dump(self.observer_stats.summary(), f, indent=2)
+            self.add_artifact(filename, content_type="application/json")
+
     def _wait_for_observers(self):
-        """Block until all observers finished processing."""
-        for observer in self.observers:
-            self._safe_call(observer, "join")
+        """Block until all observers finished processing or timeout."""
+        self._dispatcher.dispatch(self.observers, self._safe_call, "join")
+        stalled = self._dispatcher.join(timeout=self.observer_timeout)
+        for observer in stalled:
+            self.run_logger.warning(
+                "The observer '{}' did not finish processing within {} "
+                "seconds. It continues in the background, and the "
+                "interpreter waits for it before exiting.".format(
+                    observer, self.observer_timeout
+                )
+            )
+        if self.observers:
+            # a new dict, since the observers may hold on to the old one
+            self.meta_info = dict(
+                self.meta_info, observer_stats=self.observer_stats.summary()
+            )
 
     def _warn_about_failed_observers(self):
         for observer in self._failed_observers:
@@ -476,3 +744,32 @@ class Run:
         # update the docstring too!)
 
         self._metrics.log_scalar_metric(metric_name, value, step)
+
+    def log_scalars(self, values_by_name, step=None):
+        """
+        Add one new measurement for each of several metrics at once.
+
+        :param values_by_name: A dict mapping metric names
+                               (e.g. training.loss) to measured values
+        :param step: The step number (integer) shared by all measurements.
+                    If not specified, the internal counter of each metric
+                    is incremented by one.
+        """
+        # The same as Experiment.log_scalars (if something changes,
+        # update the docstring too!)
+        self._metrics.log_scalar_metrics(values_by_name, step)
+
+    def log_array(self, metric_name, values, steps=None):
+        """
+        Add a whole series of measurements of one metric at once.
+
+        :param metric_name: The name of the metric, e.g. training.loss
+        :param values: A sequence or one-dimensional numpy array of
+                       measured values
+        :param steps: A sequence or numpy array of step numbers with the
+                      same length as values. If not specified, the internal
+                      counter of the metric is continued.
+        """
+        # The same as Experiment.log_array (if something changes,
+        # update the docstring too!)
+        self._metrics.log_array_metric(metric_name, values, steps)
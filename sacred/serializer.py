@@ -1,6 +1,8 @@
 import jsonpickle
 import json as _json
-from sacred import optional as opt
+import types
+
+import wrapt
 
 json = jsonpickle
 
@@ -8,14 +10,19 @@ json = jsonpickle
 __all__ = ("flatten", "restore")
 
 
-if opt.has_numpy:
+# The jsonpickle handlers for numpy and pandas are registered as soon as
+# these modules are imported (by anyone), so importing sacred does not import
+# them. Objects of these types cannot exist before, and jsonpickle imports
+# the module of a class before restoring it.
+@wrapt.when_imported("numpy")
+def _register_numpy_handlers(numpy):
     import jsonpickle.ext.numpy as jsonpickle_numpy
 
-    np = opt.np
-
     jsonpickle_numpy.register_handlers()
 
-if opt.has_pandas:
+
+@wrapt.when_imported("pandas")
+def _register_pandas_handlers(pandas):
     import jsonpickle.ext.pandas as jsonpickle_pandas
 
     jsonpickle_pandas.register_handlers()
@@ -25,9 +32,141 @@ jsonpickle.set_encoder_options("simplejson", sort_keys=True, indent=4)
 jsonpickle.set_encoder_options("demjson", compactly=False)
 
 
+# nesting depth up to which the fast path is used
+MAX_DEPTH = 100
+
+
+class _Fallback(Exception):
+    """Raised if only jsonpickle can flatten the object as a whole."""
+
+
 def flatten(obj):
+    """Convert obj into json-compatible data that restore turns back into obj.
+
+    Plain json data (dicts with string keys, lists, strings, numbers, bools
+    and None) is copied in a single pass, dispatching on the exact type of
+    each value. Only the other values are flattened with jsonpickle, one
+    at a time. jsonpickle numbers references between objects (``py/id``)
+    across the whole document, so if the same list or object occurs twice
+    (also inside the values flattened by jsonpickle) or jsonpickle produces
+    references, the whole object is flattened with jsonpickle, as is data
+    that is nested too deeply.
+    """
+    try:
+        return _flatten(obj, 0, set())
+    except _Fallback:
+        pass
+    return _flatten_with_jsonpickle(obj)
+
+
+def _flatten(obj, depth, seen):
+    flattener = _FLATTENERS.get(type(obj))
+    if flattener is None:
+        return _flatten_foreign(obj, seen)
+    return flattener(obj, depth, seen)
+
+
+def _flatten_scalar(obj, depth, seen):
+    return obj
+
+
+def _flatten_list(obj, depth, seen):
+    if depth >= MAX_DEPTH or id(obj) in seen:
+        raise _Fallback()
+    seen.add(id(obj))
+    return [_flatten(v, depth + 1, seen) for v in obj]
+
+
+def _flatten_dict(obj, depth, seen):
+    if depth >= MAX_DEPTH:
+        raise _Fallback()
+    result = {}
+    for key, value in obj.items():
+        if type(key) is not str:
+            return _flatten_foreign(obj, seen)
+        result[key] = _flatten(value, depth + 1, seen)
+    return result
+
+
+_FLATTENERS = {
+    str: _flatten_scalar,
+    int: _flatten_scalar,
+    float: _flatten_scalar,
+    bool: _flatten_scalar,
+    type(None): _flatten_scalar,
+    list: _flatten_list,
+    dict: _flatten_dict,
+}
+
+
+def _flatten_foreign(obj, seen):
+    _mark_foreign(obj, seen)
+    flat = _flatten_with_jsonpickle(obj)
+    if _contains_reference(flat):
+        raise _Fallback()
+    return flat
+
+
+_PRIMITIVES = (str, bytes, int, float, bool, type(None))
+_OPAQUE = (
+    type,
+    types.ModuleType,
+    types.FunctionType,
+    types.BuiltinFunctionType,
+    types.MethodType,
+)
+
+
+def _mark_foreign(obj, seen):
+    """Add the containers and objects inside a foreign value to seen.
+
+    jsonpickle flattens a foreign value on its own, so a list that also
+    occurs elsewhere in the document would be copied where the whole
+    document gets a ``py/id`` reference. Marking what jsonpickle will visit
+    lets both paths detect such shared values and fall back.
+    """
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if isinstance(current, _PRIMITIVES):
+            continue
+        if id(current) in seen:
+            raise _Fallback()
+        seen.add(id(current))
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+        elif not isinstance(current, _OPAQUE):
+            stack.extend(getattr(current, "__dict__", {}).values())
+
+
+def _flatten_with_jsonpickle(obj):
     return _json.loads(json.encode(obj, keys=True))
 
 
-def restore(flat):
-    return json.decode(_json.dumps(flat), keys=True)
+def _contains_reference(flat):
+    if isinstance(flat, dict):
+        return "py/id" in flat or any(_contains_reference(v) for v in flat.values())
+    if isinstance(flat, list):
+        return any(_contains_reference(v) for v in flat)
+    return False
+
+
+def restore(flat, artifact_loader=None):
+    """Convert the output of flatten back into the original object.
+
+    Large values that were stored as artifacts (see
+    :py:attr:`sacred.run.Run.out_of_band_min_size`) are restored as
+    :class:`sacred.out_of_band.ArtifactReference` objects. If an
+    artifact_loader is given, they are replaced by the loaded values. It is
+    either the directory that contains the artifacts or a function that
+    maps an artifact name to a filename or binary file object.
+    """
+    obj = json.decode(_json.dumps(flat), keys=True)
+    if artifact_loader is not None:
+        from sacred.out_of_band import resolve_artifact_references
+
+        obj = resolve_artifact_references(obj, artifact_loader)
+    return obj
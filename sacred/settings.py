@@ -34,6 +34,15 @@ SETTINGS = munchify(
             "INCLUDE_GPU_INFO": True,
             # List of ENVIRONMENT variables to store in host-info
             "CAPTURED_ENV": [],
+            # seconds to wait for each host info getter before leaving out
+            # its entry. None waits indefinitely
+            "TIMEOUT": 10.0,
+            # seconds for which static host info (like the CPU model, OS and
+            # GPUs) is reused. 0 disables the cache
+            "CACHE_TTL": 3600.0,
+            # file to share the cached host info between processes.
+            # None keeps it only in memory
+            "CACHE_FILE": None,
         },
         "COMMAND_LINE": {
             # disallow string fallback, if parsing a value from command-line failed
@@ -41,11 +50,63 @@ SETTINGS = munchify(
             # show command line options that are disabled (e.g. unmet dependencies)
             "SHOW_DISABLED_OPTIONS": True,
         },
-        # configure how stdout/stderr are captured. ['no', 'sys', 'fd']
+        "HEARTBEAT": {
+            # longest time in seconds without a heartbeat event, if nothing
+            # changed since the last one. 0 sends every heartbeat.
+            "MAX_SILENCE": 0,
+            # upper bound in seconds for the heartbeat interval, which grows
+            # if the observers are slow to process heartbeats. 0 keeps the
+            # interval fixed.
+            "MAX_INTERVAL": 0,
+        },
+        "OBSERVER_STATS": {
+            # observer calls that take longer than this many seconds are
+            # logged at debug level. None disables the log messages.
+            "SLOW_CALL": 1.0,
+            # add the timing statistics of the observers as an artifact
+            # called observer_stats.json at the end of each run
+            "SAVE_ARTIFACT": False,
+        },
+        # configure how stdout/stderr are captured. ['no', 'sys', 'fd', 'pipe']
         "CAPTURE_MODE": "sys" if platform.system() == "Windows" else "fd",
+        # maximum number of characters of captured output kept in memory.
+        # The start and the end are kept, the rest is moved to a temporary
+        # file and added as artifact 'captured_out.txt' at the end of the run.
+        # None keeps everything in memory.
+        "CAPTURED_OUT_MAX_SIZE": None,
+        # numpy arrays and pandas objects in the info and result of a run that
+        # are at least this many bytes are saved once as artifacts, and only
+        # referenced in the heartbeats. None keeps them inline.
+        "OUT_OF_BAND_MIN_SIZE": None,
         # configure how dependencies are discovered. [none, imported, sys, pkg]
         "DISCOVER_DEPENDENCIES": "imported",
+        # file to cache the digests of source files in, so unchanged files
+        # are not read again with every start (e.g.
+        # "~/.cache/sacred/digests.json"). None disables the cache.
+        "DIGEST_CACHE": None,
         # configure how source-files are discovered. [none, imported, sys, dir]
         "DISCOVER_SOURCES": "imported",
+        # options for DISCOVER_SOURCES = "dir"
+        "DIR_SOURCES": {
+            # gitignore-style patterns of files and directories to skip,
+            # relative to the base directory of the experiment
+            "EXCLUDE": [
+                ".git/",
+                ".hg/",
+                ".svn/",
+                ".tox/",
+                ".nox/",
+                ".venv/",
+                "venv/",
+                "__pycache__/",
+                "node_modules/",
+                "site-packages/",
+            ],
+            # also skip everything excluded by .gitignore files
+            "USE_GITIGNORE": True,
+            # number of threads used to compute the digests.
+            # None uses the default of concurrent.futures.ThreadPoolExecutor
+            "WORKERS": None,
+        },
     }
 )
@@ -1,14 +1,16 @@
 #!/usr/bin/env python
 # coding=utf-8
 
+import codecs
 import os
 import sys
 import subprocess
+import threading
 import warnings
 from io import StringIO
 from contextlib import contextmanager
 import wrapt
-from sacred.optional import libc
+import sacred.optional as opt
 from tempfile import NamedTemporaryFile
 from sacred.settings import SETTINGS
 
@@ -21,14 +23,19 @@ def flush():
     except (AttributeError, ValueError, OSError):
         pass  # unsupported
     try:
-        libc.fflush(None)
+        opt.libc.fflush(None)
     except (AttributeError, ValueError, OSError):
         pass  # unsupported
 
 
 def get_stdcapturer(mode=None):
     mode = mode if mode is not None else SETTINGS.CAPTURE_MODE
-    capture_options = {"no": no_tee, "fd": tee_output_fd, "sys": tee_output_python}
+    capture_options = {
+        "no": no_tee,
+        "fd": tee_output_fd,
+        "pipe": tee_output_pipe,
+        "sys": tee_output_python,
+    }
     if mode not in capture_options:
         raise KeyError(
             "Unknown capture mode '{}'. Available options are {}".format(
@@ -193,3 +200,109 @@ def tee_output_fd():
             os.close(saved_stdout_fd)
             os.close(saved_stderr_fd)
             out.finalize()
+
+
+class CapturedPipeOutput:
+    """Output collected by the reader threads of :py:func:`tee_output_pipe`."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._chunks = []
+        self._finalized = False
+
+    @property
+    def closed(self):
+        # stay open until the output that arrived before the end was read
+        with self._lock:
+            return self._finalized and not self._chunks
+
+    def write(self, text):
+        if text:
+            with self._lock:
+                self._chunks.append(text)
+
+    def flush(self):
+        flush()
+
+    def get(self):
+        with self._lock:
+            text = "".join(self._chunks)
+            self._chunks = []
+        return text
+
+    def finalize(self):
+        with self._lock:
+            self._finalized = True
+
+
+def _copy_pipe(read_fd, original_fd, out):
+    """Copy everything from read_fd to original_fd and out until EOF."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    try:
+        while True:
+            try:
+                data = os.read(read_fd, 65536)
+            except OSError:
+                break
+            if not data:
+                break
+            view = memoryview(data)
+            while view:
+                try:
+                    view = view[os.write(original_fd, view) :]
+                except OSError:
+                    break  # the original stream is gone, but keep capturing
+            out.write(decoder.decode(data))
+        out.write(decoder.decode(b"", final=True))
+    finally:
+        os.close(read_fd)
+        os.close(original_fd)
+
+
+@contextmanager
+def tee_output_pipe():
+    """Duplicate stdout and stderr on the file descriptor level in-process.
+
+    Like :py:func:`tee_output_fd` this captures all outputs, including those
+    of C-extensions and child-processes. But instead of starting tee processes
+    and using a temporary file, the file descriptors are redirected to pipes,
+    which are read by two threads that copy all data to the original streams
+    and into memory.
+    """
+    original_fds = (1, 2)
+    saved_fds = [os.dup(fd) for fd in original_fds]
+    out = CapturedPipeOutput()
+    readers = []
+    flush()
+    for original_fd, saved_fd in zip(original_fds, saved_fds):
+        read_fd, write_fd = os.pipe()
+        reader = threading.Thread(
+            target=_copy_pipe,
+            args=(read_fd, os.dup(saved_fd), out),
+            name="sacred-tee-{}".format(original_fd),
+            daemon=True,
+        )
+        reader.start()
+        readers.append(reader)
+        os.dup2(write_fd, original_fd)
+        os.close(write_fd)
+
+    try:
+        yield out  # let the caller do their printing
+    finally:
+        flush()
+        # restoring the original fds closes the write ends of the pipes,
+        # so the readers reach EOF once they copied everything
+        for original_fd, saved_fd in zip(original_fds, saved_fds):
+            os.dup2(saved_fd, original_fd)
+            os.close(saved_fd)
+        for reader in readers:
+            # child processes that are still running may keep the pipe open
+            reader.join(timeout=1)
+            if reader.is_alive():
+                warnings.warn(
+                    "{} did not finish. Its output stays uncaptured.".format(
+                        reader.name
+                    )
+                )
+        out.finalize()
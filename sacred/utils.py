@@ -40,6 +40,7 @@ __all__ = [
     "optional_kwargs_decorator",
     "get_inheritors",
     "apply_backspaces_and_linefeeds",
+    "BackspaceLinefeedStream",
     "rel_path",
     "IntervalTimer",
     "PathType",
@@ -616,38 +617,92 @@ def apply_backspaces_and_linefeeds(text):
 
     If final line ends with a carriage it keeps it to be concatenable with next
     output chunk.
+
+    When used as captured_out_filter, the run uses a
+    :py:class:`BackspaceLinefeedStream` instead, which only processes the new
+    output of each heartbeat.
     """
-    orig_lines = text.split("\n")
-    orig_lines_len = len(orig_lines)
-    new_lines = []
-    for orig_line_idx, orig_line in enumerate(orig_lines):
-        chars, cursor = [], 0
-        orig_line_len = len(orig_line)
-        for orig_char_idx, orig_char in enumerate(orig_line):
-            if orig_char == "\r" and (
-                orig_char_idx != orig_line_len - 1
-                or orig_line_idx != orig_lines_len - 1
-            ):
+    finished, current_line = BackspaceLinefeedStream().feed(text)
+    return finished + current_line
+
+
+class BackspaceLinefeedStream:
+    """Incremental version of :py:func:`apply_backspaces_and_linefeeds`.
+
+    Keeps the current (unfinished) line and the cursor position between calls
+    to :py:meth:`feed`, so every character of the output is processed only
+    once. Lines are rewritten with string slices instead of character by
+    character.
+
+    Keras progress lines are dropped together with the linefeed before them.
+    So the linefeed of the last finished line is held back and returned at
+    the start of the current line, until it is known that the line after it
+    is not a progress line.
+    """
+
+    _control_chars = re.compile(r"[\r\b\n]")
+    _keras_progress = re.compile(r"\[=*>?\.+\]\s-\sETA:")
+
+    def __init__(self):
+        self._line = ""
+        self._cursor = 0
+        self._carriage_return = False
+        self._linefeed_held = False
+
+    def feed(self, text):
+        """Process new output.
+
+        :param text: The output written since the last call.
+        :return: A tuple of the lines that were finished by this text
+                 (with the linefeeds between them) and the current unfinished
+                 line (starting with the held back linefeed).
+        """
+        finished = []
+        line, cursor = self._line, self._cursor
+        position = 0
+        for match in self._control_chars.finditer(text):
+            segment = text[position : match.start()]
+            if segment:
+                line = line[:cursor] + segment + line[cursor + len(segment) :]
+                cursor += len(segment)
+            char = match.group()
+            if char == "\n":
+                if not self._keras_progress.search(line):
+                    if self._linefeed_held:
+                        finished.append("\n")
+                    finished.append(line)
+                    self._linefeed_held = True
+                line, cursor = "", 0
+            elif char == "\r":
                 cursor = 0
-            elif orig_char == "\b":
-                cursor = max(0, cursor - 1)
             else:
-                if (
-                    orig_char == "\r"
-                    and orig_char_idx == orig_line_len - 1
-                    and orig_line_idx == orig_lines_len - 1
-                ):
-                    cursor = len(chars)
-                if cursor == len(chars):
-                    chars.append(orig_char)
-                else:
-                    chars[cursor] = orig_char
-                cursor += 1
-        new_line = "".join(chars)
-        match = re.search(r"\[=*>?\.+\]\s-\sETA:", new_line)
-        if not match:
-            new_lines.append(new_line)
-    return "\n".join(new_lines)
+                cursor = max(0, cursor - 1)
+            position = match.end()
+        segment = text[position:]
+        if segment:
+            line = line[:cursor] + segment + line[cursor + len(segment) :]
+            cursor += len(segment)
+        if text:
+            self._carriage_return = text.endswith("\r")
+        self._line, self._cursor = line, cursor
+        return "".join(finished), self.current_line
+
+    @property
+    def current_line_dropped(self):
+        return bool(self._keras_progress.search(self._line))
+
+    @property
+    def current_line(self):
+        """The unfinished last line, as apply_backspaces_and_linefeeds shows it."""
+        if self.current_line_dropped:
+            return ""
+        # a trailing carriage return is kept to be concatenable with new output
+        line = self._line + "\r" if self._carriage_return else self._line
+        return "\n" + line if self._linefeed_held else line
+
+
+# lets CapturedOutput process only the new output with every heartbeat
+apply_backspaces_and_linefeeds.create_stream = BackspaceLinefeedStream
 
 
 def module_exists(modname):
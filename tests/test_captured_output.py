@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import re
+
+import mock
+import pytest
+
+from sacred.captured_output import CapturedOutput, common_prefix_length
+from sacred.utils import apply_backspaces_and_linefeeds
+
+
+def test_captured_output_without_limit():
+    out = CapturedOutput()
+    out.write("foo\n")
+    out.write("bar")
+    assert out.getvalue() == "foo\nbar"
+    assert out.read() == "foo\nbar"
+    assert out.read(4) == "bar"
+    assert len(out) == 7
+    assert not out.truncated
+
+
+def test_captured_output_keeps_head_and_tail():
+    out = CapturedOutput(max_size=10)
+    for i in range(10):
+        out.write("{}\n".format(i))
+    assert out.truncated
+    assert len(out) == 20
+    assert out.getvalue() == "0\n1\n2\n[... 10 characters omitted ...]\n\n8\n9\n"
+    assert out.read() == "".join("{}\n".format(i) for i in range(10))
+    assert out.read(12) == "6\n7\n8\n9\n"
+    assert out.read(16) == "8\n9\n"
+
+
+def test_captured_output_filters_only_unfinished_line():
+    seen = []
+
+    def output_filter(text):
+        seen.append(text)
+        return apply_backspaces_and_linefeeds(text)
+
+    out = CapturedOutput(output_filter=output_filter)
+    out.write("first line\nprogress 1")
+    out.write("\rprogress 2")
+    out.write("\rprogress 3\nlast")
+    assert seen == [
+        "first line\nprogress 1",
+        "progress 1\rprogress 2",
+        "progress 2\rprogress 3\nlast",
+    ]
+    assert out.getvalue() == "first line\nprogress 3\nlast"
+
+
+def test_captured_output_changes_since():
+    out = CapturedOutput(output_filter=apply_backspaces_and_linefeeds)
+    out.write("done\nprogress 1")
+    offset, text, mark = out.changes_since((0, ""))
+    assert (offset, text) == (0, "done\nprogress 1")
+    out.write("\rprogress 2")
+    offset, text, mark = out.changes_since(mark)
+    assert (offset, text) == (14, "2")
+    offset, text, mark = out.changes_since(mark)
+    assert (offset, text) == (15, "")
+
+
+def test_captured_output_changes_since_truncated_output():
+    out = CapturedOutput(max_size=4)
+    out.write("ab")
+    offset, text, mark = out.changes_since((0, ""))
+    out.write("cdefgh")
+    offset, text, mark = out.changes_since(mark)
+    marker = CapturedOutput.OMISSION_MARKER.format(4)
+    assert (offset, text) == (2, marker + "gh")
+
+
+def test_captured_output_deltas_are_truncated():
+    out = CapturedOutput(max_size=100)
+    out.write("start\n")
+    received = ""
+    mark = (0, "")
+    for i in range(200):
+        out.write("line {}\n".format(i))
+        if i % 7 == 0:
+            offset, text, mark = out.changes_since(mark)
+            assert len(text) <= 100 + len(CapturedOutput.OMISSION_MARKER) + 5
+            received = received[:offset] + text
+            assert received == out.getvalue()
+    offset, text, mark = out.changes_since(mark)
+    received = received[:offset] + text
+    assert received == out.getvalue()
+    assert len(received) < 150
+
+
+def test_captured_output_changes_since_does_not_read_spill_file():
+    out = CapturedOutput(max_size=10)
+    out.write("x" * 100)
+    mark = out.changes_since((0, ""))[2]
+    out.write("y" * 100)
+    with mock.patch.object(out._spill_file, "read") as read:
+        out.changes_since(mark)
+    assert not read.called
+
+
+def test_captured_output_invalid_max_size():
+    with pytest.raises(ValueError):
+        CapturedOutput(max_size=1)
+
+
+@pytest.mark.parametrize(
+    "old,new,expected",
+    [("", "abc", 0), ("abc", "abcd", 3), ("abc", "abd", 2), ("abc", "ab", 2)],
+)
+def test_common_prefix_length(old, new, expected):
+    assert common_prefix_length(old, new) == expected
+
+
+def _apply_backspaces_and_linefeeds_at_once(text):
+    """The original, non-incremental implementation of the filter."""
+    orig_lines = text.split("\n")
+    new_lines = []
+    for line_idx, orig_line in enumerate(orig_lines):
+        chars, cursor = [], 0
+        for char_idx, char in enumerate(orig_line):
+            is_last = char_idx == len(orig_line) - 1 and line_idx == len(orig_lines) - 1
+            if char == "\r" and not is_last:
+                cursor = 0
+            elif char == "\b":
+                cursor = max(0, cursor - 1)
+            else:
+                if char == "\r":
+                    cursor = len(chars)
+                if cursor == len(chars):
+                    chars.append(char)
+                else:
+                    chars[cursor] = char
+                cursor += 1
+        new_line = "".join(chars)
+        if not re.search(r"\[=*>?\.+\]\s-\sETA:", new_line):
+            new_lines.append(new_line)
+    return "\n".join(new_lines)
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "Epoch 1/2\n[====>....] - ETA: 1s",
+        "Epoch 1/2\n[====>....] - ETA: 1s\r[=========>] - ETA: 0s",
+        "Epoch 1/2\n[====>....] - ETA: 1s\r[=========>] - ETA: 0s\ndone\n",
+        "[==>...] - ETA: 3s\n[====>.] - ETA: 1s\nloss: 0.1\n",
+        "a\n\n[==>...] - ETA: 3s\r",
+        "10%\r20%\r100%\ndone\n[>....] - ETA: 9s\b\b8s",
+        "abcd\refg\r\nxyz\b\b1\n",
+    ],
+)
+def test_captured_output_in_chunks_matches_filter_at_once(text):
+    expected = _apply_backspaces_and_linefeeds_at_once(text)
+    assert apply_backspaces_and_linefeeds(text) == expected
+    for chunk_size in range(1, len(text) + 1):
+        out = CapturedOutput(output_filter=apply_backspaces_and_linefeeds)
+        for i in range(0, len(text), chunk_size):
+            out.write(text[i : i + chunk_size])
+        assert out.getvalue() == expected
+
+
+def test_captured_output_uses_streaming_filter():
+    out = CapturedOutput(output_filter=apply_backspaces_and_linefeeds)
+    out.write("first line\nprogress 1")
+    out.write("\rprogress 2\r")
+    assert out.getvalue() == "first line\nprogress 2\r"
+    out.write("progress 3\nlast")
+    assert out.getvalue() == "first line\nprogress 3\nlast"
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # coding=utf-8
 
+import json
 import os.path
 import os
 
@@ -8,12 +9,21 @@ import mock
 import pytest
 from sacred.dependencies import (
     PEP440_VERSION_PATTERN,
+    DigestCache,
+    DistributionIndex,
     PackageDependency,
     Source,
     gather_sources_and_dependencies,
+    get_commit_if_possible,
     get_digest,
+    get_distribution_index,
+    git_info_cache,
     get_py_file_if_possible,
+    get_sources_from_local_dir,
+    is_ignored,
     is_local_source,
+    iterate_all_python_files,
+    parse_ignore_patterns,
 )
 import sacred.optional as opt
 
@@ -68,6 +78,244 @@ def test_source_get_digest():
     assert get_digest(EXAMPLE_SOURCE) == EXAMPLE_DIGEST
 
 
+def _make_old(path):
+    # entries of recently modified files are not cached
+    os.utime(str(path), ns=(1000000000, 1000000000))
+
+
+def test_digest_cache_reuses_digests_across_instances(tmpdir):
+    cache_file = str(tmpdir.join("cache", "digests.json"))
+    source = tmpdir.join("source.py")
+    source.write("print('hello')")
+    _make_old(source)
+    cache = DigestCache(cache_file)
+    assert cache.get_digest(str(source)) == get_digest(str(source))
+    cache.save()
+
+    cache = DigestCache(cache_file)
+    with mock.patch("sacred.dependencies.get_digest") as get_digest_mock:
+        assert cache.get_digest(str(source)) == get_digest(str(source))
+    assert not get_digest_mock.called
+
+
+def test_digest_cache_detects_changed_files(tmpdir):
+    source = tmpdir.join("source.py")
+    source.write("print('hello')")
+    _make_old(source)
+    cache = DigestCache(str(tmpdir.join("digests.json")))
+    cache.get_digest(str(source))
+    source.write("print('changed')")
+    _make_old(source)
+    assert cache.get_digest(str(source)) == get_digest(str(source))
+
+
+def test_digest_cache_skips_recently_modified_files(tmpdir):
+    cache_file = tmpdir.join("digests.json")
+    source = tmpdir.join("source.py")
+    source.write("print('hello')")
+    cache = DigestCache(str(cache_file))
+    cache.get_digest(str(source))
+    cache.save()
+    assert not cache_file.exists()
+
+
+def test_digest_cache_ignores_broken_cache_file(tmpdir):
+    cache_file = tmpdir.join("digests.json")
+    cache_file.write("{not json")
+    source = tmpdir.join("source.py")
+    source.write("print('hello')")
+    _make_old(source)
+    cache = DigestCache(str(cache_file))
+    assert cache.get_digest(str(source)) == get_digest(str(source))
+    cache.save()
+    assert str(source) in cache_file.read()
+
+
+def test_digest_cache_prunes_stale_entries(tmpdir):
+    cache_file = str(tmpdir.join("digests.json"))
+    changed, deleted, kept = [tmpdir.join(n + ".py") for n in "abc"]
+    for source in [changed, deleted, kept]:
+        source.write("print('hello')")
+        _make_old(source)
+    cache = DigestCache(cache_file)
+    for source in [changed, deleted, kept]:
+        cache.get_digest(str(source))
+    cache.save()
+    changed.write("print('changed')")
+    _make_old(changed)
+    deleted.remove()
+    new = tmpdir.join("new.py")
+    new.write("print('new')")
+    _make_old(new)
+
+    cache = DigestCache(cache_file)
+    cache.get_digest(str(new))
+    cache.save()
+    with open(cache_file) as f:
+        entries = json.load(f)["entries"]
+    assert sorted(entries) == sorted([str(kept), str(new)])
+
+
+def test_digest_cache_is_only_written_with_new_entries(tmpdir):
+    cache_file = tmpdir.join("digests.json")
+    source = tmpdir.join("source.py")
+    source.write("print('hello')")
+    _make_old(source)
+    cache = DigestCache(str(cache_file))
+    cache.get_digest(str(source))
+    cache.save()
+    mtime = cache_file.mtime()
+    cache_file.setmtime(mtime - 100)
+
+    cache = DigestCache(str(cache_file))
+    cache.get_digest(str(source))
+    cache.save()
+    assert cache_file.mtime() == mtime - 100
+
+
+def test_git_info_is_computed_once_per_repository(tmpdir):
+    git = pytest.importorskip("git")
+    repo = git.Repo.init(str(tmpdir))
+    tmpdir.join("a.py").write("a = 1")
+    tmpdir.mkdir("sub").join("b.py").write("b = 1")
+    repo.index.add(["a.py", "sub/b.py"])
+    repo.index.commit("initial")
+    with mock.patch.object(git, "Repo", wraps=git.Repo) as repo_mock:
+        with git_info_cache():
+            info_a = get_commit_if_possible(str(tmpdir.join("a.py")), True)
+            info_b = get_commit_if_possible(str(tmpdir.join("sub", "b.py")), True)
+    assert repo_mock.call_count == 1
+    assert info_a == info_b
+    assert info_a[1] == repo.head.commit.hexsha
+    assert info_a[2] is False
+
+
+def test_get_commit_if_possible_outside_of_repository(tmpdir):
+    tmpdir.join("a.py").write("a = 1")
+    assert get_commit_if_possible(str(tmpdir.join("a.py")), True) == (
+        None,
+        None,
+        None,
+    )
+
+
+@pytest.mark.parametrize(
+    "pattern, path, is_dir, ignored",
+    [
+        ("*.py", "a.py", False, True),
+        ("*.py", "sub/a.py", False, True),
+        ("*.py", "a.pyc", False, False),
+        ("/a.py", "a.py", False, True),
+        ("/a.py", "sub/a.py", False, False),
+        ("sub/a.py", "sub/a.py", False, True),
+        ("sub/a.py", "x/sub/a.py", False, False),
+        ("data/", "data", True, True),
+        ("data/", "data", False, False),
+        ("data/", "sub/data", True, True),
+        ("**/data", "x/y/data", True, True),
+        ("a/**/b.py", "a/b.py", False, True),
+        ("a/**/b.py", "a/x/y/b.py", False, True),
+        ("a/**", "a/x/b.py", False, True),
+        ("a/**", "a", True, False),
+        ("b?.py", "b1.py", False, True),
+        ("b?.py", "b10.py", False, False),
+        ("b[0-9].py", "b1.py", False, True),
+        ("b[!0-9].py", "b1.py", False, False),
+        ("\\#a.py", "#a.py", False, True),
+        ("# comment", "# comment", False, False),
+    ],
+)
+def test_ignore_patterns(pattern, path, is_dir, ignored):
+    base = os.path.abspath("base")
+    rules = parse_ignore_patterns([pattern], base)
+    full_path = os.path.join(base, *path.split("/"))
+    assert is_ignored(full_path, is_dir, rules) == ignored
+
+
+def test_ignore_patterns_last_match_wins():
+    base = os.path.abspath("base")
+    rules = parse_ignore_patterns(["*.py", "!keep.py"], base)
+    assert is_ignored(os.path.join(base, "a.py"), False, rules)
+    assert not is_ignored(os.path.join(base, "keep.py"), False, rules)
+
+
+def _make_tree(tmpdir):
+    tmpdir.join("main.py").write("")
+    tmpdir.join("notes.txt").write("")
+    tmpdir.mkdir("pkg").join("mod.py").write("")
+    tmpdir.join("pkg").join("generated.py").write("")
+    tmpdir.mkdir("data").join("loader.py").write("")
+    tmpdir.mkdir(".venv").mkdir("lib").join("site.py").write("")
+    tmpdir.mkdir("__pycache__").join("cached.py").write("")
+    return {
+        os.path.join(str(tmpdir), *p.split("/"))
+        for p in ["main.py", "pkg/mod.py", "pkg/generated.py", "data/loader.py"]
+    }
+
+
+def test_iterate_all_python_files_uses_default_excludes(tmpdir):
+    expected = _make_tree(tmpdir)
+    assert set(iterate_all_python_files(str(tmpdir))) == expected
+
+
+def test_iterate_all_python_files_honors_gitignore(tmpdir):
+    expected = _make_tree(tmpdir)
+    tmpdir.join(".gitignore").write("# data files\ndata/\n")
+    tmpdir.join("pkg", ".gitignore").write("generated.py\n")
+    expected -= {
+        str(tmpdir.join("data", "loader.py")),
+        str(tmpdir.join("pkg", "generated.py")),
+    }
+    assert set(iterate_all_python_files(str(tmpdir))) == expected
+    assert set(iterate_all_python_files(str(tmpdir), use_gitignore=False)) == (
+        expected
+        | {
+            str(tmpdir.join("data", "loader.py")),
+            str(tmpdir.join("pkg", "generated.py")),
+        }
+    )
+
+
+def test_iterate_all_python_files_with_custom_excludes(tmpdir):
+    _make_tree(tmpdir)
+    assert set(iterate_all_python_files(str(tmpdir), exclude=["pkg/", "data"])) == {
+        str(tmpdir.join("main.py")),
+        str(tmpdir.join(".venv", "lib", "site.py")),
+        str(tmpdir.join("__pycache__", "cached.py")),
+    }
+
+
+def test_iterate_all_python_files_prunes_excluded_directories(tmpdir):
+    _make_tree(tmpdir)
+    walked = []
+    original_walk = os.walk
+
+    def recording_walk(top, *args, **kwargs):
+        for dirname, subdirs, files in original_walk(top, *args, **kwargs):
+            walked.append(os.path.basename(dirname))
+            yield dirname, subdirs, files
+
+    with mock.patch("os.walk", recording_walk):
+        list(iterate_all_python_files(str(tmpdir), exclude=["data/"]))
+    assert "data" not in walked
+    assert "pkg" in walked
+
+
+def test_iterate_all_python_files_uses_gitignore_of_parent_directories(tmpdir):
+    tmpdir.mkdir(".git")
+    tmpdir.join(".gitignore").write("/project/build/\n")
+    project = tmpdir.mkdir("project")
+    project.join("main.py").write("")
+    project.mkdir("build").join("lib.py").write("")
+    assert set(iterate_all_python_files(str(project))) == {str(project.join("main.py"))}
+
+
+def test_get_sources_from_local_dir(tmpdir):
+    expected = _make_tree(tmpdir)
+    sources = get_sources_from_local_dir({}, str(tmpdir), save_git_info=False)
+    assert sources == {Source.create(f, save_git_info=False) for f in expected}
+
+
 def test_source_create_empty():
     with pytest.raises(ValueError):
         Source.create("")
@@ -138,6 +386,50 @@ def test_package_dependency_repr():
     assert repr(pd) == "<PackageDependency: pytest=12.4>"
 
 
+def test_package_dependencies_can_be_sorted():
+    deps = [PackageDependency("b", "1"), PackageDependency("a", "1")]
+    assert [d.name for d in sorted(deps)] == ["a", "b"]
+
+
+def test_distribution_index():
+    index = DistributionIndex(
+        [
+            ("PyYAML", "5.1", ["yaml", "_yaml"]),
+            ("typing_extensions", "4.0", ["typing_extensions"]),
+            ("pyyaml", "3.0", ["yaml"]),
+        ]
+    )
+    assert index.lookup_module("yaml") == ("PyYAML", "5.1")
+    assert index.lookup_module("_yaml") == ("PyYAML", "5.1")
+    assert index.lookup_module("foo") is None
+    assert index.lookup_name("pyyaml") == ("PyYAML", "5.1")
+    assert index.lookup_name("typing-extensions") == ("typing_extensions", "4.0")
+
+
+def test_package_dependency_create_uses_distribution_name():
+    mod = mock.Mock(spec=[], __name__="yaml")
+    index = DistributionIndex([("PyYAML", "5.1", ["yaml"])])
+    with mock.patch("sacred.dependencies.get_distribution_index", return_value=index):
+        pd = PackageDependency.create(mod)
+    assert pd.name == "PyYAML"
+    assert pd.version == "5.1"
+
+
+def test_distribution_index_is_built_once(tmpdir):
+    with mock.patch(
+        "sacred.dependencies.iterate_distributions", return_value=[]
+    ) as iterate_mock:
+        with mock.patch("sys.path", [str(tmpdir)]):
+            index = get_distribution_index()
+            assert get_distribution_index() is index
+            assert iterate_mock.call_count == 1
+            # installing a package changes the modification time
+            tmpdir.mkdir("newpackage")
+            os.utime(str(tmpdir), ns=(0, 0))
+            assert get_distribution_index() is not index
+            assert iterate_mock.call_count == 2
+
+
 def test_gather_sources_and_dependencies():
     from tests.dependency_example import some_func
 
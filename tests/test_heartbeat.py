@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import pytest
+
+from sacred.captured_output import CapturedOutput
+from sacred.heartbeat import HeartbeatTracker, wants_delta_heartbeats
+
+
+def test_first_diff_contains_everything():
+    tracker = HeartbeatTracker()
+    delta = tracker.diff({"a": 1, "b": [1, 2]}, "out", 7)
+    assert delta.info_updates == {"a": 1, "b": [1, 2]}
+    assert delta.info_removed == []
+    assert delta.captured_out_offset == 0
+    assert delta.captured_out_tail == "out"
+    assert delta.result_changed
+    assert delta.result == 7
+
+
+def test_unchanged_state_gives_empty_delta():
+    tracker = HeartbeatTracker()
+    tracker.diff({"a": 1}, "out", None)
+    delta = tracker.diff({"a": 1}, "out", None)
+    assert delta.is_empty
+
+
+def test_diff_reports_only_changed_info_keys():
+    tracker = HeartbeatTracker()
+    info = {"a": 1, "b": [1, 2], "c": "x"}
+    tracker.diff(info, "", None)
+    info["b"].append(3)
+    info["d"] = 4
+    del info["c"]
+    delta = tracker.diff(info, "", None)
+    assert delta.info_updates == {"b": [1, 2, 3], "d": 4}
+    assert delta.info_removed == ["c"]
+    assert not delta.captured_out_changed
+    assert not delta.result_changed
+
+
+def test_diff_detects_type_changes():
+    tracker = HeartbeatTracker()
+    tracker.diff({"a": 1}, "", None)
+    assert tracker.diff({"a": 1.0}, "", None).info_updates == {"a": 1.0}
+
+
+def test_delta_values_are_snapshots():
+    tracker = HeartbeatTracker()
+    info = {"a": [1]}
+    delta = tracker.diff(info, "", None)
+    info["a"].append(2)
+    assert delta.info_updates == {"a": [1]}
+
+
+def test_captured_out_is_sent_as_appended_text():
+    tracker = HeartbeatTracker()
+    tracker.diff({}, "hello", None)
+    delta = tracker.diff({}, "hello world", None)
+    assert delta.captured_out_offset == 5
+    assert delta.captured_out_tail == " world"
+    assert delta.apply_captured_out("hello") == "hello world"
+
+
+def test_captured_out_rewrite_keeps_common_prefix():
+    tracker = HeartbeatTracker()
+    tracker.diff({}, "progress 1", None)
+    delta = tracker.diff({}, "progress 2\n", None)
+    assert delta.captured_out_offset == 9
+    assert delta.captured_out_tail == "2\n"
+    assert delta.apply_captured_out("progress 1") == "progress 2\n"
+
+
+def test_captured_out_deltas_respect_max_size():
+    out = CapturedOutput(max_size=100)
+    tracker = HeartbeatTracker()
+    stored = ""
+    for i in range(100):
+        out.write("output line {}\n".format(i))
+        delta = tracker.diff({}, out, None)
+        stored = delta.apply_captured_out(stored)
+        assert len(delta.captured_out_tail) < 150
+    assert stored == out.getvalue()
+    assert len(stored) < 150
+
+
+def test_apply_info():
+    tracker = HeartbeatTracker()
+    tracker.diff({"a": 1, "b": 2}, "", None)
+    delta = tracker.diff({"a": 3}, "", None)
+    assert delta.apply_info({"a": 1, "b": 2}) == {"a": 3}
+
+
+def test_uncopyable_values_are_always_sent():
+    class Uncopyable:
+        def __deepcopy__(self, memo):
+            raise TypeError("nope")
+
+    value = Uncopyable()
+    tracker = HeartbeatTracker()
+    assert tracker.diff({"a": value}, "", None).info_updates == {"a": value}
+    assert tracker.diff({"a": value}, "", None).info_updates == {"a": value}
+
+
+def test_numpy_arrays_are_compared_by_value():
+    np = pytest.importorskip("numpy")
+    tracker = HeartbeatTracker()
+    tracker.diff({"a": np.arange(3)}, "", None)
+    assert tracker.diff({"a": np.arange(3)}, "", None).is_empty
+    assert "a" in tracker.diff({"a": np.arange(4)}, "", None).info_updates
+
+
+def test_containers_of_numpy_arrays_are_compared_by_value():
+    np = pytest.importorskip("numpy")
+    tracker = HeartbeatTracker()
+    tracker.diff({"a": [np.arange(3)], "b": {"c": np.ones(2)}}, "", np.zeros(1))
+    delta = tracker.diff({"a": [np.arange(3)], "b": {"c": np.ones(2)}}, "", np.zeros(1))
+    assert delta.is_empty
+    delta = tracker.diff({"a": [np.arange(3)], "b": {"c": np.zeros(2)}}, "", None)
+    assert delta.info_updates.keys() == {"b"}
+    assert delta.result_changed
+
+
+def test_wants_delta_heartbeats():
+    class DeltaObserver:
+        delta_heartbeats = True
+
+    assert wants_delta_heartbeats(DeltaObserver())
+    assert not wants_delta_heartbeats(object())
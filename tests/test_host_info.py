@@ -1,9 +1,34 @@
 #!/usr/bin/env python
 # coding=utf-8
 
+import time
+
+import mock
 import pytest
 
-from sacred.host_info import get_host_info, host_info_getter, host_info_gatherers
+from sacred import SETTINGS
+from sacred.host_info import (
+    IgnoreHostInfo,
+    clear_host_info_cache,
+    get_host_info,
+    host_info_gatherer,
+    host_info_getter,
+    host_info_gatherers,
+)
+
+
+@pytest.fixture
+def counting_getter():
+    calls = []
+
+    @host_info_gatherer("counted", cacheable=True)
+    def counted():
+        calls.append(1)
+        return len(calls)
+
+    clear_host_info_cache()
+    yield counted, calls
+    clear_host_info_cache()
 
 
 def test_get_host_info():
@@ -57,3 +82,134 @@ def test_host_info_decorator_depreciation_warning():
 
     finally:
         del host_info_gatherers["foo"]
+
+
+def test_host_info_cache_reuses_cacheable_results(counting_getter):
+    getter, calls = counting_getter
+    assert get_host_info([getter])["counted"] == 1
+    assert get_host_info([getter])["counted"] == 1
+    assert len(calls) == 1
+
+
+def test_host_info_cache_does_not_cache_other_getters():
+    calls = []
+
+    @host_info_gatherer("uncached")
+    def uncached():
+        calls.append(1)
+        return len(calls)
+
+    assert get_host_info([uncached])["uncached"] == 1
+    assert get_host_info([uncached])["uncached"] == 2
+
+
+def test_host_info_cache_expires(counting_getter):
+    getter, calls = counting_getter
+    with mock.patch.dict(SETTINGS.HOST_INFO, CACHE_TTL=0.1):
+        get_host_info([getter])
+        time.sleep(0.15)
+        assert get_host_info([getter])["counted"] == 2
+    with mock.patch.dict(SETTINGS.HOST_INFO, CACHE_TTL=0):
+        assert get_host_info([getter])["counted"] == 3
+        assert get_host_info([getter])["counted"] == 4
+
+
+def test_host_info_cache_remembers_ignored_getters():
+    calls = []
+
+    @host_info_gatherer("ignored", cacheable=True)
+    def ignored():
+        calls.append(1)
+        raise IgnoreHostInfo()
+
+    clear_host_info_cache()
+    assert "ignored" not in get_host_info([ignored])
+    assert "ignored" not in get_host_info([ignored])
+    assert len(calls) == 1
+    clear_host_info_cache()
+
+
+def test_host_info_cache_is_not_used_for_disabled_getters():
+    enabled = [True]
+
+    @host_info_gatherer("toggled", cacheable=True, enabled=lambda: enabled[0])
+    def toggled():
+        return "info" if enabled[0] else None
+
+    clear_host_info_cache()
+    assert get_host_info([toggled])["toggled"] == "info"
+    enabled[0] = False
+    assert get_host_info([toggled])["toggled"] is None
+    clear_host_info_cache()
+
+
+def test_disabled_gpu_info_is_not_read_from_cache():
+    from sacred.host_info import _gpus
+
+    clear_host_info_cache()
+    with mock.patch(
+        "subprocess.check_output", return_value=b"<nvidia_smi_log></nvidia_smi_log>"
+    ), mock.patch.dict(SETTINGS.HOST_INFO, INCLUDE_GPU_INFO=True):
+        assert get_host_info([_gpus])["gpus"] == {"gpus": []}
+    assert get_host_info([_gpus])["gpus"] is None
+    clear_host_info_cache()
+
+
+def test_host_info_cache_file(counting_getter, tmpdir):
+    getter, calls = counting_getter
+    cache_file = str(tmpdir.join("host_info.json"))
+    with mock.patch.dict(SETTINGS.HOST_INFO, CACHE_FILE=cache_file):
+        get_host_info([getter])
+        clear_host_info_cache()  # as in a new process
+        assert get_host_info([getter])["counted"] == 1
+    assert len(calls) == 1
+
+
+def test_host_info_cache_file_is_per_interpreter(counting_getter, tmpdir):
+    getter, calls = counting_getter
+    cache_file = str(tmpdir.join("host_info.json"))
+    with mock.patch.dict(SETTINGS.HOST_INFO, CACHE_FILE=cache_file):
+        get_host_info([getter])
+        clear_host_info_cache()
+        with mock.patch("sys.executable", "/other/venv/bin/python"):
+            assert get_host_info([getter])["counted"] == 2
+    assert len(calls) == 2
+
+
+def test_host_info_getters_run_concurrently():
+    @host_info_gatherer("slow1")
+    def slow1():
+        time.sleep(0.3)
+        return 1
+
+    @host_info_gatherer("slow2")
+    def slow2():
+        time.sleep(0.3)
+        return 2
+
+    start = time.time()
+    host_info = get_host_info([slow1, slow2])
+    assert time.time() - start < 0.55
+    assert host_info["slow1"] == 1
+    assert host_info["slow2"] == 2
+
+
+def test_host_info_getter_timeout():
+    @host_info_gatherer("hanging", timeout=0.1)
+    def hanging():
+        time.sleep(2)
+
+    start = time.time()
+    host_info = get_host_info([hanging])
+    assert time.time() - start < 1
+    assert "hanging" not in host_info
+    assert "hostname" in host_info
+
+
+def test_host_info_getter_exceptions_are_raised():
+    @host_info_gatherer("broken")
+    def broken():
+        raise RuntimeError("broken")
+
+    with pytest.raises(RuntimeError):
+        get_host_info([broken])
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import json
+import subprocess
+import sys
+
+import pytest
+
+# modules that are expensive to import and must only be imported on demand
+HEAVY_MODULES = [
+    "numpy",
+    "pandas",
+    "jsonpickle.ext.numpy",
+    "jsonpickle.ext.pandas",
+    "pymongo",
+    "sqlalchemy",
+    "boto3",
+    "tinydb",
+    "cpuinfo",
+    "git",
+]
+
+
+def run_python(code):
+    output = subprocess.check_output([sys.executable, "-c", code])
+    return json.loads(output.decode().splitlines()[-1])
+
+
+def test_import_sacred_does_not_import_heavy_modules():
+    imported = run_python(
+        "import json, sys, sacred; print(json.dumps(sorted(sys.modules)))"
+    )
+    assert [m for m in HEAVY_MODULES if m in imported] == []
+
+
+def test_experiment_setup_does_not_import_heavy_modules():
+    imported = run_python(
+        "import json, sys\n"
+        "from sacred import Experiment\n"
+        "from sacred.observers import FileStorageObserver\n"
+        "ex = Experiment('test', interactive=True, save_git_info=False)\n"
+        "ex.add_config(a=1)\n"
+        "print(json.dumps(sorted(sys.modules)))"
+    )
+    assert [m for m in HEAVY_MODULES if m in imported] == []
+
+
+def test_lazy_observer_imports():
+    import sacred.observers
+
+    assert sacred.observers.MongoObserver.__module__ == "sacred.observers.mongo"
+    assert "MongoObserver" in dir(sacred.observers)
+    with pytest.raises(AttributeError):
+        sacred.observers.NoSuchObserver
+
+
+def test_serializer_handlers_are_registered_on_import():
+    pytest.importorskip("numpy")
+    result = run_python(
+        "import json\n"
+        "from sacred.serializer import flatten, restore\n"
+        "import numpy as np\n"
+        "a = np.arange(3, dtype=np.float32)\n"
+        "b = restore(flatten(a))\n"
+        "print(json.dumps([str(b.dtype), b.tolist()]))"
+    )
+    assert result == ["float32", [0.0, 1.0, 2.0]]
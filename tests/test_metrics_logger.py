@@ -138,3 +138,93 @@ def test_linearize_metrics():
     assert linearized["training.accuracy"]["values"] == [50, 100, 150, 300]
     assert linearized["training.loss"]["steps"] == [10, 20]
     assert linearized["training.loss"]["values"] == [100, 200]
+
+
+def test_get_last_metrics_by_name(ex):
+    metrics = {}
+
+    @ex.main
+    def main_function(_run):
+        for i in range(10):
+            _run.log_scalar("training.loss", i * i)
+            _run.log_scalar("training.accuracy", i + 1, i * 10)
+        metrics["first"] = ex.current_run._metrics.get_last_metrics_by_name()
+        metrics["second"] = ex.current_run._metrics.get_last_metrics_by_name()
+
+    ex.run()
+    linearized = metrics["first"]
+    assert set(linearized.keys()) == {"training.loss", "training.accuracy"}
+    assert linearized["training.loss"]["name"] == "training.loss"
+    assert linearized["training.loss"]["steps"] == list(range(10))
+    assert linearized["training.loss"]["values"] == [i * i for i in range(10)]
+    assert linearized["training.accuracy"]["steps"] == list(range(0, 100, 10))
+    assert len(linearized["training.accuracy"]["timestamps"]) == 10
+    assert linearize_metrics(linearized) is linearized
+    # reading swaps out the buffer
+    assert metrics["second"] == {}
+
+
+def test_log_scalars(ex):
+    metrics = {}
+
+    @ex.main
+    def main_function(_run):
+        _run.log_scalars({"training.loss": 1.5, "training.accuracy": 0.5})
+        ex.log_scalars({"training.loss": 1.0, "training.accuracy": 0.75}, step=10)
+        _run.log_scalars({"training.loss": 0.5})
+        metrics["metrics"] = ex.current_run._metrics.get_last_metrics_by_name()
+
+    ex.run()
+    linearized = metrics["metrics"]
+    assert linearized["training.loss"]["steps"] == [0, 10, 11]
+    assert linearized["training.loss"]["values"] == [1.5, 1.0, 0.5]
+    assert linearized["training.accuracy"]["steps"] == [0, 10]
+    assert linearized["training.accuracy"]["values"] == [0.5, 0.75]
+    timestamps = linearized["training.accuracy"]["timestamps"]
+    assert linearized["training.loss"]["timestamps"][:2] == timestamps
+
+
+def test_log_array(ex):
+    metrics = {}
+
+    @ex.main
+    def main_function(_run):
+        _run.log_scalar("training.loss", 10)
+        _run.log_array("training.loss", [9, 8, 7])
+        ex.log_array("training.loss", [6, 5], steps=[10, 20])
+        ex.log_array("training.loss", [])
+        metrics["metrics"] = ex.current_run._metrics.get_last_metrics_by_name()
+
+    ex.run()
+    linearized = metrics["metrics"]
+    assert linearized["training.loss"]["steps"] == [0, 1, 2, 3, 10, 20]
+    assert linearized["training.loss"]["values"] == [10, 9, 8, 7, 6, 5]
+    assert len(linearized["training.loss"]["timestamps"]) == 6
+
+
+def test_log_array_rejects_mismatched_steps(ex):
+    @ex.main
+    def main_function(_run):
+        _run.log_array("training.loss", [1, 2, 3], steps=[0, 1])
+
+    with pytest.raises(ValueError):
+        ex.run()
+
+
+def test_log_array_with_numpy(ex):
+    np = pytest.importorskip("numpy")
+    metrics = {}
+
+    @ex.main
+    def main_function(_run):
+        _run.log_array("training.loss", np.arange(5, dtype=np.float32))
+        _run.log_array("training.loss", np.ones(2), steps=np.array([10, 11]))
+        _run.log_scalars({"training.loss": np.float64(2.0)}, step=np.int64(12))
+        metrics["metrics"] = ex.current_run._metrics.get_last_metrics_by_name()
+
+    ex.run()
+    linearized = metrics["metrics"]["training.loss"]
+    assert linearized["steps"] == [0, 1, 2, 3, 4, 10, 11, 12]
+    assert linearized["values"] == [0.0, 1.0, 2.0, 3.0, 4.0, 1.0, 1.0, 2.0]
+    assert all(type(v) is float for v in linearized["values"])
+    assert all(type(s) is int for s in linearized["steps"])
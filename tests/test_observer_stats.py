@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+from sacred.observer_stats import ObserverStats
+
+
+class FooObserver:
+    pass
+
+
+def test_observer_stats_summary():
+    stats = ObserverStats()
+    obs = FooObserver()
+    stats.record(obs, "heartbeat_event", 0.002)
+    stats.record(obs, "heartbeat_event", 0.5)
+    stats.record(obs, "started_event", 100.0)
+    summary = stats.summary()
+    heartbeat = summary["FooObserver"]["heartbeat_event"]
+    assert heartbeat["count"] == 2
+    assert heartbeat["total"] == 0.502
+    assert heartbeat["mean"] == 0.251
+    assert heartbeat["max"] == 0.5
+    assert heartbeat["calls_per_busy_second"] == 2 / 0.502
+    assert heartbeat["histogram"]["<=0.01"] == 1
+    assert heartbeat["histogram"]["<=1"] == 1
+    assert sum(heartbeat["histogram"].values()) == 2
+    assert summary["FooObserver"]["started_event"]["histogram"][">60"] == 1
+
+
+def test_observer_stats_distinguishes_observers_of_same_class():
+    stats = ObserverStats()
+    obs1, obs2 = FooObserver(), FooObserver()
+    stats.record(obs1, "join", 0.1)
+    stats.record(obs2, "join", 0.1)
+    assert stats.observer_name(obs1) == "FooObserver"
+    assert stats.observer_name(obs2) == "FooObserver#2"
+    assert set(stats.summary()) == {"FooObserver", "FooObserver#2"}
@@ -94,6 +94,13 @@ class FailingCollection(mongomock.Collection):
         else:
             return super().update_one(filter, update, upsert)
 
+    def bulk_write(self, requests, ordered=True, session=None):
+        self._calls += 1
+        if self._calls > self._max_calls_before_failure:
+            raise pymongo.errors.ConnectionFailure
+        else:
+            return super().bulk_write(requests, ordered)
+
 
 class ReconnectingMongoClient(FailingMongoClient):
     def __init__(self, max_calls_before_reconnect, **kwargs):
@@ -183,6 +190,17 @@ class ReconnectingCollection(FailingCollection):
 
             return mongomock.Collection.update_one(self, filter, update, upsert)
 
+    def bulk_write(self, requests, ordered=True, session=None):
+        self._calls += 1
+        if self._is_in_failure_range():
+            print(self.name, "bulk_write no connection")
+
+            raise self._exception_to_raise
+        else:
+            print(self.name, "bulk_write connection reestablished")
+
+            return mongomock.Collection.bulk_write(self, requests, ordered)
+
     def _is_in_failure_range(self):
         return (
             self._max_calls_before_failure
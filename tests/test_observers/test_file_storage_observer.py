@@ -6,9 +6,11 @@ import os
 from copy import copy
 import pytest
 import json
+import logging
 from pathlib import Path
 
-from sacred.observers.file_storage import FileStorageObserver
+from sacred.heartbeat import HeartbeatTracker
+from sacred.observers.file_storage import FileStorageObserver, load_metrics
 from sacred.metrics_logger import ScalarMetricLogEntry, linearize_metrics
 
 
@@ -173,6 +175,25 @@ def test_fs_observer_heartbeat_event_updates_run(dir_obs, sample_run):
     assert info == i
 
 
+def test_fs_observer_heartbeat_delta_event_updates_run(dir_obs, sample_run):
+    basedir, obs = dir_obs
+    _id = obs.started_event(**sample_run)
+    run_dir = basedir.join(_id)
+    tracker = HeartbeatTracker()
+    info = {"my_info": [1, 2, 3], "nr": 7}
+    obs.heartbeat_delta_event(tracker.diff(info, "progress 1", 17), beat_time=T2)
+    info_mtime = os.stat(run_dir.join("info.json").strpath).st_mtime_ns
+    obs.heartbeat_delta_event(tracker.diff(info, "progress 2\n", 17), beat_time=T1)
+
+    assert run_dir.join("cout.txt").read() == "progress 2\n"
+    run = json.loads(run_dir.join("run.json").read())
+    assert run["heartbeat"] == T1.isoformat()
+    assert run["result"] == 17
+    assert json.loads(run_dir.join("info.json").read()) == info
+    # info did not change, so info.json was not rewritten
+    assert os.stat(run_dir.join("info.json").strpath).st_mtime_ns == info_mtime
+
+
 def test_fs_observer_heartbeat_event_multiple_updates_run(dir_obs, sample_run):
     basedir, obs = dir_obs
     _id = obs.started_event(**sample_run)
@@ -259,6 +280,20 @@ def test_fs_observer_artifact_event(dir_obs, sample_run, tmpfile):
     assert run["artifacts"][0] == artifact.relto(run_dir)
 
 
+def test_fs_observer_artifact_event_replaces_same_name(dir_obs, sample_run, tmpdir):
+    basedir, obs = dir_obs
+    _id = obs.started_event(**sample_run)
+    run_dir = basedir.join(_id)
+    for content in ["first", "second"]:
+        filename = tmpdir.join("artifact.txt")
+        filename.write(content)
+        obs.artifact_event("my_artifact.txt", str(filename))
+
+    assert run_dir.join("my_artifact.txt").read() == "second"
+    run = json.loads(run_dir.join("run.json").read())
+    assert run["artifacts"] == ["my_artifact.txt"]
+
+
 def test_fs_observer_resource_event(dir_obs, sample_run, tmpfile):
     basedir, obs = dir_obs
     _id = obs.started_event(**sample_run)
@@ -327,7 +362,7 @@ def test_log_metrics(dir_obs, sample_run, logged_metrics):
     """Test storing of scalar measurements.
 
     Test whether measurements logged using _run.metrics.log_scalar_metric
-    are being stored in the metrics.json file.
+    are being stored in the metrics log of the run.
 
     Metrics are stored as a json with each metric indexed by a name
     (e.g.: 'training.loss'). Each metric for the given name is then
@@ -348,8 +383,8 @@ def test_log_metrics(dir_obs, sample_run, logged_metrics):
     obs.log_metrics(linearize_metrics(logged_metrics[:6]), info)
     obs.heartbeat_event(info=info, captured_out=outp, beat_time=T1, result=0)
 
-    assert run_dir.join("metrics.json").exists()
-    metrics = json.loads(run_dir.join("metrics.json").read())
+    assert run_dir.join("metrics.jsonl").exists()
+    metrics = load_metrics(run_dir.strpath)
 
     # Confirm that we have only two metric names registered.
     # and they have all the information we need.
@@ -378,7 +413,7 @@ def test_log_metrics(dir_obs, sample_run, logged_metrics):
     obs.heartbeat_event(info=info, captured_out=outp, beat_time=T2, result=0)
 
     # Reload the new metrics
-    metrics = json.loads(run_dir.join("metrics.json").read())
+    metrics = load_metrics(run_dir.strpath)
 
     # The newly added metrics belong to the same run and have the same names,
     # so the total number of metrics should not change.
@@ -398,6 +433,87 @@ def test_log_metrics(dir_obs, sample_run, logged_metrics):
     assert accuracy["values"] == [100, 200, 300]
 
 
+def test_log_metrics_only_appends(dir_obs, sample_run, logged_metrics):
+    basedir, obs = dir_obs
+    sample_run["_id"] = None
+    _id = obs.started_event(**sample_run)
+    run_dir = basedir.join(str(_id))
+
+    obs.log_metrics(linearize_metrics(logged_metrics[:6]), {})
+    log_content = run_dir.join("metrics.jsonl").read()
+    obs.log_metrics(linearize_metrics(logged_metrics[6:]), {})
+    obs.log_metrics({}, {})
+
+    assert not run_dir.join("metrics.json").exists()
+    new_content = run_dir.join("metrics.jsonl").read()
+    assert new_content.startswith(log_content)
+    assert len(new_content.splitlines()) == 3
+
+
+@pytest.mark.parametrize(
+    "event,kwargs",
+    [
+        ("completed_event", {"stop_time": T2, "result": 42}),
+        ("interrupted_event", {"interrupt_time": T2, "status": "INTERRUPTED"}),
+        ("failed_event", {"fail_time": T2, "fail_trace": ["lots of errors"]}),
+    ],
+)
+def test_log_metrics_compacted_at_end_of_run(
+    dir_obs, sample_run, logged_metrics, event, kwargs
+):
+    basedir, obs = dir_obs
+    sample_run["_id"] = None
+    _id = obs.started_event(**sample_run)
+    run_dir = basedir.join(str(_id))
+
+    obs.log_metrics(linearize_metrics(logged_metrics[:6]), {})
+    obs.log_metrics(linearize_metrics(logged_metrics[6:]), {})
+    expected = load_metrics(run_dir.strpath)
+    getattr(obs, event)(**kwargs)
+
+    assert not run_dir.join("metrics.jsonl").exists()
+    metrics = json.loads(run_dir.join("metrics.json").read())
+    assert metrics == expected
+    assert load_metrics(run_dir.strpath) == expected
+    assert metrics["training.loss"]["steps"] == [10, 20, 30, 40, 50, 60]
+    assert metrics["training.accuracy"]["values"] == [100, 200, 300]
+
+
+def test_load_metrics_ignores_incomplete_line(dir_obs, sample_run, logged_metrics):
+    basedir, obs = dir_obs
+    sample_run["_id"] = None
+    _id = obs.started_event(**sample_run)
+    run_dir = basedir.join(str(_id))
+
+    obs.log_metrics(linearize_metrics(logged_metrics[:3]), {})
+    with open(run_dir.join("metrics.jsonl").strpath, "a") as f:
+        f.write('{"name": "training.loss", "steps": [4')
+
+    metrics = load_metrics(run_dir.strpath)
+    assert metrics["training.loss"]["steps"] == [10, 20, 30]
+
+
+def test_load_metrics_skips_damaged_lines(dir_obs, sample_run, logged_metrics, caplog):
+    basedir, obs = dir_obs
+    sample_run["_id"] = None
+    _id = obs.started_event(**sample_run)
+    run_dir = basedir.join(str(_id))
+
+    obs.log_metrics(linearize_metrics(logged_metrics[:3]), {})
+    with open(run_dir.join("metrics.jsonl").strpath, "a") as f:
+        # a torn write, followed by the records of a resumed run
+        f.write('{"name": "training.loss", "steps": [4\n')
+    obs.log_metrics(linearize_metrics(logged_metrics[6:7]), {})
+
+    with caplog.at_level(logging.WARNING):
+        metrics = load_metrics(run_dir.strpath)
+    assert metrics["training.loss"]["steps"] == [10, 20, 30, 40]
+    assert "Skipping damaged line 2" in caplog.text
+
+    obs.completed_event(stop_time=T2, result=None)
+    assert load_metrics(run_dir.strpath)["training.loss"]["steps"] == [10, 20, 30, 40]
+
+
 def test_observer_equality(tmpdir):
     observer_1 = FileStorageObserver(str(tmpdir / "a"))
     observer_2 = FileStorageObserver(str(tmpdir / "b"))
@@ -17,7 +17,8 @@ enable_gridfs_integration()
 from .failing_mongo_mock import FailingMongoClient
 
 from sacred.dependencies import get_digest
-from sacred.observers.mongo import MongoObserver, force_bson_encodeable
+from sacred.heartbeat import HeartbeatTracker
+from sacred.observers.mongo import MongoObserver, force_bson_encodeable, load_metric
 
 T1 = datetime.datetime(1999, 5, 4, 3, 2, 1)
 T2 = datetime.datetime(1999, 5, 5, 5, 5, 5)
@@ -169,6 +170,66 @@ def test_mongo_observer_heartbeat_event_updates_run(mongo_obs, sample_run):
     assert db_run["captured_out"] == outp
 
 
+def test_mongo_observer_heartbeat_delta_event_updates_fields(mongo_obs, sample_run):
+    mongo_obs.started_event(**sample_run)
+    tracker = HeartbeatTracker()
+    info = {"my_info": [1, 2, 3], "nr": 7}
+    delta = tracker.diff(info, "some output", 1337)
+    mongo_obs.heartbeat_delta_event(delta=delta, beat_time=T2)
+    info["nr"] = 8
+    delta = tracker.diff(info, "some output\nmore", 1337)
+
+    with mock.patch.object(
+        mongo_obs.runs, "update_one", wraps=mongo_obs.runs.update_one
+    ) as update_one:
+        mongo_obs.heartbeat_delta_event(delta=delta, beat_time=T3)
+    (update,) = update_one.call_args[0][1]
+    assert set(update["$set"]) == {"heartbeat", "info.nr", "captured_out"}
+
+    db_run = mongo_obs.runs.find_one()
+    assert db_run["heartbeat"] == T3
+    assert db_run["result"] == 1337
+    assert db_run["info"] == {"my_info": [1, 2, 3], "nr": 8}
+    assert db_run["captured_out"] == "some output\nmore"
+    assert db_run == mongo_obs.run_entry
+
+
+def test_mongo_observer_heartbeat_delta_event_with_special_info_keys(
+    mongo_obs, sample_run
+):
+    mongo_obs.started_event(**sample_run)
+    tracker = HeartbeatTracker()
+    info = {"a.b": 1, "$c": "$d"}
+    mongo_obs.heartbeat_delta_event(tracker.diff(info, "", None), beat_time=T2)
+    del info["a.b"]
+    mongo_obs.heartbeat_delta_event(tracker.diff(info, "", None), beat_time=T3)
+    assert mongo_obs.runs.find_one()["info"] == {"$c": "$d"}
+
+
+def test_mongo_observer_heartbeat_delta_event_rewritten_output(mongo_obs, sample_run):
+    mongo_obs.started_event(**sample_run)
+    tracker = HeartbeatTracker()
+    mongo_obs.heartbeat_delta_event(tracker.diff({}, "progress 1", None), T2)
+    mongo_obs.heartbeat_delta_event(tracker.diff({}, "progress 2", None), T3)
+    assert mongo_obs.runs.find_one()["captured_out"] == "progress 2"
+
+
+def test_mongo_observer_heartbeat_delta_event_resends_after_lost_update(
+    mongo_obs, sample_run
+):
+    mongo_obs.started_event(**sample_run)
+    tracker = HeartbeatTracker()
+    with mock.patch.object(
+        mongo_obs.runs, "update_one", side_effect=pymongo.errors.AutoReconnect
+    ):
+        mongo_obs.heartbeat_delta_event(tracker.diff({"a": 1}, "out", None), T2)
+    mongo_obs.heartbeat_delta_event(tracker.diff({"a": 1}, "out", None), T3)
+    db_run = mongo_obs.runs.find_one()
+    assert db_run["info"] == {"a": 1}
+    assert db_run["captured_out"] == "out"
+    assert db_run["heartbeat"] == T3
+
+
 def test_mongo_observer_fails(failing_mongo_observer, sample_run):
     failing_mongo_observer.started_event(**sample_run)
 
@@ -253,6 +314,20 @@ def test_mongo_observer_artifact_event(mongo_obs, sample_run):
     assert db_run["artifacts"]
 
 
+def test_mongo_observer_artifact_event_replaces_same_name(mongo_obs, sample_run):
+    mongo_obs.started_event(**sample_run)
+
+    mongo_obs.artifact_event("mysetup", "setup.py")
+    mongo_obs.artifact_event("mysetup", "setup.cfg")
+
+    [file] = mongo_obs.fs.list()
+    assert file.endswith("mysetup")
+    db_run = mongo_obs.runs.find_one()
+    [artifact] = db_run["artifacts"]
+    with open("setup.cfg", "rb") as f:
+        assert mongo_obs.fs.get(artifact["file_id"]).read() == f.read()
+
+
 def test_mongo_observer_resource_event(mongo_obs, sample_run):
     mongo_obs.started_event(**sample_run)
 
@@ -423,6 +498,147 @@ def test_log_metrics(mongo_obs, sample_run, logged_metrics):
     assert mongo_obs.metrics.count_documents({}) == 4
 
 
+def test_log_metrics_sends_one_bulk_write(mongo_obs, sample_run, logged_metrics):
+    mongo_obs.started_event(**sample_run)
+    info = {}
+    with mock.patch.object(
+        mongo_obs.metrics, "bulk_write", wraps=mongo_obs.metrics.bulk_write
+    ) as bulk_write, mock.patch.object(mongo_obs.metrics, "update_one") as update_one:
+        mongo_obs.log_metrics(linearize_metrics(logged_metrics[:6]), info)
+        mongo_obs.log_metrics(linearize_metrics(logged_metrics[6:]), info)
+        mongo_obs.log_metrics({}, info)
+
+    assert bulk_write.call_count == 2
+    assert len(bulk_write.call_args_list[0][0][0]) == 2
+    assert len(bulk_write.call_args_list[1][0][0]) == 1
+    assert not update_one.called
+    assert [m["name"] for m in info["metrics"]] == [
+        "training.loss",
+        "training.accuracy",
+    ]
+    for m in info["metrics"]:
+        assert str(mongo_obs.metrics.find_one({"name": m["name"]})["_id"]) == m["id"]
+
+
+@pytest.fixture
+def bucketed_mongo_obs():
+    db = mongomock.MongoClient().db
+    fs = gridfs.GridFS(db)
+    return MongoObserver.create_from(
+        db.runs, fs, metrics_collection=db.metrics, metrics_bucket_size=2
+    )
+
+
+def test_log_metrics_in_buckets(bucketed_mongo_obs, sample_run, logged_metrics):
+    mongo_obs = bucketed_mongo_obs
+    mongo_obs.started_event(**sample_run)
+    info = {}
+    mongo_obs.log_metrics(linearize_metrics(logged_metrics[:6]), info)
+    mongo_obs.log_metrics(linearize_metrics(logged_metrics[6:]), info)
+
+    run_id = sample_run["_id"]
+    buckets = list(
+        mongo_obs.metrics.find({"run_id": run_id, "name": "training.loss"}).sort(
+            "bucket", 1
+        )
+    )
+    assert [b["bucket"] for b in buckets] == [0, 1, 2]
+    assert [b["steps"] for b in buckets] == [[10, 20], [30, 40], [50, 60]]
+    assert [b["count"] for b in buckets] == [2, 2, 2]
+    assert [(b["min_step"], b["max_step"]) for b in buckets] == [
+        (10, 20),
+        (30, 40),
+        (50, 60),
+    ]
+    assert [(b["min_value"], b["max_value"], b["sum"]) for b in buckets] == [
+        (1, 2, 3),
+        (3, 10, 13),
+        (20, 30, 50),
+    ]
+    assert mongo_obs.metrics.count_documents({"name": "training.accuracy"}) == 2
+
+    # only the first bucket of each metric is referenced in the info
+    assert sorted(m["name"] for m in info["metrics"]) == [
+        "training.accuracy",
+        "training.loss",
+    ]
+    assert {"name": "training.loss", "id": str(buckets[0]["_id"])} in info["metrics"]
+
+    loss = load_metric(mongo_obs.metrics, run_id, "training.loss")
+    assert loss["steps"] == [10, 20, 30, 40, 50, 60]
+    assert loss["values"] == [1, 2, 3, 10, 20, 30]
+    assert len(loss["timestamps"]) == 6
+    assert load_metric(mongo_obs.metrics, run_id, "does.not.exist") is None
+
+
+def test_log_metrics_in_buckets_with_non_numeric_values(bucketed_mongo_obs, sample_run):
+    mongo_obs = bucketed_mongo_obs
+    mongo_obs.started_event(**sample_run)
+    entries = [
+        ScalarMetricLogEntry("label", i, datetime.datetime.utcnow(), str(i))
+        for i in range(3)
+    ]
+    mongo_obs.log_metrics(linearize_metrics(entries), {})
+
+    buckets = list(mongo_obs.metrics.find({"name": "label"}).sort("bucket", 1))
+    assert [b["values"] for b in buckets] == [["0", "1"], ["2"]]
+    assert "sum" not in buckets[0]
+    assert buckets[1]["min_step"] == buckets[1]["max_step"] == 2
+
+
+def test_load_metric_without_buckets(mongo_obs, sample_run, logged_metrics):
+    mongo_obs.started_event(**sample_run)
+    mongo_obs.log_metrics(linearize_metrics(logged_metrics), {})
+    accuracy = load_metric(mongo_obs.metrics, sample_run["_id"], "training.accuracy")
+    assert accuracy["steps"] == [10, 20, 30]
+    assert accuracy["values"] == [100, 200, 300]
+
+
+def test_load_metric_of_single_document_continued_in_buckets(
+    mongo_obs, sample_run, logged_metrics
+):
+    sample_run["_id"] = 1
+    mongo_obs.started_event(**sample_run)
+    info = {}
+    mongo_obs.log_metrics(linearize_metrics(logged_metrics[:3]), info)
+    run_id = sample_run["_id"]
+
+    resumed = MongoObserver.create_from(
+        mongo_obs.runs,
+        mongo_obs.fs,
+        overwrite=run_id,
+        metrics_collection=mongo_obs.metrics,
+        metrics_bucket_size=2,
+    )
+    resumed.started_event(**sample_run)
+    resumed.log_metrics(linearize_metrics(logged_metrics[6:8]), info)
+    resumed.log_metrics(linearize_metrics(logged_metrics[8:]), info)
+
+    documents = list(resumed.metrics.find({"run_id": run_id, "name": "training.loss"}))
+    [legacy] = [d for d in documents if "bucket" not in d]
+    assert legacy["steps"] == [10, 20, 30]
+    buckets = sorted((d for d in documents if "bucket" in d), key=lambda d: d["bucket"])
+    assert [(b["bucket"], b["count"]) for b in buckets] == [(0, 2), (1, 1)]
+    assert [b["steps"] for b in buckets] == [[40, 50], [60]]
+    # the info still references the single document only
+    assert info["metrics"] == [{"name": "training.loss", "id": str(legacy["_id"])}]
+
+    loss = load_metric(resumed.metrics, run_id, "training.loss")
+    assert loss["steps"] == [10, 20, 30, 40, 50, 60]
+    assert loss["values"] == [1, 2, 3, 10, 20, 30]
+
+
+def test_invalid_metrics_bucket_size():
+    db = mongomock.MongoClient().db
+    with pytest.raises(ValueError):
+        MongoObserver.create_from(
+            db.runs,
+            gridfs.GridFS(db),
+            metrics_collection=db.metrics,
+            metrics_bucket_size=0,
+        )
+
+
 def test_mongo_observer_artifact_event_content_type_added(mongo_obs, sample_run):
     """Test that the detected content_type is added to other metadata."""
     mongo_obs.started_event(**sample_run)
@@ -0,0 +1,186 @@
+import json
+import os
+
+import pytest
+
+from sacred import Experiment
+from sacred.observers import FileStorageObserver
+from sacred.observers.base import RunObserver
+from sacred.observers.process import ProcessObserver
+from sacred.utils import ObserverError
+
+
+class RecordingObserver(RunObserver):
+    """Writes the events it receives to a file, with the pid of its process."""
+
+    priority = 7
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def _record(self, event, *args, **kwargs):
+        with open(self.filename, "a") as f:
+            f.write(json.dumps([event, os.getpid(), repr(args), repr(kwargs)]) + "\n")
+
+    def started_event(self, *args, **kwargs):
+        self._record("started_event", *args, **kwargs)
+        return "the_id"
+
+    def heartbeat_event(self, *args, **kwargs):
+        self._record("heartbeat_event", *args, **kwargs)
+
+    def artifact_event(self, name, filename, *args, **kwargs):
+        with open(filename) as f:
+            self._record("artifact_event", name, f.read())
+
+    def resource_event(self, filename):
+        raise RuntimeError("broken resource")
+
+    def completed_event(self, *args, **kwargs):
+        self._record("completed_event", *args, **kwargs)
+
+    def failed_event(self, *args, **kwargs):
+        raise RuntimeError("broken failed_event")
+
+
+def read_events(filename):
+    with open(filename) as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def observer(tmpdir):
+    observer = ProcessObserver(RecordingObserver(str(tmpdir.join("events.jsonl"))))
+    yield observer
+    observer.join()
+
+
+def test_events_are_processed_in_helper_process(observer, tmpdir):
+    assert observer.priority == 7
+    assert observer.started_event(_id=None) == "the_id"
+    observer.heartbeat_event(info={"a": 1})
+    artifact = tmpdir.join("artifact.txt")
+    artifact.write("content")
+    observer.artifact_event("artifact.txt", str(artifact))
+    artifact.remove()  # the artifact was confirmed before
+    observer.completed_event(result=42)
+    # the terminal event is confirmed, so it is saved already
+    events = read_events(str(tmpdir.join("events.jsonl")))
+    assert [e[0] for e in events] == [
+        "started_event",
+        "heartbeat_event",
+        "artifact_event",
+        "completed_event",
+    ]
+    assert {e[1] for e in events} != {os.getpid()}
+    assert events[1][3] == repr({"info": {"a": 1}})
+    assert events[2][3] == repr({})
+    assert events[2][2] == repr(("artifact.txt", "content"))
+    observer.join()
+    assert observer._process is None
+
+
+def test_errors_of_synchronous_events_are_raised(observer, tmpdir):
+    observer.started_event()
+    observer.resource_event("file")  # only logged in the helper process
+    with pytest.raises(ObserverError, match="broken failed_event"):
+        observer.failed_event(fail_trace=[])
+    observer.completed_event(result=1)
+    events = read_events(str(tmpdir.join("events.jsonl")))
+    assert [e[0] for e in events] == ["started_event", "completed_event"]
+
+
+def test_unpicklable_values_are_flattened(observer, tmpdir):
+    class Local:  # cannot be pickled
+        value = 1
+
+    observer.started_event()
+    observer.heartbeat_event(info={"local": Local()})
+    observer.completed_event(result=None)
+    events = read_events(str(tmpdir.join("events.jsonl")))
+    assert events[1][0] == "heartbeat_event"
+    assert "py/object" in events[1][3]
+
+
+def test_observer_process_commandline_option(tmpdir):
+    ex = Experiment("ator3000")
+    ex.observers.append(FileStorageObserver(str(tmpdir)))
+
+    @ex.main
+    def main(_run):
+        assert isinstance(_run.observers[0], ProcessObserver)
+        filename = str(tmpdir.join("result.txt"))
+        with open(filename, "w") as f:
+            f.write("result")
+        _run.add_artifact(filename)
+        os.remove(filename)
+        return 3
+
+    run = ex.run(options={"--observer_process": True})
+    assert run._id == "1"
+    with open(os.path.join(str(tmpdir), "1", "run.json")) as f:
+        run_entry = json.load(f)
+    assert run_entry["status"] == "COMPLETED"
+    assert run_entry["result"] == 3
+    assert run_entry["artifacts"] == ["result.txt"]
+    with open(os.path.join(str(tmpdir), "1", "result.txt")) as f:
+        assert f.read() == "result"
+
+
+class MetricsReferencingObserver(RecordingObserver):
+    """Adds references to the metrics to the info, like the MongoObserver."""
+
+    def log_metrics(self, metrics_by_name, info):
+        for name in metrics_by_name:
+            info.setdefault("metrics", []).append({"name": name, "id": "m1"})
+
+    def heartbeat_event(self, info, captured_out, beat_time, result):
+        self._record("heartbeat_event", info=info)
+
+
+def test_changes_of_log_metrics_to_the_info_are_kept(tmpdir):
+    filename = str(tmpdir.join("events.jsonl"))
+    ex = Experiment("ator3000")
+    ex.observers.append(MetricsReferencingObserver(filename))
+
+    @ex.main
+    def main(_run):
+        _run.info["a"] = 1
+        _run.log_scalar("loss", 0.5)
+
+    run = ex.run(options={"--observer_process": True})
+    assert run.info["metrics"] == [{"name": "loss", "id": "m1"}]
+    heartbeats = [e for e in read_events(filename) if e[0] == "heartbeat_event"]
+    assert "'metrics': [{'name': 'loss', 'id': 'm1'}]" in heartbeats[-1][3]
+
+
+def test_unpicklable_info_with_file_storage_observer(tmpdir):
+    class Local:  # cannot be pickled
+        value = 1
+
+    ex = Experiment("ator3000")
+    ex.observers.append(FileStorageObserver(str(tmpdir)))
+
+    @ex.main
+    def main(_run):
+        _run.info["local"] = Local()
+        return 3
+
+    run = ex.run(options={"--observer_process": True})
+    run_dir = os.path.join(str(tmpdir), run._id)
+    with open(os.path.join(run_dir, "run.json")) as f:
+        run_entry = json.load(f)
+    assert run_entry["status"] == "COMPLETED"
+    assert isinstance(run_entry["heartbeat"], str)  # the beat_time is kept
+    with open(os.path.join(run_dir, "info.json")) as f:
+        assert "py/object" in json.dumps(json.load(f)["local"])
+
+
+def test_observer_stats_reach_the_helper_process(tmpdir):
+    ex = Experiment("ator3000")
+    ex.observers.append(FileStorageObserver(str(tmpdir)))
+    ex.main(lambda: 3)
+    ex.run(options={"--observer_process": True})
+    with open(os.path.join(str(tmpdir), "1", "run.json")) as f:
+        stats = json.load(f)["meta"]["observer_stats"]
+    assert stats["ProcessObserver"]["started_event"]["count"] == 1
@@ -36,7 +36,9 @@ def mongo_obs(monkeypatch):
     monkeypatch.setattr(pymongo, "MongoClient", lambda *args, **kwargs: client)
     monkeypatch.setattr(gridfs, "GridFS", lambda _: fs)
 
-    return QueuedMongoObserver(interval=0.01, retry_interval=0.01)
+    return QueuedMongoObserver(
+        interval=0.01, retry_interval=0.01, max_retry_interval=0.01
+    )
 
 
 @pytest.fixture()
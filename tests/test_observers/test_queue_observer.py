@@ -1,6 +1,9 @@
 from collections import OrderedDict
+import logging
+import os
+import time
 
-from sacred.observers.queue import QueueObserver
+from sacred.observers.queue import QueueObserver, WrappedEvent, coalesce_events
 from sacred import Experiment
 import mock
 import pytest
@@ -8,7 +11,9 @@ import pytest
 
 @pytest.fixture
 def queue_observer():
-    return QueueObserver(mock.MagicMock(), interval=0.01, retry_interval=0.01)
+    observer = QueueObserver(mock.MagicMock(), interval=0.01, retry_interval=0.01)
+    yield observer
+    observer.join()  # stop the worker, even if the test failed
 
 
 def test_started_event(queue_observer):
@@ -20,9 +25,7 @@ def test_started_event(queue_observer):
     assert queue_observer._covered_observer.method_calls[0][2] == {"kwds": "kwargs"}
 
 
-@pytest.mark.parametrize(
-    "event_name", ["heartbeat_event", "resource_event", "artifact_event"]
-)
+@pytest.mark.parametrize("event_name", ["heartbeat_event", "resource_event"])
 def test_non_terminal_generic_events(queue_observer, event_name):
     queue_observer.started_event()
     getattr(queue_observer, event_name)("args", kwds="kwargs")
@@ -48,22 +51,16 @@ def test_log_metrics(queue_observer):
     queue_observer.started_event()
     first = ("a", [1])
     second = ("b", [2])
-    queue_observer.log_metrics(OrderedDict([first, second]), "info")
+    metrics_by_name = OrderedDict([first, second])
+    queue_observer.log_metrics(metrics_by_name, "info")
     queue_observer.join()
+    assert len(queue_observer._covered_observer.method_calls) == 2
     assert queue_observer._covered_observer.method_calls[1][0] == "log_metrics"
     assert queue_observer._covered_observer.method_calls[1][1] == (
-        first[0],
-        first[1],
+        metrics_by_name,
         "info",
     )
     assert queue_observer._covered_observer.method_calls[1][2] == {}
-    assert queue_observer._covered_observer.method_calls[2][0] == "log_metrics"
-    assert queue_observer._covered_observer.method_calls[2][1] == (
-        second[0],
-        second[1],
-        "info",
-    )
-    assert queue_observer._covered_observer.method_calls[2][2] == {}
 
 
 def test_run_waits_for_running_queue_observer():
@@ -108,3 +105,294 @@ def test_run_waits_for_running_queue_observer_after_failure():
         queue_observer_with_long_interval._covered_observer.method_calls[-1][0]
         == "failed_event"
     )
+
+
+def test_queued_event_is_passed_on_directly(queue_observer):
+    queue_observer._covered_observer.queued_event.return_value = "the_id"
+    assert queue_observer.queued_event("args") == "the_id"
+    assert queue_observer._worker is None
+
+
+def test_uses_priority_of_covered_observer():
+    assert QueueObserver(mock.MagicMock(priority=42)).priority == 42
+
+
+def test_artifact_event(queue_observer, tmpdir):
+    artifact = tmpdir.join("artifact.txt")
+    artifact.write("content")
+    queue_observer.started_event()
+    queue_observer.artifact_event("name", str(artifact), content_type="text/plain")
+    queue_observer.join()
+    name, args, kwargs = queue_observer._covered_observer.method_calls[1]
+    assert name == "artifact_event"
+    assert args[0] == "name"
+    assert os.path.basename(args[1]) == "artifact.txt"
+    assert kwargs == {"content_type": "text/plain"}
+
+
+def test_artifact_is_copied_before_queuing(tmpdir):
+    covered = mock.MagicMock()
+    contents = []
+    covered.artifact_event.side_effect = lambda name, filename, *args: (
+        contents.append(open(filename).read())
+    )
+    queue_observer = QueueObserver(covered, interval=10, retry_interval=0.01)
+    queue_observer.started_event()
+    artifact = tmpdir.join("artifact.txt")
+    artifact.write("content")
+    queue_observer.artifact_event(name="artifact.txt", filename=str(artifact))
+    artifact.remove()
+    queue_observer.completed_event(stop_time=None, result=None)
+    assert contents == ["content"]
+    assert queue_observer._artifact_dir is None
+
+
+def test_failed_events_are_retried(queue_observer):
+    queue_observer._covered_observer.heartbeat_event.side_effect = [
+        RuntimeError("temporarily unavailable"),
+        None,
+    ]
+    queue_observer.started_event()
+    queue_observer.heartbeat_event("args")
+    queue_observer.join()
+    assert queue_observer._covered_observer.heartbeat_event.call_count == 2
+
+
+def test_queued_commandline_option():
+    covered = mock.MagicMock(priority=0)
+    ex = Experiment("ator3000")
+    ex.observers.append(covered)
+
+    @ex.main
+    def main(_run):
+        assert isinstance(_run.observers[0], QueueObserver)
+        assert _run.observers[0]._covered_observer is covered
+
+    ex.run(options={"--queued": True})
+    assert covered.method_calls[0][0] == "started_event"
+    assert covered.method_calls[-1][0] == "completed_event"
+
+
+def test_failed_events_are_dropped_after_max_retries():
+    covered = mock.MagicMock()
+    covered.heartbeat_event.side_effect = RuntimeError("broken")
+    queue_observer = QueueObserver(
+        covered, interval=0.01, retry_interval=0.01, max_retries=2
+    )
+    queue_observer.started_event()
+    queue_observer.heartbeat_event("args")
+    queue_observer.completed_event("args")
+    assert covered.heartbeat_event.call_count == 3
+    assert covered.method_calls[-1][0] == "completed_event"
+
+
+def test_terminal_events_are_retried_despite_max_retries():
+    covered = mock.MagicMock()
+    covered.completed_event.side_effect = [RuntimeError("broken")] * 4 + [None]
+    queue_observer = QueueObserver(
+        covered, interval=0.01, retry_interval=0.01, max_retries=2
+    )
+    queue_observer.started_event()
+    queue_observer.completed_event("args")
+    assert covered.completed_event.call_count == 5
+    assert queue_observer.stats["dropped_events"] == {}
+
+
+def test_failing_completed_event_is_not_lost_silently(caplog):
+    covered = mock.MagicMock()
+    covered.completed_event.side_effect = RuntimeError("broken")
+    queue_observer = QueueObserver(
+        covered,
+        interval=0.01,
+        retry_interval=0.01,
+        max_retry_interval=0.01,
+        max_retries=2,
+        join_timeout=0.2,
+    )
+    queue_observer.started_event()
+    with caplog.at_level(logging.ERROR, logger="sacred.observers.queue"):
+        queue_observer.completed_event("args")
+        queue_observer._worker.join(timeout=5)
+    assert covered.completed_event.call_count > 3  # not limited by max_retries
+    assert queue_observer.stats["dropped_events"] == {"completed_event": 1}
+    assert any("completed_event" in r.getMessage() for r in caplog.records)
+
+
+def test_events_dropped_after_max_retries_are_counted():
+    covered = mock.MagicMock()
+    covered.heartbeat_event.side_effect = RuntimeError("broken")
+    queue_observer = QueueObserver(
+        covered, interval=0.01, retry_interval=0.01, max_retries=1
+    )
+    queue_observer.started_event()
+    queue_observer.heartbeat_event("args")
+    queue_observer.completed_event("args")
+    assert queue_observer.stats["dropped_events"] == {"heartbeat_event": 1}
+
+
+def test_join_gives_up_after_timeout():
+    covered = mock.MagicMock()
+    covered.heartbeat_event.side_effect = RuntimeError("unavailable")
+    queue_observer = QueueObserver(
+        covered, interval=0.01, retry_interval=10, join_timeout=0.1
+    )
+    queue_observer.started_event()
+    queue_observer.heartbeat_event("args")
+    start = time.time()
+    queue_observer.completed_event("args")
+    assert time.time() - start < 5
+    queue_observer._worker.join(timeout=5)
+    assert not queue_observer._worker.is_alive()
+    assert "completed_event" not in [c[0] for c in covered.method_calls]
+    assert queue_observer.stats["dropped_events"] == {
+        "heartbeat_event": 1,
+        "completed_event": 1,
+    }
+
+
+def metrics(name, steps):
+    return {
+        name: {
+            "name": name,
+            "steps": list(steps),
+            "values": [s * 10 for s in steps],
+            "timestamps": ["t{}".format(s) for s in steps],
+        }
+    }
+
+
+def test_coalesce_events():
+    events = [
+        WrappedEvent("log_metrics", [metrics("loss", [0]), "info1"], {}),
+        WrappedEvent("heartbeat_event", ("hb1",), {}),
+        WrappedEvent("log_metrics", [metrics("loss", [1, 2]), "info2"], {}),
+        WrappedEvent("heartbeat_event", ("hb2",), {}),
+        WrappedEvent("artifact_event", ("a", "file"), {}),
+        WrappedEvent("log_metrics", [metrics("acc", [2]), "info3"], {}),
+        WrappedEvent("heartbeat_event", ("hb3",), {}),
+        WrappedEvent("completed_event", (), {}),
+    ]
+    coalesced = coalesce_events(events)
+    assert [e.name for e in coalesced] == [
+        "log_metrics",
+        "artifact_event",
+        "log_metrics",
+        "heartbeat_event",
+        "completed_event",
+    ]
+    assert coalesced[0].args == [metrics("loss", [0, 1, 2]), "info2"]
+    assert coalesced[3].args == ("hb3",)
+    # the events themselves are not modified
+    assert events[0].args[0] == metrics("loss", [0])
+
+
+def test_coalesce_merges_different_metrics():
+    events = [
+        WrappedEvent("log_metrics", [metrics("loss", [0]), "info1"], {}),
+        WrappedEvent("log_metrics", [metrics("acc", [0]), "info2"], {}),
+        WrappedEvent("log_metrics", [metrics("acc", [1]), "info3"], {}),
+    ]
+    (merged,) = coalesce_events(events)
+    assert merged.args == [
+        dict(metrics("loss", [0]), **metrics("acc", [0, 1])),
+        "info3",
+    ]
+    assert events[1].args[0] == metrics("acc", [0])
+
+
+def test_backlog_is_coalesced_after_outage():
+    covered = mock.MagicMock()
+    covered.heartbeat_event.side_effect = [RuntimeError("unavailable"), None, None]
+    queue_observer = QueueObserver(covered, interval=10, retry_interval=0.01)
+    queue_observer.started_event()
+    for i in range(100):
+        queue_observer.log_metrics(metrics("loss", [i]), "info")
+        queue_observer.heartbeat_event(i)
+    queue_observer.completed_event("result")
+    assert [c[0] for c in covered.method_calls] == [
+        "started_event",
+        "log_metrics",
+        "heartbeat_event",
+        "heartbeat_event",
+        "completed_event",
+    ]
+    assert covered.log_metrics.call_args[0][0] == metrics("loss", range(100))
+    assert covered.heartbeat_event.call_args[0] == (99,)
+
+
+def test_full_queue_drops_oldest_heartbeats_first():
+    covered = mock.MagicMock()
+    queue_observer = QueueObserver(covered, interval=10, max_queue_size=3)
+    queue_observer.started_event()
+    queue_observer.log_metrics(metrics("loss", [0]), "info")
+    for i in range(3):
+        queue_observer.heartbeat_event(i)
+    queue_observer.resource_event("resource")
+    assert queue_observer.stats["queue_depth"] == 3
+    assert queue_observer.stats["dropped_events"] == {"heartbeat_event": 2}
+    queue_observer.completed_event("result")
+    assert [(c[0], c[1]) for c in covered.method_calls[1:]] == [
+        ("heartbeat_event", (2,)),
+        ("resource_event", ("resource",)),
+        ("completed_event", ("result",)),
+    ]
+    assert queue_observer.stats["dropped_events"] == {
+        "heartbeat_event": 2,
+        "log_metrics": 1,
+    }
+
+
+def test_terminal_events_are_never_dropped():
+    covered = mock.MagicMock()
+    queue_observer = QueueObserver(covered, interval=10, max_queue_size=0)
+    queue_observer.started_event()
+    queue_observer.heartbeat_event(1)
+    queue_observer.log_metrics(metrics("loss", [0]), "info")
+    queue_observer.failed_event("trace")
+    assert [c[0] for c in covered.method_calls] == ["started_event", "failed_event"]
+    assert queue_observer.stats["dropped_events"] == {
+        "heartbeat_event": 1,
+        "log_metrics": 1,
+    }
+
+
+def test_queue_bounded_in_bytes():
+    covered = mock.MagicMock()
+    queue_observer = QueueObserver(covered, interval=10, max_queue_bytes=1500)
+    queue_observer.started_event()
+    for i in range(10):
+        queue_observer.heartbeat_event(info={"data": str(i) * 1000})
+        assert queue_observer.stats["queue_bytes"] <= 1500
+    assert queue_observer.stats["queue_depth"] == 1
+    queue_observer.completed_event("result")
+    assert covered.heartbeat_event.call_args[1]["info"]["data"][0] == "9"
+    assert queue_observer.stats["dropped_events"] == {"heartbeat_event": 9}
+
+
+def test_exponential_backoff_with_jitter():
+    queue_observer = QueueObserver(
+        mock.MagicMock(), retry_interval=1, max_retry_interval=10
+    )
+    with mock.patch("random.uniform", return_value=1.0):
+        delays = [queue_observer._get_retry_delay(f) for f in range(1, 7)]
+    assert delays == [1, 2, 4, 8, 10, 10]
+    for _ in range(100):
+        assert 1 <= queue_observer._get_retry_delay(2) <= 3
+    assert QueueObserver(mock.MagicMock(), retry_interval=2)._max_retry_interval == 60
+
+
+def test_failed_attempts_are_counted(queue_observer):
+    queue_observer._covered_observer.heartbeat_event.side_effect = [
+        RuntimeError("unavailable"),
+        RuntimeError("unavailable"),
+        None,
+    ]
+    queue_observer.started_event()
+    queue_observer.heartbeat_event("args")
+    queue_observer.join()
+    assert queue_observer.stats == {
+        "queue_depth": 0,
+        "queue_bytes": 0,
+        "dropped_events": {},
+        "failed_attempts": 2,
+    }
@@ -10,7 +10,15 @@ from sacred.serializer import json
 sqlalchemy = pytest.importorskip("sqlalchemy")
 
 from sacred.observers.sql import SqlObserver
-from sacred.observers.sql_bases import Host, Experiment, Run, Source, Resource
+from sacred.observers.sql_bases import (
+    Host,
+    Experiment,
+    Metric,
+    Run,
+    Source,
+    Resource,
+)
+from sacred.metrics_logger import ScalarMetricLogEntry, linearize_metrics
 
 
 T1 = datetime.datetime(1999, 5, 4, 3, 2, 1, 0)
@@ -179,6 +187,39 @@ def test_sql_observer_failed_event_updates_run(sql_obs, sample_run, session):
     assert db_run.fail_trace == "lots of errors and\nso\non..."
 
 
+def test_sql_observer_log_metrics(sql_obs, sample_run, session):
+    sql_obs.started_event(**sample_run)
+    entries = [
+        ScalarMetricLogEntry("training.loss", 10, T1, 1.0),
+        ScalarMetricLogEntry("training.accuracy", 10, T1, 0.5),
+        ScalarMetricLogEntry("training.loss", 20, T2, 0.5),
+    ]
+    sql_obs.log_metrics(linearize_metrics(entries[:2]), {})
+    sql_obs.log_metrics(linearize_metrics(entries[2:]), {})
+    sql_obs.log_metrics({}, {})
+
+    assert session.query(Metric).count() == 3
+    loss = (
+        session.query(Metric)
+        .filter_by(run_id=sample_run["_id"], name="training.loss")
+        .order_by(Metric.step)
+        .all()
+    )
+    assert [m.to_json() for m in loss] == [
+        {"name": "training.loss", "step": 10, "value": 1.0, "timestamp": T1},
+        {"name": "training.loss", "step": 20, "value": 0.5, "timestamp": T2},
+    ]
+
+    assert sql_obs.query_metrics(sample_run["_id"]) == {
+        "training.loss": {
+            "steps": [10, 20],
+            "values": [1.0, 0.5],
+            "timestamps": [T1, T2],
+        },
+        "training.accuracy": {"steps": [10], "values": [0.5], "timestamps": [T1]},
+    }
+
+
 def test_sql_observer_artifact_event(sql_obs, sample_run, session, tmpfile):
     sql_obs.started_event(**sample_run)
 
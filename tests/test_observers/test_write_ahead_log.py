@@ -0,0 +1,212 @@
+import datetime
+import json
+import os
+import subprocess
+import sys
+
+import mock
+import pytest
+
+from sacred.observers.queue import QueueObserver
+from sacred.observers.write_ahead_log import (
+    WriteAheadLog,
+    main,
+    read_events,
+    replay_write_ahead_logs,
+)
+
+T1 = datetime.datetime(1999, 5, 4, 3, 2, 1)
+T2 = datetime.datetime(1999, 5, 5, 5, 5, 5)
+
+STARTED = {
+    "ex_info": {"name": "test_exp", "base_dir": "/tmp", "sources": []},
+    "command": "run",
+    "host_info": {"hostname": "test_host"},
+    "start_time": T1,
+    "config": {"a": 1},
+    "meta_info": {},
+    "_id": None,
+}
+
+
+@pytest.fixture
+def wal_dir(tmpdir):
+    return str(tmpdir.join("wal"))
+
+
+def unavailable_observer():
+    covered = mock.MagicMock(priority=0)
+    covered.started_event.return_value = 7
+    for event in ["heartbeat_event", "artifact_event", "completed_event"]:
+        getattr(covered, event).side_effect = RuntimeError("unavailable")
+    return covered
+
+
+def crashed_run(wal_dir, tmpdir):
+    queue_observer = QueueObserver(
+        unavailable_observer(),
+        interval=0.01,
+        retry_interval=10,
+        join_timeout=0.1,
+        wal_dir=wal_dir,
+    )
+    assert queue_observer.started_event(**STARTED) == 7
+    artifact = tmpdir.join("weights.txt")
+    artifact.write("weights")
+    for i in range(3):
+        queue_observer.heartbeat_event(
+            info={"i": i}, captured_out="", beat_time=T1, result=None
+        )
+    queue_observer.artifact_event(name="weights.txt", filename=str(artifact))
+    artifact.remove()
+    queue_observer.completed_event(stop_time=T2, result=42)
+    return queue_observer
+
+
+def test_processed_events_leave_no_log(wal_dir):
+    covered = mock.MagicMock(priority=0)
+    covered.started_event.return_value = 1
+    queue_observer = QueueObserver(covered, interval=0.01, wal_dir=wal_dir)
+    queue_observer.started_event(**STARTED)
+    queue_observer.heartbeat_event(info={}, captured_out="", beat_time=T1, result=None)
+    queue_observer.completed_event(stop_time=T2, result=42)
+    assert os.listdir(wal_dir) == []
+    assert covered.method_calls[-1][0] == "completed_event"
+
+
+def test_segments_are_removed_when_acknowledged(tmpdir):
+    wal = WriteAheadLog.create(str(tmpdir), dict(STARTED, _id=1))
+    wal.append("heartbeat_event", (), {"info": {}})
+    segment = wal.rotate()
+    wal.append("heartbeat_event", (), {"info": {"a": 1}})
+    assert [e.kwargs for e in read_events(wal.directory)] == [
+        {"info": {}},
+        {"info": {"a": 1}},
+    ]
+    wal.acknowledge(segment)
+    assert [e.kwargs for e in read_events(wal.directory)] == [{"info": {"a": 1}}]
+    wal.remove()
+    assert not os.path.exists(wal.directory)
+
+
+def test_unprocessed_events_are_kept_and_replayed(wal_dir, tmpdir):
+    crashed_run(wal_dir, tmpdir)
+    (run_dir,) = os.listdir(wal_dir)
+    with open(os.path.join(wal_dir, run_dir, "started.json")) as f:
+        assert json.load(f)["_id"] == 7
+
+    target = mock.MagicMock()
+    artifact_contents = []
+    target.artifact_event.side_effect = lambda name, filename, *args: (
+        artifact_contents.append(open(filename).read())
+    )
+    create_observer = mock.Mock(return_value=target)
+    assert replay_write_ahead_logs(wal_dir, create_observer) == [7]
+    create_observer.assert_called_once_with(7)
+    assert [c[0] for c in target.method_calls] == [
+        "started_event",
+        "heartbeat_event",  # only the newest one
+        "artifact_event",
+        "completed_event",
+        "join",
+    ]
+    assert target.started_event.call_args[1] == dict(STARTED, _id=7)
+    assert target.heartbeat_event.call_args[1]["info"] == {"i": 2}
+    assert target.completed_event.call_args[1] == {"stop_time": T2, "result": 42}
+    assert artifact_contents == ["weights"]
+    assert os.listdir(wal_dir) == []
+
+
+def test_replay_skips_damaged_lines(wal_dir, tmpdir):
+    crashed_run(wal_dir, tmpdir)
+    (run_dir,) = os.listdir(wal_dir)
+    run_dir = os.path.join(wal_dir, run_dir)
+    segment = sorted(f for f in os.listdir(run_dir) if f.startswith("events-"))[-1]
+    with open(os.path.join(run_dir, segment), "a") as f:
+        f.write('{"name": "heartbeat_eve')  # torn write of a crashed process
+    events = list(read_events(run_dir))
+    assert [e.name for e in events][-1] == "completed_event"
+
+
+def test_replay_skips_logs_of_running_processes(wal_dir, tmpdir):
+    crashed_run(wal_dir, tmpdir)
+    (run_dir,) = os.listdir(wal_dir)
+    process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        with open(os.path.join(wal_dir, run_dir, "owner.json")) as f:
+            owner = json.load(f)
+        with open(os.path.join(wal_dir, run_dir, "owner.json"), "w") as f:
+            json.dump(dict(owner, pid=process.pid), f)
+        create_observer = mock.Mock()
+        assert replay_write_ahead_logs(wal_dir, create_observer) == []
+        assert not create_observer.called
+        assert os.listdir(wal_dir) == [run_dir]
+    finally:
+        process.kill()
+        process.wait()
+
+
+def test_replay_skips_logs_of_other_hosts_unless_forced(wal_dir, tmpdir):
+    crashed_run(wal_dir, tmpdir)
+    (run_dir,) = os.listdir(wal_dir)
+    owner_file = os.path.join(wal_dir, run_dir, "owner.json")
+    with open(owner_file) as f:
+        owner = json.load(f)
+    with open(owner_file, "w") as f:
+        json.dump(dict(owner, hostname="other-host"), f)
+    create_observer = mock.Mock()
+    assert replay_write_ahead_logs(wal_dir, create_observer) == []
+    assert not create_observer.called
+    assert os.listdir(wal_dir) == [run_dir]
+    assert replay_write_ahead_logs(wal_dir, create_observer, force=True) == [7]
+    assert os.listdir(wal_dir) == []
+
+
+def test_failed_replay_continues_after_sent_events(wal_dir, tmpdir):
+    crashed_run(wal_dir, tmpdir)
+    failing = mock.MagicMock()
+    failing.completed_event.side_effect = RuntimeError("unavailable")
+    with pytest.raises(RuntimeError):
+        replay_write_ahead_logs(wal_dir, mock.Mock(return_value=failing))
+    assert failing.heartbeat_event.called
+    assert failing.artifact_event.called
+
+    target = mock.MagicMock()
+    assert replay_write_ahead_logs(wal_dir, mock.Mock(return_value=target)) == [7]
+    assert [c[0] for c in target.method_calls] == [
+        "started_event",
+        "completed_event",
+        "join",
+    ]
+    assert os.listdir(wal_dir) == []
+
+
+def test_replay_command_line_into_mongo(wal_dir, tmpdir, monkeypatch):
+    pymongo = pytest.importorskip("pymongo")
+    mongomock = pytest.importorskip("mongomock")
+    import gridfs
+    from mongomock.gridfs import enable_gridfs_integration
+
+    enable_gridfs_integration()
+    client = mongomock.MongoClient()
+    fs = gridfs.GridFS(client.sacred)
+    monkeypatch.setattr(pymongo, "MongoClient", lambda *args, **kwargs: client)
+    monkeypatch.setattr(gridfs, "GridFS", lambda _: fs)
+    client.sacred.runs.insert_one(
+        {
+            "_id": 7,
+            "status": "RUNNING",
+            "info": {"i": 0},
+            "artifacts": [{"name": "old.txt", "file_id": 1}],
+        }
+    )
+
+    crashed_run(wal_dir, tmpdir)
+    main([wal_dir, "-m", "sacred"])
+
+    run = client.sacred.runs.find_one({"_id": 7})
+    assert run["status"] == "COMPLETED"
+    assert run["result"] == 42
+    assert run["info"] == {"i": 2}
+    assert [a["name"] for a in run["artifacts"]] == ["old.txt", "weights.txt"]
+    assert os.listdir(wal_dir) == []
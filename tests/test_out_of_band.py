@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import json
+import os
+
+import mock
+import pytest
+
+from sacred.out_of_band import ArtifactReference, OutOfBandStore
+from sacred.serializer import flatten, restore
+
+np = pytest.importorskip("numpy")
+
+
+@pytest.fixture
+def artifact_dir(tmpdir):
+    return str(tmpdir)
+
+
+@pytest.fixture
+def store(artifact_dir):
+    def add_artifact(filename, name, content_type):
+        with open(filename, "rb") as src:
+            with open(os.path.join(artifact_dir, name), "wb") as dst:
+                dst.write(src.read())
+
+    return OutOfBandStore(100, mock.Mock(side_effect=add_artifact))
+
+
+def test_replace_large_arrays(store):
+    big = np.arange(100.0)
+    small = np.arange(3)
+    info = {"big": big, "nested": [{"big": big}], "small": small, "x": 1}
+    replaced = store.replace(info, "info")
+    assert isinstance(replaced["big"], ArtifactReference)
+    assert replaced["big"].name == "info.big.npy"
+    assert replaced["big"].shape == [100]
+    assert replaced["big"].dtype == "float64"
+    assert isinstance(replaced["nested"][0]["big"], ArtifactReference)
+    assert replaced["small"] is small
+    assert replaced["x"] == 1
+    assert info["big"] is big  # the original is not modified
+
+
+def test_replace_without_large_values_returns_same_object(store):
+    info = {"a": [1, 2], "small": np.arange(3)}
+    assert store.replace(info, "info") is info
+    assert not store.add_artifact.called
+
+
+def test_values_are_only_saved_again_if_changed(store):
+    big = np.zeros(100)
+    first = store.replace({"big": big}, "info")["big"]
+    assert store.replace({"big": big}, "info")["big"] == first
+    assert store.add_artifact.call_count == 1
+    big[0] = 1
+    second = store.replace({"big": big}, "info")["big"]
+    assert second.name == first.name  # the artifact is overwritten
+    assert store.add_artifact.call_count == 2
+
+
+def test_restore_resolves_references(store, artifact_dir):
+    big = np.arange(100.0)
+    flat = flatten(store.replace({"big": big, "x": 1}, "info"))
+    assert "info.big.npy" in json.dumps(flat)
+    assert isinstance(restore(flat)["big"], ArtifactReference)
+    restored = restore(flat, artifact_loader=artifact_dir)
+    assert np.all(restored["big"] == big)
+    assert restored["x"] == 1
+    restored = restore(flat, lambda name: os.path.join(artifact_dir, name))
+    assert np.all(restored["big"] == big)
+
+
+def test_pandas_values(store, artifact_dir):
+    pd = pytest.importorskip("pandas")
+    df = pd.DataFrame({"a": np.arange(50), "b": np.arange(50.0)})
+    series = pd.Series(np.arange(50.0), name="s")
+    flat = flatten(store.replace({"df": df, "series": series}, "result"))
+    restored = restore(flat, artifact_loader=artifact_dir)
+    pd.testing.assert_frame_equal(restored["df"], df)
+    pd.testing.assert_series_equal(restored["series"], series)
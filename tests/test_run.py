@@ -2,12 +2,17 @@
 # coding=utf-8
 
 from datetime import datetime
+import json
 import mock
 import os
 import pytest
+import subprocess
 import tempfile
+import threading
+import time
 import sys
 
+import sacred
 from sacred.run import Run
 from sacred.config.config_summary import ConfigSummary
 from sacred.utils import (
@@ -101,6 +106,10 @@ def test_run_emits_events_if_failed(run):
 
 def test_run_started_event(run):
     observer = run.observers[0]
+    meta_infos = []
+    observer.started_event.side_effect = lambda **kwargs: meta_infos.append(
+        dict(kwargs["meta_info"])
+    )
     run()
     observer.started_event.assert_called_with(
         command="main_func",
@@ -108,9 +117,11 @@ def test_run_started_event(run):
         host_info=run.host_info,
         start_time=run.start_time,
         config=run.config,
-        meta_info={},
+        meta_info=mock.ANY,
         _id=None,
     )
+    # the observer stats are only added at the end of the run
+    assert meta_infos == [{}]
 
 
 def test_run_completed_event(run):
@@ -211,6 +222,254 @@ def test_run_exception_in_failed_event_is_caught(run):
     assert observer2.failed_event.called
 
 
+def test_run_calls_observers_concurrently(run):
+    slow_observer = run.observers[0]
+    fast_observer = mock.Mock(priority=5)
+    run.observers.append(fast_observer)
+    fast_heartbeat = threading.Event()
+    waited_for_fast = []
+
+    def slow_heartbeat(**kwargs):
+        # only returns early if the fast observer is not stuck behind this one
+        waited_for_fast.append(fast_heartbeat.wait(timeout=5))
+
+    slow_observer.heartbeat_event.side_effect = slow_heartbeat
+    fast_observer.heartbeat_event.side_effect = lambda **kwargs: fast_heartbeat.set()
+    run()
+    assert waited_for_fast == [True]
+
+
+def test_run_keeps_event_order_per_observer(run):
+    observer = run.observers[0]
+    run()
+    assert [c[0] for c in observer.method_calls] == [
+        "started_event",
+        "log_metrics",
+        "heartbeat_event",
+        "completed_event",
+        "join",
+    ]
+
+
+def test_run_waits_for_observers_with_timeout(run):
+    observer = run.observers[0]
+    observer.completed_event.side_effect = lambda **kwargs: time.sleep(1)
+    run.observer_timeout = 0.05
+    start = time.time()
+    run()
+    assert time.time() - start < 1
+    assert any(
+        "did not finish" in c[0][0] for c in run.run_logger.warning.call_args_list
+    )
+    time.sleep(1.5)
+    assert observer.join.called
+
+
+def test_stalled_observer_finishes_before_interpreter_exit(tmpdir):
+    script = tmpdir.join("script.py")
+    done = tmpdir.join("done.txt")
+    script.write(
+        "import time\n"
+        "from sacred.observer_dispatcher import ObserverDispatcher\n"
+        "def final_event():\n"
+        "    time.sleep(1)\n"
+        "    open({!r}, 'w').close()\n"
+        "dispatcher = ObserverDispatcher()\n"
+        "dispatcher.submit(object(), final_event)\n"
+        "assert dispatcher.join(timeout=0.01)\n".format(str(done))
+    )
+    sacred_dir = os.path.dirname(os.path.dirname(sacred.__file__))
+    env = dict(os.environ, PYTHONPATH=sacred_dir)
+    subprocess.run([sys.executable, str(script)], check=True, timeout=30, env=env)
+    assert done.exists()
+
+
+def _stuck_heartbeat_run(run, stuck_for):
+    """Let the first log_metrics of the heartbeat block for stuck_for seconds."""
+    observer = run.observers[0]
+    run.beat_interval = 0.01
+    in_log_metrics = threading.Event()
+    release = threading.Event()
+
+    def slow_log_metrics(**kwargs):
+        if not in_log_metrics.is_set():
+            in_log_metrics.set()
+            release.wait(timeout=5)
+
+    def main_function(*args):
+        in_log_metrics.wait(timeout=5)
+        run.info["final"] = True
+        threading.Timer(stuck_for, release.set).start()
+
+    observer.log_metrics.side_effect = slow_log_metrics
+    run.main_function.side_effect = main_function
+    # keeps the dispatcher open until the stuck heartbeat could continue
+    slow_observer = mock.Mock(priority=5)
+    slow_observer.join.side_effect = lambda: time.sleep(stuck_for)
+    run.observers.append(slow_observer)
+    run()
+    for _ in range(100):  # the observer may still be catching up
+        if observer.join.called:
+            break
+        time.sleep(0.1)
+    return list(observer.method_calls)
+
+
+def test_run_waits_for_running_heartbeat_before_final_event(run):
+    run.observer_timeout = 5
+    calls = _stuck_heartbeat_run(run, stuck_for=2.5)
+    events = [c[0] for c in calls]
+    assert events[-2:] == ["completed_event", "join"]
+    heartbeats = [c for c in calls if c[0] == "heartbeat_event"]
+    assert heartbeats[-1][2]["info"] == {"final": True}
+
+
+def test_run_sends_final_heartbeat_after_stuck_heartbeat(run):
+    run.observer_timeout = 0.5
+    calls = _stuck_heartbeat_run(run, stuck_for=2.5)
+    events = [c[0] for c in calls]
+    assert events[-2:] == ["completed_event", "join"]
+    assert "heartbeat_event" in events
+    heartbeats = [c for c in calls if c[0] == "heartbeat_event"]
+    assert heartbeats[-1][2]["info"] == {"final": True}
+
+
+def test_run_sends_heartbeat_deltas_to_observers_that_opt_in(run):
+    full_observer = run.observers[0]
+    delta_observer = mock.Mock(priority=5, delta_heartbeats=True)
+    run.observers.append(delta_observer)
+    run.info["test"] = 321
+    run()
+    assert full_observer.heartbeat_event.called
+    assert not full_observer.heartbeat_delta_event.called
+    assert not delta_observer.heartbeat_event.called
+    call_kwargs = delta_observer.heartbeat_delta_event.call_args_list[0][1]
+    assert call_kwargs["delta"].info_updates == {"test": 321}
+    assert call_kwargs["delta"].result_changed
+    assert call_kwargs["delta"].result == 123
+
+
+def test_run_sends_unchanged_heartbeats_by_default(run):
+    observer = run.observers[0]
+    run._output_file = mock.Mock(closed=True)
+    run._emit_heartbeat()
+    run._emit_heartbeat()
+    assert observer.heartbeat_event.call_count == 2
+
+
+def test_run_does_not_track_changes_without_delta_observers(run):
+    run._output_file = mock.Mock(closed=True)
+    run._heartbeat_tracker = mock.Mock()
+    run.info["a"] = 1
+    run._emit_heartbeat()
+    run.log_scalar("loss", 0.5)
+    run._emit_heartbeat()
+    assert run.observers[0].heartbeat_event.call_count == 2
+    assert not run._heartbeat_tracker.diff.called
+
+
+def test_run_skips_unchanged_heartbeats(run):
+    observer = run.observers[0]
+    run._output_file = mock.Mock(closed=True)
+    run.heartbeat_max_silence = 60
+    run._emit_heartbeat()
+    run._emit_heartbeat()
+    assert observer.heartbeat_event.call_count == 1
+    run.info["a"] = 1
+    run._emit_heartbeat()
+    assert observer.heartbeat_event.call_count == 2
+    run.log_scalar("loss", 0.5)
+    run._emit_heartbeat()
+    assert observer.heartbeat_event.call_count == 3
+    assert observer.log_metrics.call_count == 3
+
+
+def test_run_sends_unchanged_heartbeat_after_max_silence(run):
+    observer = run.observers[0]
+    run._output_file = mock.Mock(closed=True)
+    run.heartbeat_max_silence = 0.05
+    run._emit_heartbeat()
+    run._emit_heartbeat()
+    assert observer.heartbeat_event.call_count == 1
+    time.sleep(0.1)
+    run._emit_heartbeat()
+    assert observer.heartbeat_event.call_count == 2
+
+
+def test_run_backs_off_heartbeat_interval_for_slow_observers(run):
+    observer = run.observers[0]
+    run._output_file = mock.Mock(closed=True)
+    run.beat_interval = 0.2
+    run.max_beat_interval = 0.5
+    run._start_heartbeat()
+    run._stop_heartbeat_event.set()
+    run._heartbeat.join()
+    observer.heartbeat_event.side_effect = lambda **kwargs: time.sleep(0.25)
+    run.info["a"] = 1
+    run._emit_heartbeat()
+    assert run._heartbeat.interval == 0.4
+    run.info["a"] = 2
+    run._emit_heartbeat()
+    assert run._heartbeat.interval == 0.5
+    observer.heartbeat_event.side_effect = None
+    run.info["a"] = 3
+    run._emit_heartbeat()
+    assert run._heartbeat.interval == 0.25
+
+
+def test_run_keeps_heartbeat_interval_by_default(run):
+    observer = run.observers[0]
+    run._output_file = mock.Mock(closed=True)
+    run.beat_interval = 0.2
+    run._start_heartbeat()
+    run._stop_heartbeat_event.set()
+    run._heartbeat.join()
+    observer.heartbeat_event.side_effect = lambda **kwargs: time.sleep(0.25)
+    run.info["a"] = 1
+    run._emit_heartbeat()
+    assert run._heartbeat.interval == 0.2
+
+
+def test_run_records_observer_stats(run):
+    run()
+    stats = run.meta_info["observer_stats"]["Mock"]
+    assert stats["started_event"]["count"] == 1
+    assert stats["heartbeat_event"]["count"] == 1
+    assert stats["completed_event"]["count"] == 1
+    assert stats["join"]["count"] == 1
+
+
+def test_run_saves_observer_stats_with_final_event(tmpdir):
+    from sacred import Experiment
+    from sacred.observers import FileStorageObserver
+
+    ex = Experiment("stats")
+    ex.observers.append(FileStorageObserver(str(tmpdir)))
+    ex.main(lambda: 3)
+    ex.run()
+    with open(str(tmpdir.join("1", "run.json"))) as f:
+        stats = json.load(f)["meta"]["observer_stats"]
+    assert stats["FileStorageObserver"]["started_event"]["count"] == 1
+
+
+def test_run_logs_slow_observer_calls(run):
+    observer = run.observers[0]
+    observer.completed_event.side_effect = lambda **kwargs: time.sleep(0.05)
+    run.slow_observer_call = 0.01
+    run()
+    messages = [c[0][0] % c[0][1:] for c in run.run_logger.debug.call_args_list]
+    assert any("completed_event" in m and "Mock" in m for m in messages)
+
+
+def test_run_saves_observer_stats_as_artifact(run):
+    observer = run.observers[0]
+    run.save_observer_stats = True
+    run()
+    call_kwargs = observer.artifact_event.call_args[1]
+    assert call_kwargs["name"] == "observer_stats.json"
+    assert call_kwargs["content_type"] == "application/json"
+
+
 def test_unobserved_run_doesnt_emit(run):
     observer = run.observers[0]
     run.unobserved = True
@@ -264,6 +523,40 @@ def test_stdout_capturing_fd(run, capsys):
     assert run.captured_out == "0123456789"
 
 
+@pytest.mark.skipif(sys.platform.startswith("win"), reason="does not run on windows")
+def test_stdout_capturing_pipe(run, capsys):
+    def print_mock_progress():
+        for i in range(10):
+            print(i, end="")
+        sys.stdout.flush()
+
+    run.main_function.side_effect = print_mock_progress
+    run.capture_mode = "pipe"
+    with capsys.disabled():
+        run()
+    assert run.captured_out == "0123456789"
+
+
+def test_captured_out_max_size(run, capsys):
+    def print_mock_progress():
+        for i in range(10):
+            print(i)
+        sys.stdout.flush()
+
+    observer = run.observers[0]
+    run.main_function.side_effect = print_mock_progress
+    run.capture_mode = "sys"
+    run.captured_out_max_size = 10
+    with capsys.disabled():
+        run()
+    full_output = "".join("{}\n".format(i) for i in range(10))
+    assert len(run.captured_out) < len(full_output) + 40
+    assert "characters omitted" in run.captured_out
+    assert run.read_captured_out() == full_output
+    call_kwargs = observer.artifact_event.call_args[1]
+    assert call_kwargs["name"] == "captured_out.txt"
+
+
 def test_captured_out_filter(run, capsys):
     def print_mock_progress():
         sys.stdout.write("progress 0")
@@ -280,3 +573,37 @@ def test_captured_out_filter(run, capsys):
         run()
         sys.stdout.flush()
     assert run.captured_out == "progress 9"
+
+
+def test_out_of_band_values(run):
+    np = pytest.importorskip("numpy")
+    from sacred.out_of_band import ArtifactReference
+
+    observer = run.observers[0]
+    saved = {}
+
+    def save_artifact(name, filename, metadata, content_type):
+        saved[name] = np.load(filename)
+
+    observer.artifact_event.side_effect = save_artifact
+    weights = np.arange(1000.0)
+
+    def main():
+        run.info["weights"] = weights
+        run.info["small"] = np.arange(3)
+        run._emit_heartbeat()
+        run._emit_heartbeat()
+        return weights * 2
+
+    run.main_function.side_effect = main
+    run.out_of_band_min_size = 100
+    run()
+    assert len(saved) == 2
+    info = observer.heartbeat_event.call_args[1]["info"]
+    assert isinstance(info["weights"], ArtifactReference)
+    assert info["small"] is run.info["small"]
+    assert np.all(saved[info["weights"].name] == weights)
+    result = observer.completed_event.call_args[1]["result"]
+    assert isinstance(result, ArtifactReference)
+    assert np.all(saved[result.name] == weights * 2)
+    assert run.result is not result
@@ -68,3 +68,95 @@ def test_serialize_pandas_dataframes():
     b = restore(flatten(df))
     assert np.all(df == b)
     assert np.all(df.dtypes == b.dtypes)
+
+
+def _flatten_with_jsonpickle(obj):
+    import json
+    import jsonpickle
+
+    return json.loads(jsonpickle.encode(obj, keys=True))
+
+
+def test_flatten_copies_json_containers():
+    obj = {"a": [1, {"b": 2}]}
+    flat = flatten(obj)
+    assert flat == obj
+    assert flat is not obj
+    assert flat["a"] is not obj["a"]
+    assert flat["a"][1] is not obj["a"][1]
+
+
+@pytest.mark.parametrize(
+    "obj",
+    [
+        {"a": (1, 2), "b": [{3, 4}], "c": {1: "one"}},
+        {"nested": {"tuple": (1, [2, (3,)])}},
+        [b"bytes", {"key": 1.5}],
+    ],
+)
+def test_flatten_matches_jsonpickle(obj):
+    assert flatten(obj) == _flatten_with_jsonpickle(obj)
+    assert restore(flatten(obj)) == obj
+
+
+def test_flatten_keeps_shared_references():
+    shared = [1, 2]
+    t = (3, 4)
+    obj = {"a": shared, "b": shared, "c": [t, t]}
+    assert flatten(obj) == _flatten_with_jsonpickle(obj)
+    restored = restore(flatten(obj))
+    assert restored == obj
+    assert restored["a"] is restored["b"]
+
+
+def test_flatten_keeps_references_into_jsonpickle_values():
+    shared = [1, 2]
+    for obj in [{"a": {1: shared}, "b": shared}, {"a": shared, "b": {1: shared}}]:
+        assert flatten(obj) == _flatten_with_jsonpickle(obj)
+
+
+def _random_document(rng, shared, depth=0):
+    kind = rng.choice(["scalar", "list", "dict", "int_dict", "tuple", "shared"])
+    if depth > 3 or kind == "scalar":
+        return rng.choice([1, 2.5, "s", None, True])
+    if kind == "shared":
+        return rng.choice(shared)
+    children = [
+        _random_document(rng, shared, depth + 1) for _ in range(rng.randint(0, 3))
+    ]
+    if kind == "list":
+        return children
+    if kind == "tuple":
+        return tuple(children)
+    if kind == "dict":
+        return {"k{}".format(i): c for i, c in enumerate(children)}
+    return {i: c for i, c in enumerate(children)}
+
+
+def test_flatten_matches_jsonpickle_on_random_documents():
+    import random
+
+    rng = random.Random(0)
+    for _ in range(2000):
+        shared = [[1], ["x", [2]]]
+        obj = _random_document(rng, shared)
+        assert flatten(obj) == _flatten_with_jsonpickle(obj)
+
+
+def test_flatten_deeply_nested():
+    obj = current = []
+    for _ in range(120):
+        current.append([])
+        current = current[0]
+    assert flatten(obj) == _flatten_with_jsonpickle(obj)
+
+
+@pytest.mark.skipif(not opt.has_numpy, reason="requires numpy")
+def test_flatten_mixed_numpy():
+    np = opt.np
+    obj = {"plain": [1, "two"], "array": np.arange(3), "scalar": np.float64(1.5)}
+    assert flatten(obj) == _flatten_with_jsonpickle(obj)
+    restored = restore(flatten(obj))
+    assert restored["plain"] == [1, "two"]
+    assert np.all(restored["array"] == obj["array"])
+    assert restored["scalar"] == 1.5
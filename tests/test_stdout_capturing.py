@@ -3,6 +3,7 @@
 
 import os
 import sys
+import time
 import pytest
 from sacred.stdout_capturing import get_stdcapturer
 from sacred.optional import libc
@@ -57,3 +58,51 @@ def test_fd_tee_output(capsys):
         print("after (stderr)")
 
         assert set(output.strip().split("\n")) == expected_lines
+
+
+def _read_until(out, text, timeout=5):
+    # the pipes are read by background threads, so output arrives delayed
+    output = ""
+    deadline = time.time() + timeout
+    while not output.endswith(text) and time.time() < deadline:
+        output += out.get()
+        time.sleep(0.01)
+    return output
+
+
+@pytest.mark.skipif(sys.platform.startswith("win"), reason="does not run on windows")
+def test_pipe_tee_output(capsys):
+    expected_lines = {
+        "captured stdout",
+        "captured stderr",
+        "stdout from C",
+        "and this is from echo",
+        "keep\rcarriage\rreturns",
+        "äöü €",
+    }
+
+    capture_mode, capture_stdout = get_stdcapturer("pipe")
+    output = ""
+    with capsys.disabled():
+        print("before (stdout)")
+        print("before (stderr)")
+        with capture_stdout() as out:
+            # stdout and stderr are read separately and may interleave,
+            # so wait for the output of one before writing to the other
+            print("captured stderr", file=sys.stderr)
+            output += _read_until(out, "captured stderr\n")
+            print("captured stdout")
+            print("keep\rcarriage\rreturns")
+            print("äöü €")
+            sys.stdout.flush()
+            libc.puts(b"stdout from C")
+            libc.fflush(None)
+            os.system("echo and this is from echo")
+
+        output += out.get()
+        assert out.closed
+
+        print("after (stdout)")
+        print("after (stderr)")
+
+        assert set(output.strip().split("\n")) == expected_lines
@@ -17,6 +17,7 @@ from sacred.utils import (
     get_inheritors,
     convert_camel_case_to_snake_case,
     apply_backspaces_and_linefeeds,
+    BackspaceLinefeedStream,
     module_exists,
     module_is_in_cache,
     get_package_version,
@@ -173,6 +174,34 @@ def test_apply_backspaces_and_linefeeds(text, expected):
     assert apply_backspaces_and_linefeeds(text) == expected
 
 
+@pytest.mark.parametrize(
+    "text",
+    [
+        "abc\ndef\r\rg",
+        "abcd\refg\r\nxyz\b\b1\n",
+        "10%\r20%\r100%\ndone\n",
+        "[====>....] - ETA: 1s\r[=========>] - ETA: 0s\nresult\n",
+    ],
+)
+def test_backspace_linefeed_stream_matches_apply_backspaces(text):
+    for chunk_size in range(1, len(text) + 1):
+        stream = BackspaceLinefeedStream()
+        finished = ""
+        for i in range(0, len(text), chunk_size):
+            new, current_line = stream.feed(text[i : i + chunk_size])
+            finished += new
+        assert finished + current_line == apply_backspaces_and_linefeeds(text)
+
+
+def test_backspace_linefeed_stream_returns_only_new_lines():
+    stream = BackspaceLinefeedStream()
+    # the last linefeed is held back, in case a keras progress line follows
+    assert stream.feed("a\nprogress 1") == ("a", "\nprogress 1")
+    assert stream.feed("\rprogress 2\r") == ("", "\nprogress 2\r")
+    assert stream.feed("progress 3\nb") == ("\nprogress 3", "\nb")
+    assert stream.feed("\n[==>...] - ETA: 1s") == ("\nb", "")
+
+
 def test_module_exists_base_level_modules():
     assert module_exists("pytest")
     assert not module_exists("clearly_non_existing_module_name")